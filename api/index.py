@@ -5,10 +5,18 @@ Vercel Serverless Function 入口文件。
 所有 /api/* 路由都由此文件处理。
 """
 
-import json
+import asyncio
+import copy
+import hashlib
+import multiprocessing
+import os
+import sys
 import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from contextlib import asynccontextmanager
-from typing import Optional
+from functools import lru_cache
+from typing import Any, Optional, Sequence
 
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form
 from fastapi.middleware.cors import CORSMiddleware
@@ -16,9 +24,20 @@ from fastapi.responses import JSONResponse
 from loguru import logger
 from pydantic import BaseModel
 
-from services.diff_analyzer import analyze_code_changes, format_diff_summary
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from services.diff_analyzer import (
+    validate_code_changes,
+    analyze_code_changes,
+    format_diff_summary,
+)
 from services.ast_parser import parse_java_code, extract_changed_methods
 from services.coverage_analyzer import (
+    MappingEntry,
+    TestCase,
     parse_mapping_data,
     parse_test_cases,
     analyze_coverage,
@@ -27,15 +46,10 @@ from services.scoring_model import calculate_score
 from services.deepseek_client import (
     build_analysis_messages,
     call_deepseek,
+    close_client,
     calculate_cost,
 )
-from services.file_parser import (
-    parse_csv,
-    parse_excel,
-    parse_json,
-    detect_file_type,
-    validate_file,
-)
+from services.file_parser import MAX_UPLOAD_SIZE_MB, validate_and_parse
 from services.database import (
     init_db,
     create_project,
@@ -49,19 +63,65 @@ from services.database import (
     get_project_stats,
     save_global_mapping,
     get_global_mapping,
+    get_global_mapping_entries,
     list_global_mappings,
     get_latest_global_mapping,
     delete_global_mapping,
 )
 
 
+# 设置 UVLOOP_ENABLED 时改用uvloop事件循环（需自行安装uvloop；Vercel等Serverless环境无需开启）
+if os.environ.get("UVLOOP_ENABLED"):
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        logger.warning("已设置UVLOOP_ENABLED但uvloop未安装，使用默认事件循环")
+
+# AST/diff进程池：只在文件较多时使用（见 PARALLEL_AST_MIN_FILES），文件少时在线程中解析，
+# 避免进程间序列化开销并复用本进程的解析缓存。未经 lifespan 启动时为 None，全部在线程中执行。
+_ast_pool: Optional[ProcessPoolExecutor] = None
+
+# 待解析的代码对数达到该值时才分发到进程池
+PARALLEL_AST_MIN_FILES = 4
+
+
+def _process_pool_context() -> multiprocessing.context.BaseContext:
+    """
+    进程池的启动方式。
+
+    lifespan 启动时已有日志队列等线程，fork 会复制持有锁的线程状态，不安全；
+    优先使用 forkserver，不支持时（如Windows）使用 spawn。
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
 @asynccontextmanager
 async def lifespan(app_instance: FastAPI):
     """应用生命周期管理"""
+    global _ast_pool
     # Startup
+    # 日志经队列由后台线程写出，避免并发请求争用sink锁；关闭diagnose以免异常时展开局部变量
+    logger.remove()
+    logger.add(sys.stderr, level="INFO", enqueue=True, backtrace=False, diagnose=False)
     init_db()
+    _ast_pool = ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=_process_pool_context())
     yield
-    # Shutdown (cleanup if needed)
+    # Shutdown
+    _ast_pool.shutdown(cancel_futures=True)
+    _ast_pool = None
+    await close_client()
+    await logger.complete()
+
+
+class FastJSONResponse(JSONResponse):
+    """使用orjson序列化的JSON响应，直接输出UTF-8字节；orjson未安装时退回标准库"""
+
+    def render(self, content) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
 
 
 app = FastAPI(
@@ -69,8 +129,41 @@ app = FastAPI(
     description="代码改动分析与测试用例覆盖检查系统",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
 
+# 单个请求体上限：一次分析最多上传3个文件，另留1MB给multipart开销
+MAX_REQUEST_BODY_BYTES = int((3 * MAX_UPLOAD_SIZE_MB + 1) * 1024 * 1024)
+
+
+class BodySizeLimitMiddleware:
+    """
+    按 Content-Length 拒绝过大的请求，在读取请求体之前返回413。
+
+    未带 Content-Length 的请求（分块传输）照常处理，由 validate_file 按文件大小校验。
+    """
+
+    def __init__(self, app_instance, max_bytes: int):
+        self.app = app_instance
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            for name, value in scope["headers"]:
+                if name == b"content-length":
+                    if value.isdigit() and int(value) > self.max_bytes:
+                        response = FastJSONResponse(
+                            status_code=413,
+                            content={"detail": f"请求体过大，最大允许 {self.max_bytes // (1024 * 1024)}MB"},
+                        )
+                        await response(scope, receive, send)
+                        return
+                    break
+        await self.app(scope, receive, send)
+
+
+# CORS 在外层，413 响应同样带跨域头
+app.add_middleware(BodySizeLimitMiddleware, max_bytes=MAX_REQUEST_BODY_BYTES)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -127,154 +220,34 @@ async def analyze(
     start_time = time.time()
 
     try:
-        # ---- 1. 读取和校验文件 ----
-        code_content = await code_changes.read()
-        test_content = await test_cases_file.read()
-
-        # 校验文件
-        err = validate_file(code_changes.filename or "", code_content, ["json"])
-        if err:
-            raise HTTPException(status_code=400, detail=err)
+        # ---- 1. 校验并解析文件 ----
+        code_data, test_rows = _parse_analysis_uploads(code_changes, test_cases_file)
 
-        err = validate_file(test_cases_file.filename or "", test_content, ["csv", "excel"])
-        if err:
-            raise HTTPException(status_code=400, detail=err)
-
-        # ---- 2. 解析文件 ----
-        # 代码改动
-        code_data = parse_json(code_content)
-        diff_result = analyze_code_changes(json.dumps(code_data))
-
-        if diff_result.error:
-            raise HTTPException(status_code=400, detail=f"代码改动分析失败: {diff_result.error}")
-
-        # 映射关系：优先用上传的文件，否则用全局映射
+        # ---- 2. 映射关系：优先用上传的文件，否则用全局映射 ----
+        uploads = [code_changes, test_cases_file]
+        mapping_version = ""
         if mapping_file is not None:
-            mapping_content = await mapping_file.read()
-            err = validate_file(mapping_file.filename or "", mapping_content, ["csv"])
-            if err:
-                raise HTTPException(status_code=400, detail=err)
-            mapping_rows = parse_csv(mapping_content)
-            mapping_entries = parse_mapping_data(mapping_rows)
+            mapping_entries = _parse_uploaded_mapping(mapping_file)
+            uploads.append(mapping_file)
         else:
             # 使用全局映射
-            latest_mapping = get_latest_global_mapping()
-            if latest_mapping is None or not latest_mapping.get("mapping_data"):
-                raise HTTPException(status_code=400, detail="未上传映射文件且未配置全局映射，请先在『映射管理』中上传映射文件")
-            from services.coverage_analyzer import MappingEntry
-            mapping_entries = [
-                MappingEntry(
-                    package_name=m["package_name"],
-                    class_name=m["class_name"],
-                    method_name=m["method_name"],
-                    description=m["description"],
+            latest_mapping = get_latest_global_mapping(include_data=False)
+            mapping_entries = ()
+            if latest_mapping is not None:
+                mapping_entries = _load_global_mapping_entries(
+                    latest_mapping["id"], latest_mapping["created_at"]
                 )
-                for m in latest_mapping["mapping_data"]
-            ]
-
-        # 测试用例
-        test_file_type = detect_file_type(test_cases_file.filename or "")
-        if test_file_type == "csv":
-            test_rows = parse_csv(test_content)
-        elif test_file_type == "excel":
-            test_rows = parse_excel(test_content)
-        else:
-            raise HTTPException(status_code=400, detail="测试用例文件格式不支持")
-
-        test_case_list = parse_test_cases(test_rows)
-
-        # ---- 3. AST分析提取变更方法 ----
-        changed_methods = []
-        code_json = parse_code_changes_data(code_data)
-        for i in range(len(code_json.get("current", []))):
-            current = code_json["current"][i] if i < len(code_json["current"]) else ""
-            history = code_json["history"][i] if i < len(code_json["history"]) else ""
-            methods = extract_changed_methods(current, history)
-            for m in methods:
-                changed_methods.append({
-                    "package_name": m.package_name,
-                    "class_name": m.class_name,
-                    "method_name": m.method_name,
-                })
-
-        # ---- 4. 覆盖分析 ----
-        coverage_result = analyze_coverage(changed_methods, mapping_entries, test_case_list)
-
-        # ---- 5. 评分 ----
-        score_result = calculate_score(
-            total_changed_methods=coverage_result.total_changed_methods,
-            covered_count=len(coverage_result.covered_methods),
-            test_cases=test_rows,
-        )
-
-        # ---- 6. AI分析（可选）----
-        ai_result = None
-        ai_cost = None
-        if use_ai:
-            diff_summary = format_diff_summary(diff_result)
-            mapping_text = "\n".join(
-                f"{e.package_name}.{e.class_name}.{e.method_name} -> {e.description}"
-                for e in mapping_entries
-            )
-            test_text = "\n".join(
-                f"{tc.test_id}: {tc.test_function} | {tc.test_steps} | {tc.expected_result}"
-                for tc in test_case_list
-            )
+                mapping_version = f"global:{latest_mapping['id']}:{latest_mapping['created_at']}"
+            if not mapping_entries:
+                raise HTTPException(status_code=400, detail="未上传映射文件且未配置全局映射，请先在『映射管理』中上传映射文件")
 
-            messages = build_analysis_messages(diff_summary, mapping_text, test_text)
-            ai_response = await call_deepseek(messages)
-
-            if "error" in ai_response:
-                ai_result = {"error": ai_response["error"]}
-            else:
-                ai_result = ai_response["result"]
-                ai_cost = calculate_cost(ai_response["usage"])
-
-        # ---- 组装返回结果 ----
-        duration_ms = int((time.time() - start_time) * 1000)
-
-        result = {
-            "diff_analysis": {
-                "total_files": len(diff_result.diffs),
-                "total_added": diff_result.total_added,
-                "total_removed": diff_result.total_removed,
-                "files": [
-                    {
-                        "package": d.package_path,
-                        "added": len(d.added_lines),
-                        "removed": len(d.removed_lines),
-                    }
-                    for d in diff_result.diffs
-                ],
-            },
-            "coverage": {
-                "total_changed_methods": coverage_result.total_changed_methods,
-                "covered": coverage_result.covered_methods,
-                "uncovered": coverage_result.uncovered_methods,
-                "coverage_rate": coverage_result.coverage_rate,
-                "details": coverage_result.coverage_details,
-            },
-            "score": {
-                "total_score": score_result.total_score,
-                "grade": score_result.grade,
-                "summary": score_result.summary,
-                "dimensions": [
-                    {
-                        "dimension": d.dimension,
-                        "score": d.score,
-                        "weight": d.weight,
-                        "weighted_score": d.weighted_score,
-                        "details": d.details,
-                    }
-                    for d in score_result.dimensions
-                ],
-            },
-            "ai_analysis": ai_result,
-            "ai_cost": ai_cost,
-            "duration_ms": duration_ms,
-        }
+        # ---- 3. 分析 ----
+        result, _, _, _ = await _run_analysis(
+            code_data, test_rows, mapping_entries, use_ai, start_time,
+            cache_key=await asyncio.to_thread(_analysis_cache_key, uploads, mapping_version),
+        )
 
-        return AnalyzeResponse(success=True, data=result, duration_ms=duration_ms)
+        return AnalyzeResponse(success=True, data=result, duration_ms=result["duration_ms"])
 
     except HTTPException:
         raise
@@ -285,40 +258,405 @@ async def analyze(
         raise HTTPException(status_code=500, detail=f"服务器内部错误: {str(e)}")
 
 
-def parse_code_changes_data(data: dict) -> dict:
-    """从JSON数据中提取current/history"""
-    if "data" in data:
-        return data["data"]
-    if "current" in data and "history" in data:
-        return data
-    return {"current": [], "history": []}
+def _parse_analysis_uploads(
+    code_changes: UploadFile,
+    test_cases_file: UploadFile,
+) -> tuple[Any, list[dict]]:
+    """
+    校验并解析代码改动文件和测试用例文件。
+
+    Returns:
+        (代码改动JSON数据（parse_json 的返回值，根元素类型由 _run_analysis 校验）, 测试用例行)
+
+    Raises:
+        HTTPException: 文件类型、大小或内容不符合要求
+    """
+    try:
+        _, code_data = validate_and_parse(code_changes.filename or "", code_changes.file, ["json"])
+        _, test_rows = validate_and_parse(
+            test_cases_file.filename or "", test_cases_file.file, ["csv", "excel"]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return code_data, test_rows
+
+
+def _parse_uploaded_mapping(mapping_file: UploadFile) -> list[MappingEntry]:
+    """
+    校验并解析上传的映射关系CSV文件。
+
+    Raises:
+        HTTPException: 文件类型、大小或内容不符合要求
+    """
+    try:
+        _, mapping_rows = validate_and_parse(mapping_file.filename or "", mapping_file.file, ["csv"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return parse_mapping_data(mapping_rows)
+
+
+async def _run_analysis(
+    code_data: Any,
+    test_rows: list[dict],
+    mapping_entries: Sequence[MappingEntry],
+    use_ai: bool,
+    start_time: float,
+    cache_key: Optional[str] = None,
+):
+    """
+    对已解析的上传内容执行差异、覆盖、评分和AI分析。
+
+    Args:
+        code_data: 代码改动JSON数据，根元素不是对象时返回400
+        test_rows: 测试用例行
+        mapping_entries: 映射关系条目
+        use_ai: 是否使用AI分析
+        start_time: 请求开始时间，用于计算耗时
+        cache_key: 本地分析结果的缓存键，为None时不使用缓存
+
+    Returns:
+        (result, score_result, ai_cost, token_usage)
+
+    Raises:
+        HTTPException: 代码改动数据无效
+    """
+    test_case_list = parse_test_cases(test_rows)
+
+    # 相同上传内容直接复用本地分析结果，跳过diff、AST提取、覆盖分析和评分
+    cached = _get_cached_analysis(cache_key)
+    if cached is not None:
+        local_result, score_result, diff_summary = cached
+        ai_task = start_ai_analysis(diff_summary, mapping_entries, test_case_list) if use_ai else None
+    else:
+        # ---- 差异分析 ----
+        try:
+            # code_data 已由 parse_json 解析，只做类型与字段校验，不再按JSON文本解析
+            code_json = validate_code_changes(code_data)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"代码改动分析失败: {e}")
+        # diff为CPU密集计算，文件多时还会等待进程池结果，放到线程中执行以免阻塞事件循环
+        diff_result = await asyncio.to_thread(analyze_code_changes, code_json, executor=_ast_pool)
+        diff_summary = format_diff_summary(diff_result)
+
+        # AI分析只依赖diff、映射和测试用例，输入就绪后立即发起，与本地分析并行
+        ai_task = start_ai_analysis(diff_summary, mapping_entries, test_case_list) if use_ai else None
+        try:
+            # ---- AST分析提取变更方法 ----
+            changed_methods = await extract_all_changed_methods(code_json)
+
+            # ---- 覆盖分析 + 评分 ----
+            coverage_result, score_result = coverage_and_score(
+                changed_methods, mapping_entries, test_case_list, test_rows
+            )
+        except BaseException:
+            if ai_task is not None:
+                ai_task.cancel()
+            raise
+
+        local_result = _build_local_result(diff_result, coverage_result, score_result)
+        _put_cached_analysis(cache_key, (local_result, score_result, diff_summary))
+
+    # ---- AI分析（可选）----
+    ai_result, ai_cost, token_usage = await collect_ai_analysis(ai_task)
+
+    # ---- 组装返回结果 ----
+    duration_ms = int((time.time() - start_time) * 1000)
+
+    result = {
+        **local_result,
+        "ai_analysis": ai_result,
+        "ai_cost": ai_cost,
+        "duration_ms": duration_ms,
+    }
+
+    return result, score_result, ai_cost, token_usage
+
+
+def _build_local_result(diff_result, coverage_result, score_result) -> dict:
+    """组装差异、覆盖和评分部分的返回结果"""
+    return {
+        "diff_analysis": {
+            "total_files": len(diff_result.diffs),
+            "total_added": diff_result.total_added,
+            "total_removed": diff_result.total_removed,
+            "files": [
+                {
+                    "package": d.package_path,
+                    "added": len(d.added_lines),
+                    "removed": len(d.removed_lines),
+                }
+                for d in diff_result.diffs
+            ],
+        },
+        "coverage": {
+            "total_changed_methods": coverage_result.total_changed_methods,
+            "covered": coverage_result.covered_methods,
+            "uncovered": coverage_result.uncovered_methods,
+            "coverage_rate": coverage_result.coverage_rate,
+            "details": coverage_result.coverage_details,
+        },
+        "score": {
+            "total_score": score_result.total_score,
+            "grade": score_result.grade,
+            "summary": score_result.summary,
+            "dimensions": [
+                {
+                    "dimension": d.dimension,
+                    "score": d.score,
+                    "weight": d.weight,
+                    "weighted_score": d.weighted_score,
+                    "details": d.details,
+                }
+                for d in score_result.dimensions
+            ],
+        },
+    }
+
+
+def _to_mapping_entries(mapping_data: list[dict]) -> tuple[MappingEntry, ...]:
+    """将存储的映射字典列表构建为 MappingEntry 元组"""
+    return tuple(
+        MappingEntry(
+            package_name=m["package_name"],
+            class_name=m["class_name"],
+            method_name=m["method_name"],
+            description=m["description"],
+        )
+        for m in mapping_data
+    )
+
+
+@lru_cache(maxsize=16)
+def _load_global_mapping_entries(mapping_id: int, version: str) -> tuple[MappingEntry, ...]:
+    """加载全局映射条目，按 (映射ID, 创建时间) 缓存，避免每次分析重复反序列化"""
+    return _to_mapping_entries(get_global_mapping_entries(mapping_id) or [])
+
+
+@lru_cache(maxsize=16)
+def _load_project_mapping_entries(project_id: int, version: str) -> tuple[MappingEntry, ...]:
+    """加载项目映射条目，按 (项目ID, 更新时间) 缓存"""
+    project = get_project(project_id)
+    if project is None or not project.get("mapping_data"):
+        return ()
+    return _to_mapping_entries(project["mapping_data"])
+
+
+def clear_mapping_cache() -> None:
+    """映射数据变更后清空映射条目缓存及分析结果缓存（时间戳精度为秒，不能单靠版本号区分）"""
+    _load_global_mapping_entries.cache_clear()
+    _load_project_mapping_entries.cache_clear()
+    _analysis_cache.clear()
+
+
+# 本地分析结果缓存：按上传文件原始字节的哈希寻址，内容不变结果不变；
+# 使用存储映射时键中含映射版本，映射变更时由 clear_mapping_cache 一并清空
+_ANALYSIS_CACHE_SIZE = 64
+_analysis_cache: OrderedDict[str, tuple] = OrderedDict()
+
+
+def _analysis_cache_key(uploads: Sequence[UploadFile], mapping_version: str = "") -> str:
+    """
+    计算分析缓存键。
+
+    直接哈希上传文件的原始字节，不必再序列化解析出的变更方法、映射和测试用例行。
+    需读取全部上传内容，由调用方放到线程中执行。
+
+    Args:
+        uploads: 参与分析的上传文件（已解析，读取后复位到开头）
+        mapping_version: 使用存储映射时的映射标识与版本，上传映射文件时为空
+
+    Returns:
+        十六进制哈希字符串
+    """
+    digest = hashlib.blake2b(mapping_version.encode("utf-8"), digest_size=16)
+    for upload in uploads:
+        f = upload.file
+        f.seek(0)
+        size = 0
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+            size += len(chunk)
+        f.seek(0)
+        # 写入长度分隔各文件，内容在文件间移动时键也不同
+        digest.update(size.to_bytes(8, "little"))
+    return digest.hexdigest()
+
+
+def _get_cached_analysis(cache_key: Optional[str]) -> Optional[tuple]:
+    """
+    按缓存键取本地分析结果。
+
+    Returns:
+        (本地结果字典, ScoreResult, diff摘要文本) 的副本，调用方修改不影响缓存；未命中返回None
+    """
+    if cache_key is None:
+        return None
+    cached = _analysis_cache.get(cache_key)
+    if cached is None:
+        return None
+    _analysis_cache.move_to_end(cache_key)
+    return copy.deepcopy(cached)
+
+
+def _put_cached_analysis(cache_key: Optional[str], entry: tuple) -> None:
+    """保存本地分析结果的副本，超出容量时淘汰最久未用的条目"""
+    if cache_key is None:
+        return
+    _analysis_cache[cache_key] = copy.deepcopy(entry)
+    if len(_analysis_cache) > _ANALYSIS_CACHE_SIZE:
+        _analysis_cache.popitem(last=False)
+
+
+def coverage_and_score(
+    changed_methods: list[dict],
+    mapping_entries: Sequence[MappingEntry],
+    test_case_list: list[TestCase],
+    test_rows: list[dict],
+) -> tuple:
+    """
+    执行覆盖分析和评分。
+
+    Args:
+        changed_methods: 变更方法列表
+        mapping_entries: 映射关系条目
+        test_case_list: 测试用例列表（由 test_rows 解析）
+        test_rows: 测试用例原始行
+
+    Returns:
+        (CoverageResult, ScoreResult)
+    """
+    coverage_result = analyze_coverage(changed_methods, mapping_entries, test_case_list)
+    score_result = calculate_score(
+        total_changed_methods=coverage_result.total_changed_methods,
+        covered_count=len(coverage_result.covered_methods),
+        test_cases=test_rows,
+    )
+    return coverage_result, score_result
+
+
+def _fmt_mapping(e: MappingEntry) -> str:
+    """格式化一条映射关系，供AI提示词使用"""
+    return e.package_name + "." + e.class_name + "." + e.method_name + " -> " + e.description
+
+
+def _fmt_test_case(tc: TestCase) -> str:
+    """格式化一条测试用例，供AI提示词使用"""
+    return tc.test_id + ": " + tc.test_function + " | " + tc.test_steps + " | " + tc.expected_result
+
+
+def start_ai_analysis(
+    diff_summary: str,
+    mapping_entries: Sequence[MappingEntry],
+    test_case_list: list,
+) -> asyncio.Task:
+    """
+    构建AI分析请求并在后台发起调用。
+
+    Args:
+        diff_summary: format_diff_summary 生成的差异摘要
+        mapping_entries: 映射关系条目
+        test_case_list: 测试用例列表
+
+    Returns:
+        DeepSeek调用任务，由 collect_ai_analysis 获取结果
+    """
+    mapping_text = "\n".join(map(_fmt_mapping, mapping_entries))
+    test_text = "\n".join(map(_fmt_test_case, test_case_list))
+
+    messages = build_analysis_messages(diff_summary, mapping_text, test_text)
+    return asyncio.create_task(call_deepseek(messages))
+
+
+async def collect_ai_analysis(
+    ai_task: Optional[asyncio.Task],
+) -> tuple[Optional[dict], Optional[dict], int]:
+    """
+    等待AI分析任务完成并整理结果。
+
+    Args:
+        ai_task: start_ai_analysis 返回的任务，未启用AI时为None
+
+    Returns:
+        (ai_result, ai_cost, token_usage)
+    """
+    if ai_task is None:
+        return None, None, 0
+
+    try:
+        ai_response = await ai_task
+    except Exception as e:
+        logger.error(f"AI分析失败: {e}")
+        ai_response = {"error": f"调用异常: {str(e)}"}
+
+    if "error" in ai_response:
+        return {"error": ai_response["error"]}, None, 0
+
+    usage = ai_response["usage"]
+    return ai_response["result"], calculate_cost(usage), usage.get("total_tokens", 0)
+
+
+def _extract_methods_for_pairs(pairs: list[tuple[str, str]]) -> list:
+    """依次提取多个代码对的变更方法"""
+    return [extract_changed_methods(current, history) for current, history in pairs]
+
+
+async def extract_all_changed_methods(code_json: dict) -> list[dict]:
+    """
+    并行提取所有文件的变更方法。
+
+    代码对不少于 PARALLEL_AST_MIN_FILES 且进程池可用时在进程池中并行解析，
+    否则在一个线程中依次解析（不阻塞事件循环，并复用本进程的解析缓存）。
+    结果按文件顺序合并；重复的代码对只解析一次，内容未变的文件不解析。
+
+    Args:
+        code_json: 包含 current/history 列表的字典
+
+    Returns:
+        变更方法字典列表，每个元素包含 package_name, class_name, method_name
+    """
+    current_list = code_json.get("current", [])
+    history_list = code_json.get("history", [])
+    pairs = [
+        (current, history_list[i] if i < len(history_list) else "")
+        for i, current in enumerate(current_list)
+    ]
+
+    unique_pairs = [pair for pair in dict.fromkeys(pairs) if pair[0] != pair[1]]
+
+    if _ast_pool is not None and len(unique_pairs) >= PARALLEL_AST_MIN_FILES:
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*(
+            loop.run_in_executor(_ast_pool, extract_changed_methods, current, history)
+            for current, history in unique_pairs
+        ))
+    else:
+        results = await asyncio.to_thread(_extract_methods_for_pairs, unique_pairs)
+    methods_by_pair = dict(zip(unique_pairs, results))
+
+    return [
+        {
+            "package_name": m.package_name,
+            "class_name": m.class_name,
+            "method_name": m.method_name,
+        }
+        for pair in pairs
+        for m in methods_by_pair.get(pair, ())
+    ]
 
 
 @app.post("/api/upload/validate")
 async def validate_upload(file: UploadFile = File(...)):
     """仅校验文件格式，不做分析"""
-    content = await file.read()
-    err = validate_file(
-        file.filename or "",
-        content,
-        ["csv", "excel", "json"],
-    )
-    if err:
-        return JSONResponse(status_code=400, content={"valid": False, "error": err})
-
-    file_type = detect_file_type(file.filename or "")
-    row_count = 0
     try:
-        if file_type == "csv":
-            rows = parse_csv(content)
-            row_count = len(rows)
-        elif file_type == "excel":
-            rows = parse_excel(content)
-            row_count = len(rows)
-        elif file_type == "json":
-            parse_json(content)
+        file_type, parsed = validate_and_parse(
+            file.filename or "",
+            file.file,
+            ["csv", "excel", "json"],
+        )
     except (ValueError, ImportError) as e:
-        return JSONResponse(status_code=400, content={"valid": False, "error": str(e)})
+        return FastJSONResponse(status_code=400, content={"valid": False, "error": str(e)})
+
+    row_count = len(parsed) if file_type in ("csv", "excel") else 0
 
     return {"valid": True, "file_type": file_type, "row_count": row_count}
 
@@ -328,14 +666,15 @@ async def validate_upload(file: UploadFile = File(...)):
 @app.get("/api/projects")
 async def api_list_projects():
     """列出所有项目"""
-    projects = list_projects()
+    # 前端根据 mapping_data 判断项目是否已绑定映射
+    projects = list_projects(include_mapping=True)
     return {"success": True, "data": projects}
 
 
 @app.post("/api/projects")
 async def api_create_project(body: ProjectCreate):
     """创建新项目"""
-    project = create_project(name=body.name, description=body.description)
+    project = await asyncio.to_thread(create_project, name=body.name, description=body.description)
     return {"success": True, "data": project}
 
 
@@ -352,7 +691,8 @@ async def api_get_project(project_id: int):
 @app.put("/api/projects/{project_id}")
 async def api_update_project(project_id: int, body: ProjectUpdate):
     """更新项目信息"""
-    project = update_project(
+    project = await asyncio.to_thread(
+        update_project,
         project_id=project_id,
         name=body.name,
         description=body.description,
@@ -365,9 +705,10 @@ async def api_update_project(project_id: int, body: ProjectUpdate):
 @app.delete("/api/projects/{project_id}")
 async def api_delete_project(project_id: int):
     """删除项目"""
-    deleted = delete_project(project_id)
+    deleted = await asyncio.to_thread(delete_project, project_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="项目不存在")
+    clear_mapping_cache()
     return {"success": True, "message": "项目已删除"}
 
 
@@ -381,13 +722,7 @@ async def api_upload_project_mapping(
     if project is None:
         raise HTTPException(status_code=404, detail="项目不存在")
 
-    content = await mapping_file.read()
-    err = validate_file(mapping_file.filename or "", content, ["csv"])
-    if err:
-        raise HTTPException(status_code=400, detail=err)
-
-    mapping_rows = parse_csv(content)
-    mapping_entries = parse_mapping_data(mapping_rows)
+    mapping_entries = _parse_uploaded_mapping(mapping_file)
 
     # 将映射数据序列化存储
     mapping_data = [
@@ -400,7 +735,8 @@ async def api_upload_project_mapping(
         for e in mapping_entries
     ]
 
-    updated = update_project(project_id=project_id, mapping_data=mapping_data)
+    updated = await asyncio.to_thread(update_project, project_id=project_id, mapping_data=mapping_data)
+    clear_mapping_cache()
     return {"success": True, "data": updated, "mapping_count": len(mapping_data)}
 
 
@@ -439,164 +775,44 @@ async def api_analyze_with_project(
     """基于项目上下文的分析，结果自动保存到分析记录"""
     start_time = time.time()
 
-    # 检查项目是否存在
-    project = get_project(project_id)
+    # 检查项目是否存在；映射条目由 _load_project_mapping_entries 按版本缓存，这里不解析 mapping_data
+    project = get_project(project_id, include_mapping=False)
     if project is None:
         raise HTTPException(status_code=404, detail="项目不存在")
 
     try:
-        # ---- 1. 读取和校验文件 ----
-        code_content = await code_changes.read()
-        test_content = await test_cases_file.read()
-
-        err = validate_file(code_changes.filename or "", code_content, ["json"])
-        if err:
-            raise HTTPException(status_code=400, detail=err)
-
-        err = validate_file(test_cases_file.filename or "", test_content, ["csv", "excel"])
-        if err:
-            raise HTTPException(status_code=400, detail=err)
+        # ---- 1. 校验并解析文件 ----
+        code_data, test_rows = _parse_analysis_uploads(code_changes, test_cases_file)
 
         # ---- 2. 解析映射数据 ----
+        uploads = [code_changes, test_cases_file]
+        mapping_version = ""
         if mapping_file is not None:
-            mapping_content = await mapping_file.read()
-            err = validate_file(mapping_file.filename or "", mapping_content, ["csv"])
-            if err:
-                raise HTTPException(status_code=400, detail=err)
-            mapping_rows = parse_csv(mapping_content)
-            mapping_entries = parse_mapping_data(mapping_rows)
-        elif project.get("mapping_data"):
+            mapping_entries = _parse_uploaded_mapping(mapping_file)
+            uploads.append(mapping_file)
+        elif project["has_mapping"]:
             # 使用项目存储的映射数据
-            from services.coverage_analyzer import MappingEntry
-            mapping_entries = [
-                MappingEntry(
-                    package_name=m["package_name"],
-                    class_name=m["class_name"],
-                    method_name=m["method_name"],
-                    description=m["description"],
-                )
-                for m in project["mapping_data"]
-            ]
+            mapping_entries = _load_project_mapping_entries(project_id, project["updated_at"])
+            mapping_version = f"project:{project_id}:{project['updated_at']}"
         else:
             raise HTTPException(status_code=400, detail="未提供映射文件且项目未绑定映射数据")
 
-        # ---- 3. 解析代码改动和测试用例 ----
-        code_data = parse_json(code_content)
-        diff_result = analyze_code_changes(json.dumps(code_data))
-
-        if diff_result.error:
-            raise HTTPException(status_code=400, detail=f"代码改动分析失败: {diff_result.error}")
-
-        test_file_type = detect_file_type(test_cases_file.filename or "")
-        if test_file_type == "csv":
-            test_rows = parse_csv(test_content)
-        elif test_file_type == "excel":
-            test_rows = parse_excel(test_content)
-        else:
-            raise HTTPException(status_code=400, detail="测试用例文件格式不支持")
-
-        test_case_list = parse_test_cases(test_rows)
-
-        # ---- 4. AST分析提取变更方法 ----
-        changed_methods = []
-        code_json = parse_code_changes_data(code_data)
-        for i in range(len(code_json.get("current", []))):
-            current = code_json["current"][i] if i < len(code_json["current"]) else ""
-            history = code_json["history"][i] if i < len(code_json["history"]) else ""
-            methods = extract_changed_methods(current, history)
-            for m in methods:
-                changed_methods.append({
-                    "package_name": m.package_name,
-                    "class_name": m.class_name,
-                    "method_name": m.method_name,
-                })
-
-        # ---- 5. 覆盖分析 ----
-        coverage_result = analyze_coverage(changed_methods, mapping_entries, test_case_list)
-
-        # ---- 6. 评分 ----
-        score_result = calculate_score(
-            total_changed_methods=coverage_result.total_changed_methods,
-            covered_count=len(coverage_result.covered_methods),
-            test_cases=test_rows,
+        # ---- 3. 分析 ----
+        result, score_result, ai_cost, token_usage = await _run_analysis(
+            code_data, test_rows, mapping_entries, use_ai, start_time,
+            cache_key=await asyncio.to_thread(_analysis_cache_key, uploads, mapping_version),
         )
-
-        # ---- 7. AI分析（可选）----
-        ai_result = None
-        ai_cost = None
-        token_usage = 0
-        if use_ai:
-            diff_summary = format_diff_summary(diff_result)
-            mapping_text = "\n".join(
-                f"{e.package_name}.{e.class_name}.{e.method_name} -> {e.description}"
-                for e in mapping_entries
-            )
-            test_text = "\n".join(
-                f"{tc.test_id}: {tc.test_function} | {tc.test_steps} | {tc.expected_result}"
-                for tc in test_case_list
-            )
-
-            messages = build_analysis_messages(diff_summary, mapping_text, test_text)
-            ai_response = await call_deepseek(messages)
-
-            if "error" in ai_response:
-                ai_result = {"error": ai_response["error"]}
-            else:
-                ai_result = ai_response["result"]
-                ai_cost = calculate_cost(ai_response["usage"])
-                token_usage = ai_response["usage"].get("total_tokens", 0)
-
-        # ---- 组装结果 ----
-        duration_ms = int((time.time() - start_time) * 1000)
-
-        result = {
-            "diff_analysis": {
-                "total_files": len(diff_result.diffs),
-                "total_added": diff_result.total_added,
-                "total_removed": diff_result.total_removed,
-                "files": [
-                    {
-                        "package": d.package_path,
-                        "added": len(d.added_lines),
-                        "removed": len(d.removed_lines),
-                    }
-                    for d in diff_result.diffs
-                ],
-            },
-            "coverage": {
-                "total_changed_methods": coverage_result.total_changed_methods,
-                "covered": coverage_result.covered_methods,
-                "uncovered": coverage_result.uncovered_methods,
-                "coverage_rate": coverage_result.coverage_rate,
-                "details": coverage_result.coverage_details,
-            },
-            "score": {
-                "total_score": score_result.total_score,
-                "grade": score_result.grade,
-                "summary": score_result.summary,
-                "dimensions": [
-                    {
-                        "dimension": d.dimension,
-                        "score": d.score,
-                        "weight": d.weight,
-                        "weighted_score": d.weighted_score,
-                        "details": d.details,
-                    }
-                    for d in score_result.dimensions
-                ],
-            },
-            "ai_analysis": ai_result,
-            "ai_cost": ai_cost,
-            "duration_ms": duration_ms,
-        }
+        duration_ms = result["duration_ms"]
 
         # ---- 保存分析记录 ----
-        record = save_analysis_record(
+        # SQLite写入会阻塞，放到线程中执行以免占用事件循环
+        record = await asyncio.to_thread(
+            save_analysis_record,
             project_id=project_id,
             code_changes_summary=result["diff_analysis"],
             test_coverage_result=result["coverage"],
             test_score=score_result.total_score,
-            ai_suggestions=ai_result,
+            ai_suggestions=result["ai_analysis"],
             token_usage=token_usage,
             cost=ai_cost["total_cost"] if ai_cost else 0.0,
             duration_ms=duration_ms,
@@ -649,13 +865,7 @@ async def api_upload_mapping(
     mapping_file: UploadFile = File(..., description="映射关系CSV文件"),
 ):
     """上传全局映射文件"""
-    content = await mapping_file.read()
-    err = validate_file(mapping_file.filename or "", content, ["csv"])
-    if err:
-        raise HTTPException(status_code=400, detail=err)
-
-    mapping_rows = parse_csv(content)
-    mapping_entries = parse_mapping_data(mapping_rows)
+    mapping_entries = _parse_uploaded_mapping(mapping_file)
 
     mapping_data = [
         {
@@ -667,18 +877,21 @@ async def api_upload_mapping(
         for e in mapping_entries
     ]
 
-    record = save_global_mapping(
+    record = await asyncio.to_thread(
+        save_global_mapping,
         name=mapping_file.filename or "未命名",
         mapping_data=mapping_data,
         row_count=len(mapping_data),
     )
+    clear_mapping_cache()
     return {"success": True, "data": record}
 
 
 @app.delete("/api/mapping/{mapping_id}")
 async def api_delete_mapping(mapping_id: int):
     """删除全局映射"""
-    deleted = delete_global_mapping(mapping_id)
+    deleted = await asyncio.to_thread(delete_global_mapping, mapping_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="映射不存在")
+    clear_mapping_cache()
     return {"success": True, "message": "映射已删除"}
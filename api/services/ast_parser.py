@@ -5,7 +5,8 @@ ast_parser.py - Java代码AST解析模块
 """
 
 from dataclasses import dataclass, field
-from typing import Optional
+from functools import lru_cache
+from typing import Iterable, Optional
 
 try:
     import javalang
@@ -13,7 +14,7 @@ except ImportError:
     javalang = None
 
 
-@dataclass
+@dataclass(slots=True)
 class MethodInfo:
     """方法信息"""
     package_name: str
@@ -28,8 +29,13 @@ class MethodInfo:
         """完整限定名：package.Class.method"""
         return f"{self.package_name}.{self.class_name}.{self.method_name}"
 
+    @property
+    def signature(self) -> tuple:
+        """方法签名：(包名, 类名, 方法名, 参数类型元组)，用于版本间比较"""
+        return (self.package_name, self.class_name, self.method_name, tuple(self.parameters))
+
 
-@dataclass
+@dataclass(slots=True)
 class ClassInfo:
     """类信息"""
     package_name: str
@@ -42,7 +48,7 @@ class ClassInfo:
         return f"{self.package_name}.{self.class_name}"
 
 
-@dataclass
+@dataclass(slots=True)
 class ParseResult:
     """解析结果"""
     classes: list[ClassInfo] = field(default_factory=list)
@@ -145,21 +151,322 @@ def parse_java_code(source_code: str) -> ParseResult:
     return ParseResult(classes=classes)
 
 
+# 类型声明关键字（类体中出现时表示嵌套类型，其方法不计入外层类）
+_TYPE_DECL_KEYWORDS = frozenset({"class", "interface", "enum"})
+
+
+class _ScanAbort(Exception):
+    """快速扫描遇到无法识别的结构"""
+
+
+class _MethodScanner:
+    """
+    基于javalang词法token的方法签名扫描器。
+
+    只跟踪包声明、顶层类型声明和类体成员头部，方法体、字段初始化和嵌套类型
+    按括号配对整体跳过，不构建语句和表达式树。
+    """
+
+    def __init__(self, tokens: list):
+        self.tokens = tokens
+        self.pos = 0
+        self.package_name = ""
+
+    def scan(self) -> list[MethodInfo]:
+        """扫描顶层声明，返回所有类/接口的直接方法"""
+        methods = []
+        while self.pos < len(self.tokens):
+            token = self.tokens[self.pos]
+            value = token.value
+            if value == "package":
+                self.pos += 1
+                parts = []
+                while self.tokens[self.pos].value != ";":
+                    parts.append(self.tokens[self.pos].value)
+                    self.pos += 1
+                self.pos += 1
+                self.package_name = "".join(parts)
+            elif value == "import":
+                while self.tokens[self.pos].value != ";":
+                    self.pos += 1
+                self.pos += 1
+            elif value == ";" or isinstance(token, javalang.tokenizer.Modifier):
+                self.pos += 1
+            elif value == "@":
+                if self.tokens[self.pos + 1].value == "interface":
+                    # 注解类型声明：不提取方法
+                    self._skip_to_body()
+                    self._skip_block()
+                else:
+                    self._skip_annotation()
+            elif value in _TYPE_DECL_KEYWORDS:
+                name_token = self.tokens[self.pos + 1]
+                if not isinstance(name_token, javalang.tokenizer.Identifier):
+                    raise _ScanAbort
+                self._skip_to_body()
+                if value == "enum":
+                    # 与完整解析保持一致：枚举不提取方法
+                    self._skip_block()
+                else:
+                    methods.extend(self._scan_class_body(name_token.value))
+            else:
+                raise _ScanAbort
+        return methods
+
+    def _scan_class_body(self, class_name: str) -> list[MethodInfo]:
+        """扫描类体（当前位置为 '{'），返回其中直接声明的方法和构造函数"""
+        self.pos += 1
+        methods = []
+        header = []
+        while True:
+            token = self.tokens[self.pos]
+            value = token.value
+            if value == "}":
+                if header:
+                    raise _ScanAbort
+                self.pos += 1
+                return methods
+            if value == "@":
+                if self.tokens[self.pos + 1].value == "interface":
+                    # 嵌套注解类型：丢弃 '@'，保留 interface 作为类型声明标记
+                    self.pos += 1
+                else:
+                    self._skip_annotation()
+                continue
+            if value == ";":
+                # 抽象方法/接口方法，或无初始化的字段
+                self.pos += 1
+                method = self._build_method(header, class_name)
+                if method is not None:
+                    methods.append(method)
+                header = []
+                continue
+            if value == "=":
+                # 带初始化的字段，整体跳过
+                self._skip_statement()
+                header = []
+                continue
+            if value == "{":
+                is_initializer = not header or [t.value for t in header] == ["static"]
+                is_nested_type = any(t.value in _TYPE_DECL_KEYWORDS for t in header)
+                if not is_initializer and not is_nested_type:
+                    method = self._build_method(header, class_name)
+                    if method is None:
+                        raise _ScanAbort
+                    methods.append(method)
+                self._skip_block()
+                header = []
+                continue
+            header.append(token)
+            self.pos += 1
+
+    def _build_method(self, header: list, class_name: str) -> Optional[MethodInfo]:
+        """从成员头部token构建方法信息，字段声明返回 None"""
+        i = 0
+        modifiers = []
+        while i < len(header) and isinstance(header[i], javalang.tokenizer.Modifier):
+            modifiers.append(header[i].value)
+            i += 1
+        if i < len(header) and header[i].value == "<":
+            i = _skip_angle_brackets(header, i)
+
+        open_paren = next((j for j in range(i, len(header)) if header[j].value == "("), None)
+        if open_paren is None:
+            return None
+        if open_paren == i or not isinstance(header[open_paren - 1], javalang.tokenizer.Identifier):
+            raise _ScanAbort
+
+        method_name = header[open_paren - 1].value
+        type_tokens = header[i:open_paren - 1]
+        if not type_tokens:
+            # 构造函数
+            if method_name != class_name:
+                raise _ScanAbort
+            return_type = None
+        else:
+            return_type = None if type_tokens[0].value == "void" else type_tokens[0].value
+
+        close_paren = open_paren + 1
+        depth = 1
+        while depth:
+            if header[close_paren].value == "(":
+                depth += 1
+            elif header[close_paren].value == ")":
+                depth -= 1
+            close_paren += 1
+        trailing = header[close_paren:]
+        if trailing and trailing[0].value not in ("[", "throws"):
+            raise _ScanAbort
+
+        return MethodInfo(
+            package_name=self.package_name,
+            class_name=class_name,
+            method_name=method_name,
+            modifiers=modifiers,
+            return_type=return_type,
+            parameters=_split_parameter_types(header[open_paren + 1:close_paren - 1]),
+        )
+
+    def _skip_annotation(self) -> None:
+        """跳过注解（当前位置为 '@'），包括括号内的注解参数"""
+        self.pos += 1
+        while True:
+            self.pos += 1
+            if self.tokens[self.pos].value != ".":
+                break
+            self.pos += 1
+        if self.tokens[self.pos].value == "(":
+            depth = 0
+            while True:
+                value = self.tokens[self.pos].value
+                self.pos += 1
+                if value == "(":
+                    depth += 1
+                elif value == ")":
+                    depth -= 1
+                    if depth == 0:
+                        return
+
+    def _skip_to_body(self) -> None:
+        """前进到类型声明体的 '{'"""
+        while self.tokens[self.pos].value != "{":
+            self.pos += 1
+
+    def _skip_block(self) -> None:
+        """跳过配对的花括号块（当前位置为 '{'）"""
+        depth = 0
+        while True:
+            value = self.tokens[self.pos].value
+            self.pos += 1
+            if value == "{":
+                depth += 1
+            elif value == "}":
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def _skip_statement(self) -> None:
+        """跳过到同层级的 ';' 之后（字段初始化中可能包含匿名类、数组初始化等）"""
+        depth = 0
+        while True:
+            value = self.tokens[self.pos].value
+            self.pos += 1
+            if value in ("(", "{", "["):
+                depth += 1
+            elif value in (")", "}", "]"):
+                depth -= 1
+            elif value == ";" and depth == 0:
+                return
+
+
+def _skip_angle_brackets(tokens: list, start: int) -> int:
+    """跳过配对的泛型尖括号（tokens[start] 为 '<'），返回其后的位置"""
+    depth = 0
+    i = start
+    while True:
+        value = tokens[i].value
+        i += 1
+        if value == "<":
+            depth += 1
+        elif value == ">":
+            depth -= 1
+            if depth == 0:
+                return i
+
+
+def _split_parameter_types(tokens: list) -> list[str]:
+    """按顶层逗号拆分参数列表，返回每个参数的类型名（与javalang的 param.type.name 一致）"""
+    params = []
+    current = []
+    depth = 0
+    for token in tokens + [None]:
+        if token is None or (token.value == "," and depth == 0):
+            if not current:
+                if token is None and not params:
+                    break
+                raise _ScanAbort
+            while current and current[0].value == "final":
+                current.pop(0)
+            if len(current) < 2:
+                raise _ScanAbort
+            params.append(current[0].value)
+            current = []
+            continue
+        if token.value == "<":
+            depth += 1
+        elif token.value == ">":
+            depth -= 1
+        current.append(token)
+    return params
+
+
+def _fast_extract_methods(source_code: str) -> Optional[list[MethodInfo]]:
+    """
+    只做词法扫描提取方法签名，避免javalang完整语法解析的开销。
+
+    提取范围与 parse_java_code 一致：顶层类和接口的直接方法及构造函数，
+    枚举、注解类型和嵌套类型不提取。
+
+    与 parse_java_code 不同，方法体按括号配对整体跳过、不做语法检查：
+    成员头部可识别而方法体内有语法错误时（如 ``int x = ;``）仍返回这些方法，
+    完整解析则报告语法错误、不返回方法。
+
+    Args:
+        source_code: Java源代码字符串
+
+    Returns:
+        方法信息列表；遇到无法识别的结构时返回 None，由调用方回退到完整解析
+    """
+    if javalang is None or not source_code or not source_code.strip():
+        return None
+    try:
+        tokens = list(javalang.tokenizer.tokenize(source_code))
+        return _MethodScanner(tokens).scan()
+    except Exception:
+        return None
+
+
 def extract_methods_from_code(source_code: str) -> list[MethodInfo]:
     """
     从Java代码中提取所有方法的简化接口。
 
+    优先使用词法扫描，方法体内的语法错误不影响提取（见 _fast_extract_methods）。
+
     Args:
         source_code: Java源代码字符串
 
     Returns:
         方法信息列表
     """
-    result = parse_java_code(source_code)
-    methods = []
-    for cls in result.classes:
-        methods.extend(cls.methods)
-    return methods
+    return _copy_methods(_parse_methods_cached(source_code))
+
+
+@lru_cache(maxsize=512)
+def _parse_methods_cached(source_code: str) -> tuple[MethodInfo, ...]:
+    """
+    按源码内容缓存方法提取结果，相同源码只做一次javalang解析。
+
+    缓存中的 MethodInfo 对象在多次调用间共享，对外返回前须经 _copy_methods 复制。
+    """
+    methods = _fast_extract_methods(source_code)
+    if methods is None:
+        result = parse_java_code(source_code)
+        methods = [m for cls in result.classes for m in cls.methods]
+    return tuple(methods)
+
+
+def _copy_methods(methods: Iterable[MethodInfo]) -> list[MethodInfo]:
+    """复制方法信息（含列表字段），调用方修改返回结果不会影响缓存"""
+    return [
+        MethodInfo(m.package_name, m.class_name, m.method_name, list(m.modifiers), m.return_type, list(m.parameters))
+        for m in methods
+    ]
+
+
+@lru_cache(maxsize=512)
+def _signature_set_cached(source_code: str) -> frozenset:
+    """按源码缓存方法签名集合，同一历史版本只构建一次"""
+    return frozenset(m.signature for m in _parse_methods_cached(source_code))
 
 
 def extract_changed_methods(current_code: str, history_code: str) -> list[MethodInfo]:
@@ -175,20 +482,13 @@ def extract_changed_methods(current_code: str, history_code: str) -> list[Method
     Returns:
         变更的方法列表（新增 + 修改）
     """
-    current_methods = extract_methods_from_code(current_code)
-    history_methods = extract_methods_from_code(history_code)
+    # 内容相同的文件不会有变更方法，无需解析
+    if current_code is history_code or current_code == history_code:
+        return []
 
-    # 建立历史方法签名集合
-    history_signatures = set()
-    for m in history_methods:
-        sig = f"{m.package_name}.{m.class_name}.{m.method_name}({','.join(m.parameters)})"
-        history_signatures.add(sig)
+    current_methods = _parse_methods_cached(current_code)
 
-    # 找出新增的方法
-    changed = []
-    for m in current_methods:
-        sig = f"{m.package_name}.{m.class_name}.{m.method_name}({','.join(m.parameters)})"
-        if sig not in history_signatures:
-            changed.append(m)
+    history_signatures = _signature_set_cached(history_code)
 
-    return changed
+    # 找出新增的方法
+    return _copy_methods(m for m in current_methods if m.signature not in history_signatures)
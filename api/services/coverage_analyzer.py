@@ -5,32 +5,46 @@ coverage_analyzer.py - 测试覆盖分析模块
 """
 
 from dataclasses import dataclass, field
-from typing import Optional
+from typing import Optional, Sequence
 
 
-@dataclass
+# 描述关键词分隔符，统一替换为空格后按空白拆分
+_KEYWORD_SEPARATORS = str.maketrans({",": " ", "，": " ", "/": " "})
+
+
+@dataclass(slots=True)
 class MappingEntry:
     """映射关系条目"""
     package_name: str
     class_name: str
     method_name: str
     description: str
+    _desc_lower: str = field(init=False, repr=False, compare=False)
+    _desc_keywords: tuple[str, ...] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self._desc_lower = self.description.lower()
+        self._desc_keywords = tuple(_split_keywords(self._desc_lower))
 
     @property
     def full_qualified_name(self) -> str:
         return f"{self.package_name}.{self.class_name}.{self.method_name}"
 
 
-@dataclass
+@dataclass(slots=True)
 class TestCase:
     """测试用例"""
     test_id: str
     test_function: str
     test_steps: str
     expected_result: str
+    _func_lower: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self._func_lower = self.test_function.lower()
 
 
-@dataclass
+@dataclass(slots=True)
 class CoverageResult:
     """覆盖分析结果"""
     total_changed_methods: int = 0
@@ -120,17 +134,19 @@ def analyze_coverage(
     if not changed_methods:
         return CoverageResult(error="没有检测到代码改动")
 
-    # 建立映射关系索引：method全名 -> 功能描述
-    mapping_index: dict[str, str] = {}
-    for entry in mapping_entries:
-        key = entry.full_qualified_name
-        mapping_index[key] = entry.description
+    # 建立映射关系索引：(包名, 类名, 方法名) -> 映射条目（含预先计算的小写描述和关键词）
+    # 元组作键，不必为每个条目拼接全名
+    mapping_index: dict[tuple[str, str, str], MappingEntry] = {
+        (entry.package_name, entry.class_name, entry.method_name): entry
+        for entry in mapping_entries
+    }
 
-    # 收集测试用例覆盖的功能关键词
-    test_keywords: set[str] = set()
-    for tc in test_cases:
-        # 将测试功能分词作为匹配关键词
-        test_keywords.add(tc.test_function.lower())
+    # 小写测试功能在 TestCase 构建时已计算
+    lowered_tests = [(tc.test_id, tc._func_lower) for tc in test_cases]
+    # 测试功能常有重复（同一功能多个用例），字符串匹配只对去重后的功能做一次
+    distinct_funcs = list(dict.fromkeys(func for _, func in lowered_tests))
+    # 相同描述的匹配结果相同，按描述缓存
+    matches_by_desc: dict[str, list[str]] = {}
 
     covered = []
     uncovered = []
@@ -143,22 +159,22 @@ def analyze_coverage(
         full_name = f"{pkg}.{cls}.{mtd}"
 
         # 在映射关系中查找功能描述
-        description = mapping_index.get(full_name, "")
+        entry = mapping_index.get((pkg, cls, mtd))
+        description = entry.description if entry is not None else ""
 
         # 判断是否被测试用例覆盖
-        is_covered = False
         matched_tests = []
-
         if description:
-            desc_lower = description.lower()
-            for tc in test_cases:
-                func_lower = tc.test_function.lower()
-                # 功能描述与测试功能模糊匹配
-                if (desc_lower in func_lower or
-                    func_lower in desc_lower or
-                    _fuzzy_match(desc_lower, func_lower)):
-                    is_covered = True
-                    matched_tests.append(tc.test_id)
+            cached = matches_by_desc.get(description)
+            if cached is None:
+                matched_funcs = _match_functions(
+                    entry._desc_lower, entry._desc_keywords, distinct_funcs
+                )
+                cached = matches_by_desc[description] = [
+                    test_id for test_id, func in lowered_tests if func in matched_funcs
+                ] if matched_funcs else []
+            matched_tests = list(cached)
+        is_covered = bool(matched_tests)
 
         if is_covered:
             covered.append(full_name)
@@ -184,6 +200,54 @@ def analyze_coverage(
     )
 
 
+def _match_functions(
+    desc_lower: str,
+    keywords: tuple[str, ...],
+    funcs: list[str],
+) -> set[str]:
+    """
+    找出与功能描述匹配的测试功能。
+
+    描述与测试功能互相包含，或满足 _fuzzy_match 的关键词规则即视为匹配。
+
+    Args:
+        desc_lower: 小写的功能描述
+        keywords: 描述拆分出的关键词
+        funcs: 去重后的小写测试功能列表
+
+    Returns:
+        匹配的测试功能集合
+    """
+    required = max(1, len(keywords) // 2)
+    matched = set()
+    for func_lower in funcs:
+        # 功能描述与测试功能模糊匹配
+        if (desc_lower in func_lower or
+            func_lower in desc_lower or
+            (keywords and _keywords_hit(keywords, func_lower, required))):
+            matched.add(func_lower)
+    return matched
+
+
+def _keywords_hit(keywords: Sequence[str], text: str, required: int) -> bool:
+    """出现在 text 中的关键词数是否达到 required，达到即停止扫描"""
+    remaining = len(keywords)
+    for kw in keywords:
+        if kw in text:
+            required -= 1
+            if required <= 0:
+                return True
+        remaining -= 1
+        if remaining < required:
+            return False
+    return False
+
+
+def _split_keywords(desc: str) -> list[str]:
+    """按常见分隔符拆分描述关键词"""
+    return desc.translate(_KEYWORD_SEPARATORS).split()
+
+
 def _fuzzy_match(desc: str, test_func: str) -> bool:
     """
     简单的模糊匹配：检查描述中的关键词是否出现在测试功能中。
@@ -195,11 +259,9 @@ def _fuzzy_match(desc: str, test_func: str) -> bool:
     Returns:
         是否匹配
     """
-    # 按常见分隔符拆分
-    keywords = desc.replace(",", " ").replace("，", " ").replace("/", " ").split()
+    keywords = _split_keywords(desc)
     if not keywords:
         return False
 
     # 至少有一半关键词命中
-    match_count = sum(1 for kw in keywords if kw in test_func)
-    return match_count >= max(1, len(keywords) // 2)
+    return _keywords_hit(keywords, test_func, max(1, len(keywords) // 2))
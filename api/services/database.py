@@ -2,15 +2,22 @@
 database.py - SQLite数据库抽象层
 
 提供项目管理和分析记录的持久化存储。
-使用SQLite标准库，无需额外依赖。
+使用SQLite标准库，无需额外依赖；安装orjson时用其加速JSON字段的读写。
 """
 
+import atexit
 import json
 import os
 import sqlite3
+import threading
 from pathlib import Path
 from typing import Optional
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 def get_db_path() -> str:
     """获取数据库文件路径，支持通过环境变量配置"""
@@ -18,23 +25,74 @@ def get_db_path() -> str:
     return os.environ.get("DB_PATH", default_path)
 
 
-def _get_connection() -> sqlite3.Connection:
-    """获取数据库连接，启用外键约束和Row工厂"""
-    db_path = get_db_path()
+# 每个线程复用一个连接，避免每次调用重新打开数据库文件和执行PRAGMA
+_conn_local = threading.local()
+_all_connections: set[sqlite3.Connection] = set()
+_all_connections_lock = threading.Lock()
+
+
+def _open_connection(db_path: str) -> sqlite3.Connection:
+    """打开数据库连接，启用外键约束和Row工厂
+
+    db_path 以 "file:" 开头时按SQLite URI打开（如测试用的共享缓存内存库）。
+    """
+    is_uri = db_path.startswith("file:")
     # 确保目录存在
-    db_dir = os.path.dirname(db_path)
+    db_dir = "" if is_uri else os.path.dirname(db_path)
     if db_dir:
         os.makedirs(db_dir, exist_ok=True)
-    conn = sqlite3.connect(db_path)
+    conn = sqlite3.connect(db_path, check_same_thread=False, uri=is_uri)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON")
+    # WAL模式下 NORMAL 同步级别每次提交只需一次fsync，仍保证数据库不损坏
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA cache_size = -20000")
+    conn.execute("PRAGMA mmap_size = 268435456")
+    with _all_connections_lock:
+        _all_connections.add(conn)
+    return conn
+
+
+def _get_connection() -> sqlite3.Connection:
+    """获取当前线程的数据库连接，数据库路径变化时重新打开"""
+    db_path = get_db_path()
+    conn = getattr(_conn_local, "conn", None)
+    if conn is not None and _conn_local.path == db_path:
+        return conn
+    if conn is not None:
+        _close_connection(conn)
+    conn = _open_connection(db_path)
+    _conn_local.conn = conn
+    _conn_local.path = db_path
     return conn
 
 
+def _close_connection(conn: sqlite3.Connection) -> None:
+    """关闭连接并从连接登记中移除"""
+    with _all_connections_lock:
+        _all_connections.discard(conn)
+    conn.close()
+
+
+def close_all_connections() -> None:
+    """关闭所有线程的数据库连接（进程退出时调用）"""
+    with _all_connections_lock:
+        connections = list(_all_connections)
+        _all_connections.clear()
+    for conn in connections:
+        conn.close()
+
+
+atexit.register(close_all_connections)
+
+
 def init_db() -> None:
     """初始化数据库，创建表结构"""
     conn = _get_connection()
-    try:
+    # WAL模式持久化在数据库文件中，读操作不会被写事务阻塞
+    conn.execute("PRAGMA journal_mode = WAL")
+    with conn:
         conn.executescript("""
             CREATE TABLE IF NOT EXISTS projects (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -58,6 +116,9 @@ def init_db() -> None:
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             );
 
+            CREATE INDEX IF NOT EXISTS idx_ar_project_created
+                ON analysis_records(project_id, created_at DESC, id DESC);
+
             CREATE TABLE IF NOT EXISTS global_mapping (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 name VARCHAR(200) NOT NULL,
@@ -65,10 +126,36 @@ def init_db() -> None:
                 row_count INTEGER DEFAULT 0,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             );
+
+            CREATE TABLE IF NOT EXISTS global_mapping_entries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                mapping_id INTEGER NOT NULL REFERENCES global_mapping(id) ON DELETE CASCADE,
+                package_name TEXT NOT NULL,
+                class_name TEXT NOT NULL,
+                method_name TEXT NOT NULL,
+                description TEXT DEFAULT ''
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_gme_mapping
+                ON global_mapping_entries(mapping_id, id);
+
+            CREATE INDEX IF NOT EXISTS idx_gme_method
+                ON global_mapping_entries(package_name, class_name, method_name);
         """)
-        conn.commit()
-    finally:
-        conn.close()
+
+
+def _dumps(data) -> str:
+    """序列化为JSON字符串（优先使用orjson，输出UTF-8原文）"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(data, ensure_ascii=False)
+
+
+def _loads(text: str):
+    """解析JSON字符串（优先使用orjson）"""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
 
 
 def _row_to_dict(row: sqlite3.Row) -> dict:
@@ -76,6 +163,32 @@ def _row_to_dict(row: sqlite3.Row) -> dict:
     return dict(row)
 
 
+# SQLite 3.35 起支持 INSERT ... RETURNING，插入后无需再次查询
+_SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+def _insert_returning(conn: sqlite3.Connection, table: str, sql: str, params: tuple) -> dict:
+    """
+    执行INSERT并返回插入的整行（JSON字段未解析），事务由调用方管理。
+
+    Args:
+        conn: 数据库连接
+        table: 表名，不支持RETURNING时按 lastrowid 回查该表
+        sql: INSERT语句（不含RETURNING子句）
+        params: 语句参数
+
+    Returns:
+        插入行的字典
+    """
+    if _SUPPORTS_RETURNING:
+        # fetchall 取完结果，确保提交前语句已执行结束
+        row = conn.execute(f"{sql} RETURNING *", params).fetchall()[0]
+    else:
+        cursor = conn.execute(sql, params)
+        row = conn.execute(f"SELECT * FROM {table} WHERE id = ?", (cursor.lastrowid,)).fetchone()
+    return _row_to_dict(row)
+
+
 def create_project(
     name: str,
     description: str = "",
@@ -92,67 +205,78 @@ def create_project(
     Returns:
         创建的项目字典
     """
-    mapping_json = json.dumps(mapping_data, ensure_ascii=False) if mapping_data is not None else None
+    mapping_json = _dumps(mapping_data) if mapping_data is not None else None
     conn = _get_connection()
-    try:
-        cursor = conn.execute(
+    with conn:
+        result = _insert_returning(
+            conn,
+            "projects",
             "INSERT INTO projects (name, description, mapping_data) VALUES (?, ?, ?)",
             (name, description, mapping_json),
         )
-        conn.commit()
-        project_id = cursor.lastrowid
-        return get_project(project_id)
-    finally:
-        conn.close()
+    if result.get("mapping_data"):
+        result["mapping_data"] = _loads(result["mapping_data"])
+    return result
+
+
+# 不加载 mapping_data 时查询的列；has_mapping 与解析后 mapping_data 的真值一致
+_PROJECT_META_COLUMNS = (
+    "id, name, description, created_at, updated_at, "
+    "(mapping_data IS NOT NULL AND mapping_data NOT IN ('', '[]', '{}', 'null')) AS has_mapping"
+)
 
 
-def get_project(project_id: int) -> Optional[dict]:
+def get_project(project_id: int, include_mapping: bool = True) -> Optional[dict]:
     """
     获取单个项目详情。
 
     Args:
         project_id: 项目ID
+        include_mapping: 是否加载并解析 mapping_data；为False时不查询该列，
+            改为返回布尔字段 has_mapping
 
     Returns:
         项目字典，不存在返回None
     """
+    columns = "*" if include_mapping else _PROJECT_META_COLUMNS
     conn = _get_connection()
-    try:
-        row = conn.execute(
-            "SELECT * FROM projects WHERE id = ?", (project_id,)
-        ).fetchone()
-        if row is None:
-            return None
-        result = _row_to_dict(row)
-        # 解析mapping_data JSON
-        if result.get("mapping_data"):
-            result["mapping_data"] = json.loads(result["mapping_data"])
+    row = conn.execute(
+        f"SELECT {columns} FROM projects WHERE id = ?", (project_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    result = _row_to_dict(row)
+    if not include_mapping:
+        result["has_mapping"] = bool(result["has_mapping"])
         return result
-    finally:
-        conn.close()
+    # 解析mapping_data JSON
+    if result.get("mapping_data"):
+        result["mapping_data"] = _loads(result["mapping_data"])
+    return result
 
 
-def list_projects() -> list[dict]:
+def list_projects(include_mapping: bool = True) -> list[dict]:
     """
     列出所有项目。
 
+    Args:
+        include_mapping: 是否加载并解析 mapping_data；为False时不查询该列
+
     Returns:
         项目字典列表，按创建时间倒序
     """
+    columns = "*" if include_mapping else "id, name, description, created_at, updated_at"
     conn = _get_connection()
-    try:
-        rows = conn.execute(
-            "SELECT * FROM projects ORDER BY created_at DESC, id DESC"
-        ).fetchall()
-        results = []
-        for row in rows:
-            d = _row_to_dict(row)
-            if d.get("mapping_data"):
-                d["mapping_data"] = json.loads(d["mapping_data"])
-            results.append(d)
-        return results
-    finally:
-        conn.close()
+    rows = conn.execute(
+        f"SELECT {columns} FROM projects ORDER BY created_at DESC, id DESC"
+    ).fetchall()
+    results = []
+    for row in rows:
+        d = _row_to_dict(row)
+        if d.get("mapping_data"):
+            d["mapping_data"] = _loads(d["mapping_data"])
+        results.append(d)
+    return results
 
 
 def update_project(
@@ -188,7 +312,7 @@ def update_project(
         params.append(description)
     if mapping_data is not None:
         updates.append("mapping_data = ?")
-        params.append(json.dumps(mapping_data, ensure_ascii=False))
+        params.append(_dumps(mapping_data))
 
     if not updates:
         return existing
@@ -198,11 +322,8 @@ def update_project(
 
     sql = f"UPDATE projects SET {', '.join(updates)} WHERE id = ?"
     conn = _get_connection()
-    try:
+    with conn:
         conn.execute(sql, params)
-        conn.commit()
-    finally:
-        conn.close()
 
     return get_project(project_id)
 
@@ -218,12 +339,38 @@ def delete_project(project_id: int) -> bool:
         是否成功删除（项目不存在返回False）
     """
     conn = _get_connection()
-    try:
+    with conn:
         cursor = conn.execute("DELETE FROM projects WHERE id = ?", (project_id,))
-        conn.commit()
-        return cursor.rowcount > 0
-    finally:
-        conn.close()
+    return cursor.rowcount > 0
+
+
+_INSERT_ANALYSIS_RECORD_SQL = """INSERT INTO analysis_records
+   (project_id, code_changes_summary, test_coverage_result,
+    test_score, ai_suggestions, token_usage, cost, duration_ms)
+   VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
+
+
+def _analysis_record_params(
+    project_id: int,
+    code_changes_summary: dict,
+    test_coverage_result: dict,
+    test_score: float,
+    ai_suggestions: Optional[dict],
+    token_usage: int,
+    cost: float,
+    duration_ms: int,
+) -> tuple:
+    """将分析记录序列化为INSERT参数"""
+    return (
+        project_id,
+        _dumps(code_changes_summary),
+        _dumps(test_coverage_result),
+        test_score,
+        _dumps(ai_suggestions) if ai_suggestions is not None else None,
+        token_usage,
+        cost,
+        duration_ms,
+    )
 
 
 def save_analysis_record(
@@ -253,28 +400,57 @@ def save_analysis_record(
         创建的分析记录字典
     """
     conn = _get_connection()
-    try:
-        cursor = conn.execute(
-            """INSERT INTO analysis_records
-               (project_id, code_changes_summary, test_coverage_result,
-                test_score, ai_suggestions, token_usage, cost, duration_ms)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-            (
+    with conn:
+        result = _insert_returning(
+            conn,
+            "analysis_records",
+            _INSERT_ANALYSIS_RECORD_SQL,
+            _analysis_record_params(
                 project_id,
-                json.dumps(code_changes_summary, ensure_ascii=False),
-                json.dumps(test_coverage_result, ensure_ascii=False),
+                code_changes_summary,
+                test_coverage_result,
                 test_score,
-                json.dumps(ai_suggestions, ensure_ascii=False) if ai_suggestions is not None else None,
+                ai_suggestions,
                 token_usage,
                 cost,
                 duration_ms,
             ),
         )
-        conn.commit()
-        record_id = cursor.lastrowid
-        return get_analysis_record(record_id)
-    finally:
-        conn.close()
+    _parse_record_json_fields(result)
+    return result
+
+
+def save_analysis_records_bulk(records: list[dict]) -> int:
+    """
+    批量保存分析记录，所有记录在同一个事务中写入（一次提交）。
+
+    Args:
+        records: 记录字典列表，键与 save_analysis_record 的参数相同，
+                 ai_suggestions 可省略
+
+    Returns:
+        写入的记录数
+    """
+    params = [
+        _analysis_record_params(
+            record["project_id"],
+            record["code_changes_summary"],
+            record["test_coverage_result"],
+            record["test_score"],
+            record.get("ai_suggestions"),
+            record["token_usage"],
+            record["cost"],
+            record["duration_ms"],
+        )
+        for record in records
+    ]
+    if not params:
+        return 0
+
+    conn = _get_connection()
+    with conn:
+        conn.executemany(_INSERT_ANALYSIS_RECORD_SQL, params)
+    return len(params)
 
 
 def get_analysis_record(record_id: int) -> Optional[dict]:
@@ -288,17 +464,14 @@ def get_analysis_record(record_id: int) -> Optional[dict]:
         分析记录字典，不存在返回None
     """
     conn = _get_connection()
-    try:
-        row = conn.execute(
-            "SELECT * FROM analysis_records WHERE id = ?", (record_id,)
-        ).fetchone()
-        if row is None:
-            return None
-        result = _row_to_dict(row)
-        _parse_record_json_fields(result)
-        return result
-    finally:
-        conn.close()
+    row = conn.execute(
+        "SELECT * FROM analysis_records WHERE id = ?", (record_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    result = _row_to_dict(row)
+    _parse_record_json_fields(result)
+    return result
 
 
 def list_analysis_records(
@@ -318,25 +491,22 @@ def list_analysis_records(
         分析记录字典列表
     """
     conn = _get_connection()
-    try:
-        if project_id is not None:
-            rows = conn.execute(
-                "SELECT * FROM analysis_records WHERE project_id = ? ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
-                (project_id, limit, offset),
-            ).fetchall()
-        else:
-            rows = conn.execute(
-                "SELECT * FROM analysis_records ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
-                (limit, offset),
-            ).fetchall()
-        results = []
-        for row in rows:
-            d = _row_to_dict(row)
-            _parse_record_json_fields(d)
-            results.append(d)
-        return results
-    finally:
-        conn.close()
+    if project_id is not None:
+        rows = conn.execute(
+            "SELECT * FROM analysis_records WHERE project_id = ? ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+            (project_id, limit, offset),
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            "SELECT * FROM analysis_records ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+            (limit, offset),
+        ).fetchall()
+    results = []
+    for row in rows:
+        d = _row_to_dict(row)
+        _parse_record_json_fields(d)
+        results.append(d)
+    return results
 
 
 def get_project_stats(project_id: int) -> dict:
@@ -350,31 +520,28 @@ def get_project_stats(project_id: int) -> dict:
         包含分析次数、平均分、最近分析时间的字典
     """
     conn = _get_connection()
-    try:
-        row = conn.execute(
-            """SELECT
-                COUNT(*) as analysis_count,
-                AVG(test_score) as avg_score,
-                MAX(created_at) as latest_analysis_date
-               FROM analysis_records
-               WHERE project_id = ?""",
-            (project_id,),
-        ).fetchone()
-        result = _row_to_dict(row)
-        return {
-            "analysis_count": result["analysis_count"],
-            "avg_score": round(result["avg_score"], 2) if result["avg_score"] is not None else None,
-            "latest_analysis_date": result["latest_analysis_date"],
-        }
-    finally:
-        conn.close()
+    row = conn.execute(
+        """SELECT
+            COUNT(*) as analysis_count,
+            AVG(test_score) as avg_score,
+            MAX(created_at) as latest_analysis_date
+           FROM analysis_records
+           WHERE project_id = ?""",
+        (project_id,),
+    ).fetchone()
+    result = _row_to_dict(row)
+    return {
+        "analysis_count": result["analysis_count"],
+        "avg_score": round(result["avg_score"], 2) if result["avg_score"] is not None else None,
+        "latest_analysis_date": result["latest_analysis_date"],
+    }
 
 
 def _parse_record_json_fields(record: dict) -> None:
     """解析分析记录中的JSON字段"""
     for field in ("code_changes_summary", "test_coverage_result", "ai_suggestions"):
         if record.get(field):
-            record[field] = json.loads(record[field])
+            record[field] = _loads(record[field])
 
 
 # ============ 全局映射管理 ============
@@ -383,6 +550,9 @@ def save_global_mapping(name: str, mapping_data: list[dict], row_count: int) ->
     """
     保存全局映射数据。
 
+    条目逐行写入 global_mapping_entries 表（按上传顺序保留重复行，与 row_count 一致），
+    读取时以该表为准；mapping_data 列仍写入同样内容的JSON，兼容直接读取该列的旧版本和导出。
+
     Args:
         name: 映射文件名
         mapping_data: 解析后的映射条目列表
@@ -391,71 +561,120 @@ def save_global_mapping(name: str, mapping_data: list[dict], row_count: int) ->
     Returns:
         创建的映射记录字典
     """
+    entries = [
+        {
+            "package_name": e["package_name"],
+            "class_name": e["class_name"],
+            "method_name": e["method_name"],
+            "description": e.get("description", ""),
+        }
+        for e in mapping_data
+    ]
     conn = _get_connection()
-    try:
-        cursor = conn.execute(
+    with conn:
+        result = _insert_returning(
+            conn,
+            "global_mapping",
             "INSERT INTO global_mapping (name, mapping_data, row_count) VALUES (?, ?, ?)",
-            (name, json.dumps(mapping_data, ensure_ascii=False), row_count),
+            (name, _dumps(entries), row_count),
+        )
+        conn.executemany(
+            """INSERT INTO global_mapping_entries
+               (mapping_id, package_name, class_name, method_name, description)
+               VALUES (:mapping_id, :package_name, :class_name, :method_name, :description)""",
+            [dict(e, mapping_id=result["id"]) for e in entries],
         )
-        conn.commit()
-        mapping_id = cursor.lastrowid
-        return get_global_mapping(mapping_id)
-    finally:
-        conn.close()
+
+    result["mapping_data"] = entries
+    return result
+
+
+def _load_global_mapping_data(conn: sqlite3.Connection, mapping: dict) -> None:
+    """
+    为映射记录填充 mapping_data。
+
+    优先从 global_mapping_entries 表读取；该表出现之前保存的映射没有条目行，
+    回退为解析 mapping_data 列。
+
+    Args:
+        conn: 数据库连接
+        mapping: 含 id 与 mapping_data 列的映射记录，原地修改
+    """
+    rows = conn.execute(
+        """SELECT package_name, class_name, method_name, description
+           FROM global_mapping_entries WHERE mapping_id = ? ORDER BY id""",
+        (mapping["id"],),
+    ).fetchall()
+    if rows:
+        mapping["mapping_data"] = [_row_to_dict(row) for row in rows]
+    else:
+        mapping["mapping_data"] = _loads(mapping["mapping_data"]) if mapping.get("mapping_data") else []
 
 
 def get_global_mapping(mapping_id: int) -> Optional[dict]:
     """获取单条全局映射。"""
     conn = _get_connection()
-    try:
-        row = conn.execute(
-            "SELECT * FROM global_mapping WHERE id = ?", (mapping_id,)
-        ).fetchone()
-        if row is None:
-            return None
-        result = _row_to_dict(row)
-        if result.get("mapping_data"):
-            result["mapping_data"] = json.loads(result["mapping_data"])
-        return result
-    finally:
-        conn.close()
+    row = conn.execute(
+        "SELECT * FROM global_mapping WHERE id = ?", (mapping_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    result = _row_to_dict(row)
+    _load_global_mapping_data(conn, result)
+    return result
+
+
+def get_global_mapping_entries(mapping_id: int) -> Optional[list[dict]]:
+    """
+    获取全局映射的条目列表。
+
+    Args:
+        mapping_id: 映射ID
+
+    Returns:
+        映射条目字典列表（package_name/class_name/method_name/description），映射不存在返回None
+    """
+    mapping = get_global_mapping(mapping_id)
+    if mapping is None:
+        return None
+    return mapping["mapping_data"]
 
 
 def list_global_mappings() -> list[dict]:
     """列出所有全局映射，按创建时间倒序。"""
     conn = _get_connection()
-    try:
-        rows = conn.execute(
-            "SELECT id, name, row_count, created_at FROM global_mapping ORDER BY created_at DESC, id DESC"
-        ).fetchall()
-        return [_row_to_dict(row) for row in rows]
-    finally:
-        conn.close()
+    rows = conn.execute(
+        "SELECT id, name, row_count, created_at FROM global_mapping ORDER BY created_at DESC, id DESC"
+    ).fetchall()
+    return [_row_to_dict(row) for row in rows]
+
 
+def get_latest_global_mapping(include_data: bool = True) -> Optional[dict]:
+    """
+    获取最新的全局映射数据（用于分析时自动使用）。
 
-def get_latest_global_mapping() -> Optional[dict]:
-    """获取最新的全局映射数据（用于分析时自动使用）。"""
+    Args:
+        include_data: 是否加载并解析 mapping_data；为False时只返回元信息
+
+    Returns:
+        映射记录字典，不存在返回None
+    """
+    columns = "*" if include_data else "id, name, row_count, created_at"
     conn = _get_connection()
-    try:
-        row = conn.execute(
-            "SELECT * FROM global_mapping ORDER BY created_at DESC, id DESC LIMIT 1"
-        ).fetchone()
-        if row is None:
-            return None
-        result = _row_to_dict(row)
-        if result.get("mapping_data"):
-            result["mapping_data"] = json.loads(result["mapping_data"])
-        return result
-    finally:
-        conn.close()
+    row = conn.execute(
+        f"SELECT {columns} FROM global_mapping ORDER BY created_at DESC, id DESC LIMIT 1"
+    ).fetchone()
+    if row is None:
+        return None
+    result = _row_to_dict(row)
+    if include_data:
+        _load_global_mapping_data(conn, result)
+    return result
 
 
 def delete_global_mapping(mapping_id: int) -> bool:
     """删除全局映射。"""
     conn = _get_connection()
-    try:
+    with conn:
         cursor = conn.execute("DELETE FROM global_mapping WHERE id = ?", (mapping_id,))
-        conn.commit()
-        return cursor.rowcount > 0
-    finally:
-        conn.close()
+    return cursor.rowcount > 0
@@ -4,8 +4,12 @@ deepseek_client.py - DeepSeek API调用封装
 使用OpenAI兼容SDK调用DeepSeek API，包含重试、超时控制和成本计算。
 """
 
+import asyncio
+import copy
+import hashlib
 import json
 import os
+from collections import OrderedDict
 from typing import Optional
 
 from loguru import logger
@@ -18,6 +22,17 @@ except ImportError:
     APITimeoutError = Exception
     RateLimitError = Exception
 
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
 
 # 配置常量
 MAX_RETRIES = 1
@@ -34,9 +49,46 @@ PRICING = {
     "output": 3.0,             # 输出
 }
 
+# 每Token单价（元），预先换算避免每次计算都做除法
+_CACHE_HIT_PRICE = PRICING["cache_hit_input"] / 1_000_000
+_CACHE_MISS_PRICE = PRICING["cache_miss_input"] / 1_000_000
+_OUTPUT_PRICE = PRICING["output"] / 1_000_000
+
+# 连接池上限：并发分析时复用keep-alive连接
+MAX_KEEPALIVE_CONNECTIONS = 20
+MAX_CONNECTIONS = 50
+
+# 成功响应的LRU缓存：messages 与采样参数相同的请求直接复用结果，不重复计费
+RESPONSE_CACHE_SIZE = 256
+_response_cache: OrderedDict[str, dict] = OrderedDict()
+# 进行中的请求：相同请求并发到达时共享同一次API调用
+_inflight: dict[str, asyncio.Future] = {}
+
+# 进程内复用的客户端及其对应的 API Key（Key 变化时重建）
+_client: Optional["AsyncOpenAI"] = None
+_client_api_key: Optional[str] = None
+
+
+def _build_http_client() -> Optional["httpx.AsyncClient"]:
+    """构建带连接池限制的httpx客户端；安装了h2时启用HTTP/2"""
+    if httpx is None:
+        return None
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            max_connections=MAX_CONNECTIONS,
+        ),
+        http2=_HTTP2_AVAILABLE,
+    )
+
 
 def get_client() -> Optional["AsyncOpenAI"]:
-    """获取DeepSeek API客户端"""
+    """
+    获取DeepSeek API客户端。
+
+    客户端在进程内复用，以保留连接池与TLS会话；DEEPSEEK_API_KEY 变化时重建。
+    """
+    global _client, _client_api_key
     if AsyncOpenAI is None:
         logger.error("openai库未安装")
         return None
@@ -46,7 +98,40 @@ def get_client() -> Optional["AsyncOpenAI"]:
         logger.error("DEEPSEEK_API_KEY环境变量未设置")
         return None
 
-    return AsyncOpenAI(api_key=api_key, base_url=BASE_URL)
+    if _client is None or api_key != _client_api_key:
+        _client = AsyncOpenAI(api_key=api_key, base_url=BASE_URL, http_client=_build_http_client())
+        _client_api_key = api_key
+    return _client
+
+
+async def close_client() -> None:
+    """关闭复用的客户端并释放连接池（应用关闭时调用）"""
+    global _client, _client_api_key
+    client, _client, _client_api_key = _client, None, None
+    if client is not None:
+        await client.close()
+
+
+_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": (
+        "你是一位资深测试架构师，擅长分析代码改动并评估测试用例覆盖情况。\n"
+        "请根据提供的代码改动diff、功能映射和现有测试用例，分析测试覆盖缺口并给出补充建议。\n"
+        "请以JSON格式输出分析结果。"
+    ),
+}
+
+_USER_PROMPT_TEMPLATE = (
+    "## 代码改动Diff\n{diff_summary}\n\n"
+    "## 功能映射关系\n{mapping_info}\n\n"
+    "## 现有测试用例\n{test_cases_text}\n\n"
+    "请分析以上信息，输出JSON格式结果，包含以下字段：\n"
+    "- uncovered_methods: 未覆盖的方法列表\n"
+    "- coverage_gaps: 覆盖缺口描述\n"
+    "- suggested_test_cases: 建议补充的测试用例（每个包含 test_id, test_function, test_steps, expected_result）\n"
+    "- risk_assessment: 风险评估（high/medium/low）\n"
+    "- improvement_suggestions: 改进建议列表"
+)
 
 
 def build_analysis_messages(
@@ -57,6 +142,8 @@ def build_analysis_messages(
     """
     构建分析请求的messages。
 
+    系统消息为模块级常量，各次请求共享（SDK不会修改messages）。
+
     Args:
         diff_summary: 代码差异摘要
         mapping_info: 功能映射信息
@@ -65,46 +152,23 @@ def build_analysis_messages(
     Returns:
         OpenAI messages格式列表
     """
-    system_prompt = (
-        "你是一位资深测试架构师，擅长分析代码改动并评估测试用例覆盖情况。\n"
-        "请根据提供的代码改动diff、功能映射和现有测试用例，分析测试覆盖缺口并给出补充建议。\n"
-        "请以JSON格式输出分析结果。"
-    )
-
-    user_prompt = (
-        f"## 代码改动Diff\n{diff_summary}\n\n"
-        f"## 功能映射关系\n{mapping_info}\n\n"
-        f"## 现有测试用例\n{test_cases_text}\n\n"
-        "请分析以上信息，输出JSON格式结果，包含以下字段：\n"
-        "- uncovered_methods: 未覆盖的方法列表\n"
-        "- coverage_gaps: 覆盖缺口描述\n"
-        "- suggested_test_cases: 建议补充的测试用例（每个包含 test_id, test_function, test_steps, expected_result）\n"
-        "- risk_assessment: 风险评估（high/medium/low）\n"
-        "- improvement_suggestions: 改进建议列表"
+    user_prompt = _USER_PROMPT_TEMPLATE.format(
+        diff_summary=diff_summary,
+        mapping_info=mapping_info,
+        test_cases_text=test_cases_text,
     )
-
     return [
-        {"role": "system", "content": system_prompt},
+        _SYSTEM_MESSAGE,
         {"role": "user", "content": user_prompt},
     ]
 
 
-async def call_deepseek(
+async def _request_deepseek(
     messages: list[dict],
     max_tokens: int = DEFAULT_MAX_TOKENS,
     temperature: float = DEFAULT_TEMPERATURE,
 ) -> dict:
-    """
-    带重试和超时控制的DeepSeek API调用。
-
-    Args:
-        messages: OpenAI messages格式列表
-        max_tokens: 最大输出token数
-        temperature: 采样温度
-
-    Returns:
-        dict，成功时包含 result 和 usage，失败时包含 error
-    """
+    """带重试和超时控制的DeepSeek API调用（不经缓存）"""
     client = get_client()
     if client is None:
         return {"error": "DeepSeek客户端初始化失败，请检查API Key配置"}
@@ -173,6 +237,81 @@ async def call_deepseek(
     return {"error": "AI调用失败，请稍后重试"}
 
 
+def _cache_key(messages: list[dict], max_tokens: int, temperature: float) -> str:
+    """请求内容的BLAKE2b摘要"""
+    payload = json.dumps(
+        [messages, max_tokens, temperature], ensure_ascii=False, sort_keys=True
+    ).encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def _as_cached(response: dict) -> dict:
+    """复制缓存的响应；用量清零以免重复计入成本"""
+    return {
+        "result": copy.deepcopy(response["result"]),
+        "usage": {k: 0 for k in response["usage"]},
+        "cached": True,
+    }
+
+
+async def _fetch_and_cache(
+    key: str,
+    messages: list[dict],
+    max_tokens: int,
+    temperature: float,
+) -> dict:
+    """调用API，成功时写入响应缓存"""
+    response = await _request_deepseek(messages, max_tokens, temperature)
+    if "error" not in response:
+        _response_cache[key] = response
+        if len(_response_cache) > RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+    return response
+
+
+def clear_response_cache() -> None:
+    """清空响应缓存"""
+    _response_cache.clear()
+
+
+async def call_deepseek(
+    messages: list[dict],
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    temperature: float = DEFAULT_TEMPERATURE,
+) -> dict:
+    """
+    带重试、超时控制和结果缓存的DeepSeek API调用。
+
+    相同请求命中缓存或与进行中的请求合并时，返回结果带 cached=True，usage 全部为0。
+
+    Args:
+        messages: OpenAI messages格式列表
+        max_tokens: 最大输出token数
+        temperature: 采样温度
+
+    Returns:
+        dict，成功时包含 result 和 usage，失败时包含 error
+    """
+    key = _cache_key(messages, max_tokens, temperature)
+    cached = _response_cache.get(key)
+    if cached is not None:
+        _response_cache.move_to_end(key)
+        return _as_cached(cached)
+
+    task = _inflight.get(key)
+    owner = task is None
+    if owner:
+        task = asyncio.ensure_future(_fetch_and_cache(key, messages, max_tokens, temperature))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+
+    # shield：某个调用方被取消时不影响共享同一请求的其他调用方
+    response = await asyncio.shield(task)
+    if "error" in response:
+        return response
+    return copy.deepcopy(response) if owner else _as_cached(response)
+
+
 def calculate_cost(usage: dict) -> dict:
     """
     根据DeepSeek定价计算本次调用成本。
@@ -183,13 +322,16 @@ def calculate_cost(usage: dict) -> dict:
     Returns:
         成本明细（单位：元）
     """
-    cache_hit_cost = usage.get("prompt_cache_hit_tokens", 0) / 1_000_000 * PRICING["cache_hit_input"]
-    cache_miss_cost = usage.get("prompt_cache_miss_tokens", 0) / 1_000_000 * PRICING["cache_miss_input"]
-    output_cost = usage.get("completion_tokens", 0) / 1_000_000 * PRICING["output"]
-    total_cost = cache_hit_cost + cache_miss_cost + output_cost
+    get = usage.get
+    input_cost = (
+        get("prompt_cache_hit_tokens", 0) * _CACHE_HIT_PRICE
+        + get("prompt_cache_miss_tokens", 0) * _CACHE_MISS_PRICE
+    )
+    output_cost = get("completion_tokens", 0) * _OUTPUT_PRICE
+    total_cost = input_cost + output_cost
 
     return {
-        "input_cost": round(cache_hit_cost + cache_miss_cost, 6),
+        "input_cost": round(input_cost, 6),
         "output_cost": round(output_cost, 6),
         "total_cost": round(total_cost, 6),
         "total_tokens": usage.get("total_tokens", 0),
@@ -1,26 +1,59 @@
 """
 diff_analyzer.py - 代码差异分析模块
 
-解析代码改动JSON文件，使用difflib进行行级精确diff对比，
+解析代码改动JSON文件，使用difflib算法进行行级精确diff对比（安装cdifflib时使用其C实现），
 提取current和history之间的差异。
 """
 
-import difflib
+import io
 import json
+import re
+from concurrent.futures import Executor
 from dataclasses import dataclass, field
-from typing import Optional
+from itertools import islice
+from typing import Iterator, Mapping, Optional, Union
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-@dataclass
+try:
+    # cdifflib 用C实现 find_longest_match，结果与 difflib 一致
+    from cdifflib import CSequenceMatcher as SequenceMatcher
+except ImportError:
+    from difflib import SequenceMatcher
+
+# package 声明：行首（允许缩进）的 "package xxx.yyy;"，分号可省略
+_PACKAGE_RE = re.compile(r"^[ \t]*package[ \t]+([\w.]+)", re.MULTILINE)
+
+
+@dataclass(slots=True)
 class DiffResult:
     """单个代码文件的diff结果"""
     package_path: str          # 包路径（从代码中提取）
     added_lines: list[str] = field(default_factory=list)    # 新增行
     removed_lines: list[str] = field(default_factory=list)  # 删除行
-    changed_lines: list[str] = field(default_factory=list)  # 变更行（unified diff格式）
-
-
-@dataclass
+    # 变更行的排列：str 为文件头/hunk头原文，正整数为连续新增行数，负整数为连续删除行数
+    _layout: list[Union[str, int]] = field(default_factory=list, repr=False)
+
+    @property
+    def changed_lines(self) -> list[str]:
+        """变更行（unified diff格式），由增删行与排列按需还原，避免重复存储"""
+        lines = []
+        added = iter(self.added_lines)
+        removed = iter(self.removed_lines)
+        for item in self._layout:
+            if isinstance(item, str):
+                lines.append(item)
+            elif item > 0:
+                lines.extend("+" + line for line in islice(added, item))
+            else:
+                lines.extend("-" + line for line in islice(removed, -item))
+        return lines
+
+
+@dataclass(slots=True)
 class AnalysisResult:
     """完整的差异分析结果"""
     diffs: list[DiffResult] = field(default_factory=list)
@@ -29,25 +62,19 @@ class AnalysisResult:
     error: Optional[str] = None
 
 
-def parse_code_changes(json_content: str) -> dict:
-    """
-    解析代码改动JSON文件。
-
-    Args:
-        json_content: JSON文件内容字符串
+def _loads_json(content: Union[str, bytes]):
+    """解析JSON，安装orjson时直接解析字符串或UTF-8字节，不做额外解码"""
+    if orjson is None:
+        return json.loads(content)
+    if isinstance(content, (bytes, bytearray)) and content.startswith(b"\xef\xbb\xbf"):
+        # orjson不接受BOM，与json.loads对字节输入的处理保持一致
+        content = content[3:]
+    return orjson.loads(content)
 
-    Returns:
-        解析后的字典，包含 current 和 history 列表
-
-    Raises:
-        ValueError: JSON格式不正确或缺少必要字段
-    """
-    try:
-        data = json.loads(json_content)
-    except json.JSONDecodeError as e:
-        raise ValueError(f"JSON解析失败: {e}")
 
-    if not isinstance(data, dict):
+def _extract_code_lists(data) -> tuple[list, list]:
+    """校验已解析的代码改动数据，返回 (current, history)"""
+    if not isinstance(data, Mapping):
         raise ValueError("JSON根元素必须是对象")
 
     # 支持直接格式和嵌套格式
@@ -65,6 +92,59 @@ def parse_code_changes(json_content: str) -> dict:
     if not isinstance(current, list) or not isinstance(history, list):
         raise ValueError("'current' 和 'history' 必须是数组")
 
+    return current, history
+
+
+def _parse_code_changes_text(json_content: Union[str, bytes, bytearray]) -> tuple[list, list]:
+    """解析JSON文本并校验，返回 (current, history)"""
+    try:
+        data = _loads_json(json_content)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"JSON解析失败: {e}")
+
+    return _extract_code_lists(data)
+
+
+def validate_code_changes(data) -> dict:
+    """
+    校验已解析的代码改动数据（如 parse_json 的返回值）。
+
+    不会把字符串当作JSON文本再次解析：已解析数据的根元素不是对象时直接报错。
+
+    Args:
+        data: 已解析的JSON数据
+
+    Returns:
+        解析后的字典，包含 current 和 history 列表
+
+    Raises:
+        ValueError: 根元素不是对象或缺少必要字段
+    """
+    current, history = _extract_code_lists(data)
+    return {"current": current, "history": history}
+
+
+def parse_code_changes(json_content: Union[str, bytes, Mapping]) -> dict:
+    """
+    解析代码改动JSON文件。
+
+    Args:
+        json_content: JSON文件内容（字符串或字节），或已解析的映射（如 parse_json 返回的只读映射）
+
+    Returns:
+        解析后的字典，包含 current 和 history 列表
+
+    Raises:
+        ValueError: JSON格式不正确、根元素不是对象或缺少必要字段
+    """
+    if isinstance(json_content, Mapping):
+        return validate_code_changes(json_content)
+
+    if not isinstance(json_content, (str, bytes, bytearray)):
+        # 其他已解析的值（数组、数字等）不能再交给JSON解码器
+        raise ValueError("JSON根元素必须是对象")
+
+    current, history = _parse_code_changes_text(json_content)
     return {"current": current, "history": history}
 
 
@@ -78,20 +158,80 @@ def extract_package_path(code: str) -> str:
     Returns:
         包路径字符串，如果未找到返回 "unknown"
     """
-    for line in code.split("\n"):
-        stripped = line.strip()
-        if stripped.startswith("package "):
-            # 提取 package xxx.yyy.zzz; 中的路径
-            path = stripped[len("package "):].rstrip(";").strip()
-            if path:
-                return path
-    return "unknown"
+    # 不限制扫描长度：文件头部可能有很长的版权注释
+    match = _PACKAGE_RE.search(code)
+    return match.group(1) if match else "unknown"
+
+
+def _format_range_unified(start: int, stop: int) -> str:
+    """按unified diff格式输出行范围（与difflib一致）"""
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return f"{beginning}"
+    if not length:
+        beginning -= 1
+    return f"{beginning},{length}"
+
+
+def _unified_diff(
+    a: list[str],
+    b: list[str],
+    fromfile: str = "",
+    tofile: str = "",
+    n: int = 3,
+) -> Iterator[str]:
+    """
+    生成unified diff行，输出与 difflib.unified_diff(..., lineterm="") 相同。
+
+    使用模块级 SequenceMatcher，安装cdifflib时由C实现加速匹配。
+
+    Args:
+        a: 原始行列表
+        b: 新行列表
+        fromfile: 原始文件名
+        tofile: 新文件名
+        n: 上下文行数
+
+    Yields:
+        diff行
+    """
+    started = False
+    for group in SequenceMatcher(None, a, b).get_grouped_opcodes(n):
+        if not started:
+            started = True
+            yield f"--- {fromfile}"
+            yield f"+++ {tofile}"
+
+        first, last = group[0], group[-1]
+        file1_range = _format_range_unified(first[1], last[2])
+        file2_range = _format_range_unified(first[3], last[4])
+        yield f"@@ -{file1_range} +{file2_range} @@"
+
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                for line in a[i1:i2]:
+                    yield " " + line
+                continue
+            if tag in ("replace", "delete"):
+                for line in a[i1:i2]:
+                    yield "-" + line
+            if tag in ("replace", "insert"):
+                for line in b[j1:j2]:
+                    yield "+" + line
+
+
+# str.splitlines 识别的行结束符，keepends=True 时只会出现在行尾
+_LINE_ENDINGS = "\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
 
 
 def compute_diff(current_code: str, history_code: str) -> DiffResult:
     """
     计算两段代码之间的行级差异。
 
+    按行比较时包含行结束符，因此CRLF与LF互换、仅增删末尾换行也会产生差异；
+    输出的增删行不含行结束符。
+
     Args:
         current_code: 当前版本代码
         history_code: 历史版本代码
@@ -101,46 +241,84 @@ def compute_diff(current_code: str, history_code: str) -> DiffResult:
     """
     package_path = extract_package_path(current_code)
 
+    # 未改动的文件很常见，直接返回空diff，不必拆分行
+    if current_code == history_code:
+        return DiffResult(package_path=package_path)
+
+    # 保留换行符参与比较，仅换行符（CRLF/LF、末尾换行）变化的行也算作改动；
+    # 行尾只在写入增删行时去掉
     current_lines = current_code.splitlines(keepends=True)
     history_lines = history_code.splitlines(keepends=True)
 
     added = []
     removed = []
-    changed = []
+    layout: list[Union[str, int]] = []
 
     # 使用 unified_diff 获取详细差异
-    diff = list(difflib.unified_diff(
+    diff = _unified_diff(
         history_lines,
         current_lines,
         fromfile="history",
         tofile="current",
-        lineterm=""
-    ))
+    )
 
+    add_added = added.append
+    add_removed = removed.append
+    add_layout = layout.append
+    # 按首字符分派，只有 "+"/"-" 开头的行才需要再区分文件头；
+    # 连续的新增/删除行在 layout 中合并为一个计数
     for line in diff:
-        if line.startswith("+++") or line.startswith("---") or line.startswith("@@"):
-            changed.append(line)
-        elif line.startswith("+"):
-            added.append(line[1:])
-            changed.append(line)
-        elif line.startswith("-"):
-            removed.append(line[1:])
-            changed.append(line)
+        if not line:
+            continue
+        first = line[0]
+        if first == "+":
+            if line.startswith("+++"):
+                add_layout(line)
+                continue
+            add_added(line[1:].rstrip(_LINE_ENDINGS))
+            if layout and type(layout[-1]) is int and layout[-1] > 0:
+                layout[-1] += 1
+            else:
+                add_layout(1)
+        elif first == "-":
+            if line.startswith("---"):
+                add_layout(line)
+                continue
+            add_removed(line[1:].rstrip(_LINE_ENDINGS))
+            if layout and type(layout[-1]) is int and layout[-1] < 0:
+                layout[-1] -= 1
+            else:
+                add_layout(-1)
+        elif first == "@":
+            add_layout(line)
 
     return DiffResult(
         package_path=package_path,
         added_lines=added,
         removed_lines=removed,
-        changed_lines=changed,
+        _layout=layout,
     )
 
 
-def analyze_code_changes(json_content: str) -> AnalysisResult:
+# 文件数达到该值时才分发到进程池，文件少时进程间传输的开销大于收益
+PARALLEL_DIFF_MIN_FILES = 4
+
+
+def _compute_diff_pair(pair: tuple[str, str]) -> DiffResult:
+    """计算 (current, history) 代码对的差异，供进程池调用"""
+    return compute_diff(pair[0], pair[1])
+
+
+def analyze_code_changes(
+    json_content: Union[str, bytes, Mapping],
+    executor: Optional[Executor] = None,
+) -> AnalysisResult:
     """
     分析代码改动JSON文件，返回完整的差异分析结果。
 
     Args:
-        json_content: 代码改动JSON文件内容
+        json_content: 代码改动JSON文件内容，或已解析的映射（跳过重复的JSON编解码）
+        executor: 可选的进程池，文件数不少于 PARALLEL_DIFF_MIN_FILES 时并行计算diff
 
     Returns:
         AnalysisResult 包含所有文件的diff结果
@@ -153,20 +331,23 @@ def analyze_code_changes(json_content: str) -> AnalysisResult:
     current_list = parsed["current"]
     history_list = parsed["history"]
 
-    diffs = []
-    total_added = 0
-    total_removed = 0
-
     # 逐对比较 current 和 history
     max_len = max(len(current_list), len(history_list))
-    for i in range(max_len):
-        current_code = current_list[i] if i < len(current_list) else ""
-        history_code = history_list[i] if i < len(history_list) else ""
+    pairs = [
+        (
+            current_list[i] if i < len(current_list) else "",
+            history_list[i] if i < len(history_list) else "",
+        )
+        for i in range(max_len)
+    ]
+
+    if executor is not None and len(pairs) >= PARALLEL_DIFF_MIN_FILES:
+        diffs = list(executor.map(_compute_diff_pair, pairs, chunksize=4))
+    else:
+        diffs = [compute_diff(current_code, history_code) for current_code, history_code in pairs]
 
-        diff_result = compute_diff(current_code, history_code)
-        diffs.append(diff_result)
-        total_added += len(diff_result.added_lines)
-        total_removed += len(diff_result.removed_lines)
+    total_added = sum(len(d.added_lines) for d in diffs)
+    total_removed = sum(len(d.removed_lines) for d in diffs)
 
     return AnalysisResult(
         diffs=diffs,
@@ -188,29 +369,32 @@ def format_diff_summary(result: AnalysisResult) -> str:
     if result.error:
         return f"分析错误: {result.error}"
 
-    lines = []
-    lines.append(f"共检测到 {len(result.diffs)} 个代码文件变更")
-    lines.append(f"总新增 {result.total_added} 行，总删除 {result.total_removed} 行")
-    lines.append("")
+    buf = io.StringIO()
+    write = buf.write
+    write(f"共检测到 {len(result.diffs)} 个代码文件变更\n")
+    write(f"总新增 {result.total_added} 行，总删除 {result.total_removed} 行\n")
 
+    # 增删行在 compute_diff 中已去掉行尾，直接写出
     for i, diff in enumerate(result.diffs, 1):
-        lines.append(f"### 文件 {i}: {diff.package_path}")
-        lines.append(f"  新增 {len(diff.added_lines)} 行, 删除 {len(diff.removed_lines)} 行")
+        write(f"\n### 文件 {i}: {diff.package_path}\n")
+        write(f"  新增 {len(diff.added_lines)} 行, 删除 {len(diff.removed_lines)} 行\n")
 
         if diff.added_lines:
-            lines.append("  新增内容:")
+            write("  新增内容:\n")
             for line in diff.added_lines[:10]:  # 限制行数避免过长
-                lines.append(f"    + {line.rstrip()}")
+                write("    + ")
+                write(line)
+                write("\n")
             if len(diff.added_lines) > 10:
-                lines.append(f"    ... 还有 {len(diff.added_lines) - 10} 行")
+                write(f"    ... 还有 {len(diff.added_lines) - 10} 行\n")
 
         if diff.removed_lines:
-            lines.append("  删除内容:")
+            write("  删除内容:\n")
             for line in diff.removed_lines[:10]:
-                lines.append(f"    - {line.rstrip()}")
+                write("    - ")
+                write(line)
+                write("\n")
             if len(diff.removed_lines) > 10:
-                lines.append(f"    ... 还有 {len(diff.removed_lines) - 10} 行")
-
-        lines.append("")
+                write(f"    ... 还有 {len(diff.removed_lines) - 10} 行\n")
 
-    return "\n".join(lines)
+    return buf.getvalue()
@@ -1,46 +1,244 @@
 """
 file_parser.py - 文件解析工具模块
 
-支持CSV、Excel(xlsx)、JSON格式文件的内存解析。
+支持CSV、Excel(xlsx)、JSON格式文件的内存解析。安装pyarrow时大CSV文件使用其C++解析器，
+安装python-calamine时Excel文件使用其Rust解析器。
 """
 
+import codecs
 import csv
+import datetime
 import io
 import json
-from typing import Union
+import re
+import zipfile
+from types import MappingProxyType
+from typing import Any, BinaryIO, Iterator, Optional, Sequence, Union
 
 from loguru import logger
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-def parse_csv(content: Union[str, bytes]) -> list[dict]:
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+try:
+    import pyarrow
+    import pyarrow.csv as pyarrow_csv
+except ImportError:
+    pyarrow = None
+    pyarrow_csv = None
+
+
+# workbook.xml 中活动工作表的序号
+_ACTIVE_TAB_RE = re.compile(rb'<(?:\w+:)?workbookView\b[^>]*\bactiveTab="(\d+)"')
+
+# 单个上传文件的默认大小上限（MB）
+MAX_UPLOAD_SIZE_MB = 10.0
+
+# 流式读取文件时的块大小
+_STREAM_CHUNK_SIZE = 64 * 1024
+
+# CSV字节内容依次尝试的编码
+_CSV_ENCODINGS = ("utf-8", "gbk")
+
+# 文件开头的BOM与BOM之后内容的编码；跳过BOM字节后直接解码，不经 utf-8-sig 等编解码器再判断
+_BOM_ENCODINGS = (
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"),
+)
+
+# 内容达到该大小时才使用pyarrow解析，小文件直接用csv模块更快
+PYARROW_CSV_MIN_BYTES = 256 * 1024
+
+
+def _read_all(content: Union[str, bytes, BinaryIO]) -> Union[str, bytes]:
+    """读取文件对象的全部内容，字符串和字节原样返回"""
+    if hasattr(content, "read"):
+        content.seek(0)
+        return content.read()
+    return content
+
+
+def _sniff_bom(head: bytes) -> tuple[Optional[str], int]:
+    """根据开头字节的BOM判断编码，返回 (编码, BOM字节数)；没有BOM时返回 (None, 0)"""
+    for bom, encoding in _BOM_ENCODINGS:
+        if head.startswith(bom):
+            return encoding, len(bom)
+    return None, 0
+
+
+def _csv_encodings(head: bytes) -> tuple[tuple[str, ...], int]:
     """
-    解析CSV文件内容。
+    CSV依次尝试的编码及需跳过的BOM字节数：有BOM时只用BOM对应的编码，
+    否则按 _CSV_ENCODINGS
+    """
+    encoding, bom_size = _sniff_bom(head)
+    if encoding is None:
+        return _CSV_ENCODINGS, 0
+    return (encoding,), bom_size
+
+
+def _skip_prefix(content: bytes, size: int) -> Union[bytes, memoryview]:
+    """跳过开头的若干字节；用memoryview切片，不复制缓冲区"""
+    return memoryview(content)[size:] if size else content
+
+
+def _peek(fileobj: BinaryIO, size: int) -> bytes:
+    """读取文件开头的若干字节，并回到文件开头"""
+    fileobj.seek(0)
+    head = fileobj.read(size)
+    fileobj.seek(0)
+    return head
+
+
+def _content_size(content: Union[bytes, BinaryIO]) -> int:
+    """获取内容字节数，文件对象通过seek计算，不读取内容"""
+    if hasattr(content, "seek"):
+        position = content.tell()
+        size = content.seek(0, io.SEEK_END)
+        content.seek(position)
+        return size
+    return len(content)
+
+
+def _iter_csv_dicts(reader) -> Iterator[dict]:
+    """
+    将csv.reader的行逐个转换为字典，行为与csv.DictReader一致。
+
+    列数与表头一致的行直接用dict(zip)构建，避免DictReader逐行的额外开销；
+    多出的列放入None键，缺失的列填充None，空行跳过。
+    """
+    for headers in reader:
+        if headers:
+            break
+    else:
+        return
+
+    width = len(headers)
+    for row in reader:
+        if not row:
+            continue
+        row_len = len(row)
+        row_dict = dict(zip(headers, row))
+        if row_len > width:
+            row_dict[None] = row[width:]
+        elif row_len < width:
+            for key in headers[row_len:]:
+                row_dict[key] = None
+        yield row_dict
+
+
+def _csv_rows_to_dicts(reader) -> list[dict]:
+    """将csv.reader的行转换为字典列表，见 _iter_csv_dicts"""
+    return list(_iter_csv_dicts(reader))
+
+
+def _pyarrow_csv_headers(header_line: str) -> Optional[list[str]]:
+    """
+    校验表头行能否交给pyarrow解析。
+
+    表头含BOM、引号、重名或空列名等pyarrow与csv模块行为可能不同的情况返回None。
+    """
+    if header_line.startswith("\ufeff") or '"' in header_line:
+        return None
+    headers = next(csv.reader([header_line]), [])
+    if not headers or "" in headers or len(set(headers)) != len(headers):
+        return None
+    return headers
+
+
+def _pyarrow_read_csv(source, headers: list[str], encoding: str = "utf8") -> Optional[list[dict]]:
+    """
+    使用pyarrow读取CSV数据源，所有列按字符串读取（空字段保持为空字符串）。
 
     Args:
-        content: CSV文件内容（字符串或字节）
+        source: pyarrow可读取的数据源（缓冲区或文件流），定位在表头行开头
+        headers: 已校验的表头
+        encoding: 数据源的字符编码，非UTF-8时由pyarrow边读边转码
 
     Returns:
-        解析后的字典列表
+        字典列表；列数不齐、解码失败等无法保证结果一致的情况返回None
+    """
+    try:
+        table = pyarrow_csv.read_csv(
+            source,
+            read_options=pyarrow_csv.ReadOptions(block_size=1 << 20, encoding=encoding),
+            parse_options=pyarrow_csv.ParseOptions(newlines_in_values=True),
+            convert_options=pyarrow_csv.ConvertOptions(
+                column_types={h: pyarrow.string() for h in headers},
+            ),
+        )
+    except (pyarrow.ArrowInvalid, UnicodeDecodeError):
+        # 列数不齐、编码不符等情况：交给csv模块按DictReader规则处理
+        return None
+
+    if table.column_names != headers:
+        return None
+    return table.to_pylist()
+
+
+def _pyarrow_csv_rows(content: str) -> Optional[list[dict]]:
+    """
+    使用pyarrow的C++ CSV解析器解析，结果与 _csv_rows_to_dicts 一致。
 
-    Raises:
-        ValueError: CSV格式无效
+    Args:
+        content: 已解码的CSV文本
+
+    Returns:
+        字典列表，无法保证结果一致时返回None
     """
-    if isinstance(content, bytes):
-        # 尝试多种编码
-        for encoding in ["utf-8", "gbk", "gb2312", "utf-8-sig"]:
-            try:
-                content = content.decode(encoding)
-                break
-            except UnicodeDecodeError:
-                continue
-        else:
-            raise ValueError("无法识别CSV文件编码，请使用UTF-8编码")
+    if pyarrow_csv is None:
+        return None
+
+    header_end = content.find("\n")
+    headers = _pyarrow_csv_headers(content if header_end < 0 else content[:header_end])
+    if headers is None:
+        return None
+    return _pyarrow_read_csv(pyarrow.BufferReader(content.encode("utf-8")), headers)
+
+
+def _pyarrow_csv_stream_rows(fileobj: BinaryIO, encoding: str, bom_size: int) -> Optional[list[dict]]:
+    """
+    把二进制文件流直接交给pyarrow解析，不在内存中读入整份字节或文本。
+
+    Args:
+        fileobj: 可seek的二进制文件对象
+        encoding: 按该编码解码文件内容
+        bom_size: 文件开头需跳过的BOM字节数
+
+    Returns:
+        字典列表，表头无法按该编码解码或结果无法保证一致时返回None
+    """
+    fileobj.seek(bom_size)
+    try:
+        header_line = fileobj.readline().decode(encoding)
+    except UnicodeDecodeError:
+        return None
+    headers = _pyarrow_csv_headers(header_line[:-1] if header_line.endswith("\n") else header_line)
+    if headers is None:
+        return None
 
+    fileobj.seek(bom_size)
+    return _pyarrow_read_csv(pyarrow.PythonFile(fileobj, mode="r"), headers, encoding)
+
+
+def _parse_csv_text(content: str) -> list[dict]:
+    """解析已解码的CSV文本"""
     if not content.strip():
         raise ValueError("CSV文件内容为空")
 
-    reader = csv.DictReader(io.StringIO(content))
-    rows = list(reader)
+    rows = None
+    if len(content) >= PYARROW_CSV_MIN_BYTES:
+        rows = _pyarrow_csv_rows(content)
+    if rows is None:
+        rows = _csv_rows_to_dicts(csv.reader(io.StringIO(content)))
 
     if not rows:
         raise ValueError("CSV文件没有数据行")
@@ -48,36 +246,191 @@ def parse_csv(content: Union[str, bytes]) -> list[dict]:
     return rows
 
 
-def parse_excel(content: bytes) -> list[dict]:
+def parse_csv_stream(fileobj: BinaryIO) -> list[dict]:
     """
-    解析Excel(xlsx)文件内容。
+    从二进制文件对象流式解析CSV，边解码边解析，不在内存中同时保留整份字节与文本。
+
+    文件以BOM开头时直接使用对应编码（UTF-8/UTF-16），否则按 _CSV_ENCODINGS
+    依次尝试，解码失败时回到文件开头换下一种编码。安装pyarrow且文件较大时直接把文件流交给
+    pyarrow解析，pyarrow无法保证结果一致时仍按上述方式流式解析。
 
     Args:
-        content: Excel文件的字节内容
+        fileobj: 可seek的二进制文件对象（如 UploadFile.file）
 
     Returns:
         解析后的字典列表
 
     Raises:
-        ValueError: Excel格式无效
-        ImportError: openpyxl未安装
+        ValueError: CSV格式无效
+    """
+    use_pyarrow = pyarrow_csv is not None and _content_size(fileobj) >= PYARROW_CSV_MIN_BYTES
+    encodings, bom_size = _csv_encodings(_peek(fileobj, 4))
+    for encoding in encodings:
+        if use_pyarrow:
+            rows = _pyarrow_csv_stream_rows(fileobj, encoding, bom_size)
+            if rows:
+                return rows
+        fileobj.seek(bom_size)
+        text = io.TextIOWrapper(fileobj, encoding=encoding, newline="")
+        try:
+            rows = _csv_rows_to_dicts(csv.reader(text))
+        except UnicodeDecodeError:
+            continue
+        finally:
+            # 解除包装，避免回收 TextIOWrapper 时关闭底层文件
+            text.detach()
+
+        if not rows:
+            fileobj.seek(bom_size)
+            if not fileobj.read().decode(encoding).strip():
+                raise ValueError("CSV文件内容为空")
+            raise ValueError("CSV文件没有数据行")
+        return rows
+
+    raise ValueError("无法识别CSV文件编码，请使用UTF-8编码")
+
+
+def parse_csv(content: Union[str, bytes, BinaryIO]) -> list[dict]:
     """
+    解析CSV文件内容。
+
+    字节与文件对象经 parse_csv_stream 流式解析，字符串直接解析。
+
+    Args:
+        content: CSV文件内容（字符串、字节或二进制文件对象）
+
+    Returns:
+        解析后的字典列表
+
+    Raises:
+        ValueError: CSV格式无效
+    """
+    if hasattr(content, "read"):
+        return parse_csv_stream(content)
+    if isinstance(content, bytes):
+        # BytesIO 与原字节共享缓冲区，不复制
+        return parse_csv_stream(io.BytesIO(content))
+    return _parse_csv_text(content)
+
+
+def _detect_csv_encoding(fileobj: BinaryIO) -> tuple[str, int]:
+    """
+    按 _csv_encodings 找出能完整解码文件的编码，返回 (编码, BOM字节数)。
+
+    用增量解码器分块扫描，不保留解码结果，内存占用与文件大小无关。
+    """
+    encodings, bom_size = _csv_encodings(_peek(fileobj, 4))
+    for encoding in encodings:
+        fileobj.seek(bom_size)
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            for chunk in iter(lambda: fileobj.read(_STREAM_CHUNK_SIZE), b""):
+                decoder.decode(chunk)
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            continue
+        return encoding, bom_size
+    raise ValueError("无法识别CSV文件编码，请使用UTF-8编码")
+
+
+def iter_csv(content: Union[str, bytes, BinaryIO]) -> Iterator[dict]:
+    """
+    逐行解析CSV文件内容，按需产出字典，行为与 parse_csv 一致。
+
+    字节与文件对象先整体扫描确定编码，再边解码边产出，内存占用与行数无关。
+    空文件或没有数据行时在迭代结束时抛出异常。
+
+    Args:
+        content: CSV文件内容（字符串、字节或二进制文件对象）
+
+    Yields:
+        每个数据行的字典
+
+    Raises:
+        ValueError: CSV格式无效
+    """
+    if isinstance(content, str):
+        text = io.StringIO(content)
+        wrapper = None
+    else:
+        fileobj = content if hasattr(content, "read") else io.BytesIO(content)
+        encoding, bom_size = _detect_csv_encoding(fileobj)
+        fileobj.seek(bom_size)
+        text = wrapper = io.TextIOWrapper(fileobj, encoding=encoding, newline="")
+
+    reader = csv.reader(text)
+    count = 0
     try:
-        from openpyxl import load_workbook
-    except ImportError:
-        raise ImportError("openpyxl库未安装，无法解析Excel文件")
+        for row in _iter_csv_dicts(reader):
+            count += 1
+            yield row
+    finally:
+        if wrapper is not None:
+            wrapper.detach()
+
+    if not count:
+        # 没读到任何行即为空文件
+        raise ValueError("CSV文件没有数据行" if reader.line_num else "CSV文件内容为空")
 
+
+def _excel_active_sheet_index(source: BinaryIO) -> int:
+    """从xlsx的workbook.xml读取活动工作表序号，读取失败（如xls）时返回0"""
+    try:
+        with zipfile.ZipFile(source) as archive:
+            workbook_xml = archive.read("xl/workbook.xml")
+    except (zipfile.BadZipFile, KeyError):
+        return 0
+    finally:
+        source.seek(0)
+    match = _ACTIVE_TAB_RE.search(workbook_xml)
+    return int(match.group(1)) if match else 0
+
+
+def _calamine_value(value):
+    """将calamine单元格值对齐为openpyxl的类型：整数值的浮点数转int，日期转datetime"""
+    if type(value) is float and value.is_integer():
+        return int(value)
+    if type(value) is datetime.date:
+        return datetime.datetime.combine(value, datetime.time())
+    return value
+
+
+def _calamine_rows(source: BinaryIO) -> Optional[list[list]]:
+    """
+    使用python-calamine（Rust实现）读取活动工作表的全部行。
+
+    Args:
+        source: Excel二进制文件对象
+
+    Returns:
+        行列表（值已对齐为openpyxl的类型），未安装或解析失败时返回None
+    """
+    if CalamineWorkbook is None:
+        return None
     try:
-        wb = load_workbook(filename=io.BytesIO(content), read_only=True)
+        sheet_index = _excel_active_sheet_index(source)
+        workbook = CalamineWorkbook.from_filelike(source)
+        sheet = workbook.get_sheet_by_index(sheet_index)
+        rows = sheet.to_python(skip_empty_area=False)
     except Exception as e:
-        raise ValueError(f"Excel文件格式无效: {e}")
+        # 交给openpyxl解析并给出错误信息
+        logger.warning(f"calamine解析Excel失败，改用openpyxl: {e}")
+        source.seek(0)
+        return None
+    return [[_calamine_value(v) for v in row] for row in rows]
 
-    ws = wb.active
-    if ws is None:
-        raise ValueError("Excel文件没有活动工作表")
 
-    rows_iter = ws.iter_rows(values_only=True)
+def _excel_cell_text(value) -> str:
+    """单元格值转文本：None为空串，只有字符串需要去空白（数值、日期的str()不含首尾空白）"""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value.strip()
+    return str(value)
 
+
+def _iter_excel_dicts(rows_iter: Iterator[Sequence]) -> Iterator[dict]:
+    """将工作表的行逐个转换为字典，第一行为表头，跳过全空行"""
     # 第一行作为表头
     try:
         headers = next(rows_iter)
@@ -86,51 +439,150 @@ def parse_excel(content: bytes) -> list[dict]:
 
     headers = [str(h).strip() if h else f"col_{i}" for i, h in enumerate(headers)]
 
-    rows = []
+    n_headers = len(headers)
+    count = 0
     for row in rows_iter:
-        row_dict = {}
-        for i, value in enumerate(row):
-            if i < len(headers):
-                row_dict[headers[i]] = str(value).strip() if value is not None else ""
-        if any(v for v in row_dict.values()):  # 跳过全空行
-            rows.append(row_dict)
+        # 超出表头的列忽略
+        cells = row[:n_headers]
+        # 先在原始单元格上判断全空行（xlsx末尾常有大量空行），避免构建字典
+        if all(v is None or (type(v) is str and not v.strip()) for v in cells):
+            continue
+        count += 1
+        yield dict(zip(headers, map(_excel_cell_text, cells)))
+
+    if not count:
+        raise ValueError("Excel文件没有数据行")
 
-    wb.close()
 
-    if not rows:
-        raise ValueError("Excel文件没有数据行")
+def _iter_excel_rows(content: Union[bytes, BinaryIO]) -> Iterator[Sequence]:
+    """
+    逐行读取活动工作表。
 
-    return rows
+    安装python-calamine时优先使用其解析（同时支持xls），否则使用openpyxl（仅xlsx）。
+    """
+    if hasattr(content, "read"):
+        content.seek(0)
+        source = content
+    else:
+        source = io.BytesIO(content)
+
+    calamine_rows = _calamine_rows(source)
+    if calamine_rows is not None:
+        yield from calamine_rows
+        return
+
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportError("openpyxl库未安装，无法解析Excel文件")
+
+    try:
+        # data_only 读取公式的缓存值而非公式文本；不加载外部链接
+        wb = load_workbook(filename=source, read_only=True, data_only=True, keep_links=False)
+    except Exception as e:
+        raise ValueError(f"Excel文件格式无效: {e}")
+
+    try:
+        ws = wb.active
+        if ws is None:
+            raise ValueError("Excel文件没有活动工作表")
+        yield from ws.iter_rows(values_only=True)
+    finally:
+        wb.close()
 
 
-def parse_json(content: Union[str, bytes]) -> dict:
+def parse_excel(content: Union[bytes, BinaryIO]) -> list[dict]:
+    """
+    解析Excel文件内容。
+
+    安装python-calamine时优先使用其解析（同时支持xls），否则使用openpyxl（仅xlsx）。
+
+    Args:
+        content: Excel文件的字节内容或二进制文件对象（直接读取，不复制）
+
+    Returns:
+        解析后的字典列表
+
+    Raises:
+        ValueError: Excel格式无效
+        ImportError: 未安装python-calamine且openpyxl未安装
+    """
+    return list(_iter_excel_dicts(_iter_excel_rows(content)))
+
+
+def iter_excel(content: Union[bytes, BinaryIO]) -> Iterator[dict]:
+    """
+    逐行解析Excel文件内容，按需产出字典，行为与 parse_excel 一致。
+
+    使用openpyxl时工作簿在迭代结束（或生成器关闭）后才关闭。
+
+    Args:
+        content: Excel文件的字节内容或二进制文件对象
+
+    Yields:
+        每个数据行的字典
+
+    Raises:
+        ValueError: Excel格式无效
+        ImportError: 未安装python-calamine且openpyxl未安装
+    """
+    return _iter_excel_dicts(_iter_excel_rows(content))
+
+
+def _read_only(data):
+    """顶层为对象时包装为只读映射（浅层只读），其他类型原样返回"""
+    return MappingProxyType(data) if isinstance(data, dict) else data
+
+
+def parse_json(content: Union[str, bytes, BinaryIO]) -> Any:
     """
     解析JSON文件内容。
 
+    字节内容以BOM开头时直接按对应编码（UTF-8/UTF-16）解码。
+    顶层对象以 types.MappingProxyType 只读返回，可在多处安全共用同一解析结果；
+    顶层为数组、字符串、数字等其他JSON值时原样返回，由调用方校验类型。
+
     Args:
-        content: JSON文件内容（字符串或字节）
+        content: JSON文件内容（字符串、字节或二进制文件对象）
 
     Returns:
-        解析后的字典
+        顶层为对象时返回只读映射（Mapping），否则返回解析出的 list/str/int/float/bool/None
 
     Raises:
         ValueError: JSON格式无效
     """
+    content = _read_all(content)
     if isinstance(content, bytes):
-        try:
-            content = content.decode("utf-8")
-        except UnicodeDecodeError:
-            content = content.decode("utf-8-sig")
+        encoding, bom_size = _sniff_bom(content[:4])
+        encoding = encoding or "utf-8"
+        body = _skip_prefix(content, bom_size)
+        if encoding == "utf-8" and orjson is not None:
+            # orjson 直接解析UTF-8字节（含跳过BOM后的视图），省去解码出的中间字符串；
+            # 失败（空内容、非法JSON）时走下面的解码路径给出对应错误
+            try:
+                return _read_only(orjson.loads(body))
+            except orjson.JSONDecodeError:
+                pass
+        content = str(body, encoding)
 
     if not content.strip():
         raise ValueError("JSON文件内容为空")
 
     try:
-        data = json.loads(content)
+        data = orjson.loads(content) if orjson is not None else json.loads(content)
     except json.JSONDecodeError as e:
         raise ValueError(f"JSON格式无效: {e}")
 
-    return data
+    return _read_only(data)
+
+
+# 扩展名（小写、不含点）到文件类型的映射
+_EXTENSION_FILE_TYPES = {
+    "csv": "csv",
+    "xlsx": "excel",
+    "xls": "excel",
+    "json": "json",
+}
 
 
 def detect_file_type(filename: str) -> str:
@@ -143,31 +595,36 @@ def detect_file_type(filename: str) -> str:
     Returns:
         文件类型: "csv", "excel", "json", "unknown"
     """
-    name_lower = filename.lower()
-    if name_lower.endswith(".csv"):
-        return "csv"
-    elif name_lower.endswith((".xlsx", ".xls")):
-        return "excel"
-    elif name_lower.endswith(".json"):
-        return "json"
-    else:
+    # 与 endswith 判断一致：".csv" 这类只有扩展名的文件名也能识别
+    _, dot, ext = filename.rpartition(".")
+    if not dot:
         return "unknown"
+    return _EXTENSION_FILE_TYPES.get(ext.lower(), "unknown")
 
 
-def validate_file(filename: str, content: bytes, allowed_types: list[str], max_size_mb: float = 10.0) -> str:
+def validate_file(
+    filename: str,
+    content: Union[bytes, BinaryIO],
+    allowed_types: list[str],
+    max_size_mb: float = MAX_UPLOAD_SIZE_MB,
+) -> str:
     """
     校验上传文件的类型和大小。
 
     Args:
         filename: 文件名
-        content: 文件内容字节
+        content: 文件内容字节或二进制文件对象
         allowed_types: 允许的文件类型列表 ["csv", "excel", "json"]
         max_size_mb: 最大文件大小（MB）
 
     Returns:
-        错误信息，为空字符串则表示校验通过
-
+        错误信息，为空字符串则表示校验通过。大小最先检查，超限文件直接返回，
+        不再判断类型。
     """
+    size = _content_size(content)
+    if size > max_size_mb * 1024 * 1024:
+        return f"文件过大 ({size / (1024 * 1024):.1f}MB)，最大允许 {max_size_mb}MB"
+
     file_type = detect_file_type(filename)
     if file_type == "unknown":
         return f"不支持的文件格式: {filename}，请上传 {', '.join(allowed_types)} 格式文件"
@@ -175,8 +632,44 @@ def validate_file(filename: str, content: bytes, allowed_types: list[str], max_s
     if file_type not in allowed_types:
         return f"该接口不支持 {file_type} 格式，请上传 {', '.join(allowed_types)} 格式文件"
 
-    size_mb = len(content) / (1024 * 1024)
-    if size_mb > max_size_mb:
-        return f"文件过大 ({size_mb:.1f}MB)，最大允许 {max_size_mb}MB"
-
     return ""
+
+
+_PARSERS = {
+    "csv": parse_csv,
+    "excel": parse_excel,
+    "json": parse_json,
+}
+
+
+def validate_and_parse(
+    filename: str,
+    content: Union[bytes, BinaryIO],
+    allowed_types: list[str],
+    max_size_mb: float = MAX_UPLOAD_SIZE_MB,
+) -> tuple[str, Any]:
+    """
+    校验上传文件并按类型解析。
+
+    校验只检查文件名和大小，不读取内容，解析时直接使用同一个文件对象。
+
+    Args:
+        filename: 文件名
+        content: 文件内容字节或二进制文件对象
+        allowed_types: 允许的文件类型列表 ["csv", "excel", "json"]
+        max_size_mb: 最大文件大小（MB）
+
+    Returns:
+        (文件类型, 解析结果)，CSV/Excel为字典列表，JSON为 parse_json 的返回值
+        （顶层为对象时是只读映射，否则为数组等原始JSON值）
+
+    Raises:
+        ValueError: 校验失败或文件内容无效
+        ImportError: 解析Excel时openpyxl未安装
+    """
+    err = validate_file(filename, content, allowed_types, max_size_mb)
+    if err:
+        raise ValueError(err)
+
+    file_type = detect_file_type(filename)
+    return file_type, _PARSERS[file_type](content)
@@ -8,8 +8,10 @@ scoring_model.py - 测试用例量化评分模型
 - 边界用例（10%）：异常场景、边界条件覆盖情况
 """
 
+import re
 from dataclasses import dataclass, field
-from typing import Optional
+from functools import lru_cache
+from typing import Iterable, Optional
 
 
 # 权重配置
@@ -20,6 +22,50 @@ WEIGHTS = {
     "boundary": 0.10,
 }
 
+# 权重的整数百分比，加权分按整数（百分之一分）计算，求总分时没有浮点累积误差
+_WEIGHT_PERCENT = {key: round(weight * 100) for key, weight in WEIGHTS.items()}
+
+# 步骤编号格式："1." "1、" "1)" 与 "步骤1"，取两者中匹配数较多的一种
+_STEP_NUMBER_PATTERNS = (
+    re.compile(r'\d+[\.\、\)]'),
+    re.compile(r'步骤\d+'),
+)
+# 无编号时按换行/分号分割步骤
+_STEP_SEPARATORS = str.maketrans({";": "\n", "；": "\n"})
+
+# 步骤中的操作动词
+_ACTION_WORDS = ("输入", "点击", "选择", "验证", "检查", "打开", "提交", "确认", "修改", "删除")
+
+# 预期结果中的可验证关键词
+_VERIFY_WORDS = ("成功", "失败", "显示", "包含", "等于", "不为空",
+                 "返回", "跳转", "提示", "错误", "正确", "存在")
+
+# 异常/边界相关关键词
+_BOUNDARY_WORDS = ("异常", "边界", "空", "null", "为空", "不存在", "超长",
+                   "超时", "重复", "并发", "负数", "最大", "最小", "特殊字符",
+                   "无效", "非法", "错误", "失败")
+
+
+def _keyword_pattern(words: tuple[str, ...], overlapping: bool = False) -> re.Pattern:
+    """
+    将关键词编译为一个交替正则，由正则引擎单次扫描文本。
+
+    overlapping 为真时用零宽前瞻包裹，findall 可取出互相重叠的关键词（按首字符位置计）。
+    """
+    alternation = "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+    return re.compile(f"(?=({alternation}))" if overlapping else alternation)
+
+
+_ACTION_RE = _keyword_pattern(_ACTION_WORDS)
+# 预期结果按命中的不同关键词数评分；各关键词首字不同，前瞻可取到全部命中
+_VERIFY_RE = _keyword_pattern(_VERIFY_WORDS, overlapping=True)
+# 单字边界关键词先用 in 判断；已包含单字关键词的多字词（如"为空"）不必再进正则
+_BOUNDARY_CHARS = frozenset(w for w in _BOUNDARY_WORDS if len(w) == 1)
+_BOUNDARY_RE = _keyword_pattern(tuple(
+    w for w in _BOUNDARY_WORDS
+    if len(w) > 1 and not any(c in w for c in _BOUNDARY_CHARS)
+))
+
 
 @dataclass
 class DimensionScore:
@@ -63,138 +109,224 @@ def score_coverage(
         raw_score = min(100.0, rate * 100)
         detail = f"覆盖率 {covered_count}/{total_changed_methods} = {rate:.1%}"
 
-    weighted = raw_score * WEIGHTS["coverage"]
+    weighted = _weighted_hundredths(raw_score, "coverage") / 100
     return DimensionScore(
         dimension="覆盖范围",
         score=round(raw_score, 1),
         weight=WEIGHTS["coverage"],
-        weighted_score=round(weighted, 2),
+        weighted_score=weighted,
         details=detail,
     )
 
 
-def score_completeness(test_cases: list[dict]) -> DimensionScore:
-    """
-    评估测试步骤完整性。
+def _weighted_hundredths(raw_score: float, weight_key: str) -> int:
+    """原始分乘以权重，单位为百分之一分的整数"""
+    return round(raw_score * _WEIGHT_PERCENT[weight_key])
 
-    检查每个测试用例是否包含：
-    - 测试步骤描述
-    - 多个步骤（至少2步）
-    - 步骤中包含数据/操作描述
 
-    Args:
-        test_cases: 测试用例字典列表
+def _case_fields(tc: dict) -> tuple[str, str, str]:
+    """取出测试用例的 (测试功能, 测试步骤, 预期结果)，支持中英文字段名"""
+    return (
+        tc.get("test_function", tc.get("测试功能", "")),
+        tc.get("test_steps", tc.get("测试步骤", "")),
+        tc.get("expected_result", tc.get("预期结果", "")),
+    )
 
-    Returns:
-        DimensionScore
-    """
-    if not test_cases:
-        return DimensionScore(
-            dimension="步骤完整性",
-            score=0.0,
-            weight=WEIGHTS["completeness"],
-            weighted_score=0.0,
-            details="无测试用例",
-        )
 
-    total_score = 0.0
-    for tc in test_cases:
-        steps = tc.get("test_steps", tc.get("测试步骤", ""))
-        case_score = 0.0
+# 用例步骤/预期结果常按模板填写、大量重复，按文本缓存单用例得分
+_CASE_SCORE_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=_CASE_SCORE_CACHE_SIZE)
+def _completeness_case_score(steps: str) -> float:
+    """单个用例的步骤完整性得分"""
+    case_score = 0.0
+
+    if steps:
+        case_score += 30  # 有步骤描述
+
+        # 检查步骤数量
+        step_count = _count_steps(steps)
+        if step_count >= 3:
+            case_score += 40
+        elif step_count >= 2:
+            case_score += 25
+        elif step_count >= 1:
+            case_score += 10
+
+        # 检查步骤细节（包含操作动词）
+        has_action = _ACTION_RE.search(steps) is not None
+        if has_action:
+            case_score += 30
+
+    return case_score
+
+
+@lru_cache(maxsize=_CASE_SCORE_CACHE_SIZE)
+def _clarity_case_score(expected: str) -> float:
+    """单个用例的预期结果明确性得分"""
+    case_score = 0.0
+
+    if expected:
+        case_score += 40  # 有预期结果描述
+
+        # 检查是否有可验证关键词
+        matches = len(set(_VERIFY_RE.findall(expected)))
+        if matches >= 2:
+            case_score += 40
+        elif matches >= 1:
+            case_score += 25
 
-        if steps:
-            case_score += 30  # 有步骤描述
+        # 检查描述长度（过短不够明确）
+        if len(expected) >= 10:
+            case_score += 20
+        elif len(expected) >= 5:
+            case_score += 10
 
-            # 检查步骤数量
-            step_count = _count_steps(steps)
-            if step_count >= 3:
-                case_score += 40
-            elif step_count >= 2:
-                case_score += 25
-            elif step_count >= 1:
-                case_score += 10
+    return case_score
 
-            # 检查步骤细节（包含操作动词）
-            action_words = ["输入", "点击", "选择", "验证", "检查", "打开", "提交", "确认", "修改", "删除"]
-            has_action = any(w in steps for w in action_words)
-            if has_action:
-                case_score += 30
 
-        total_score += case_score
+def _is_boundary_case(func: str, steps: str, expected: str) -> bool:
+    """用例是否涉及异常/边界场景"""
+    # 关键词不含空格，不会跨字段命中，逐字段判断即可，无需拼接文本
+    for text in (func, steps, expected):
+        text = text or ""
+        if any(c in text for c in _BOUNDARY_CHARS) or _BOUNDARY_RE.search(text) is not None:
+            return True
+    return False
 
-    avg_score = total_score / len(test_cases)
-    weighted = avg_score * WEIGHTS["completeness"]
+
+def _empty_dimension(dimension: str, weight_key: str) -> DimensionScore:
+    """无测试用例时的维度评分"""
+    return DimensionScore(
+        dimension=dimension,
+        score=0.0,
+        weight=WEIGHTS[weight_key],
+        weighted_score=0.0,
+        details="无测试用例",
+    )
+
+
+def _completeness_dimension(total_score: float, case_count: int) -> DimensionScore:
+    """由各用例得分之和构建步骤完整性维度"""
+    avg_score = total_score / case_count
+    weighted = _weighted_hundredths(avg_score, "completeness") / 100
 
     return DimensionScore(
         dimension="步骤完整性",
         score=round(avg_score, 1),
         weight=WEIGHTS["completeness"],
-        weighted_score=round(weighted, 2),
-        details=f"平均步骤质量 {avg_score:.1f}/100 ({len(test_cases)}个用例)",
+        weighted_score=weighted,
+        details=f"平均步骤质量 {avg_score:.1f}/100 ({case_count}个用例)",
+    )
+
+
+def _clarity_dimension(total_score: float, case_count: int) -> DimensionScore:
+    """由各用例得分之和构建预期结果明确性维度"""
+    avg_score = total_score / case_count
+    weighted = _weighted_hundredths(avg_score, "clarity") / 100
+
+    return DimensionScore(
+        dimension="预期结果明确性",
+        score=round(avg_score, 1),
+        weight=WEIGHTS["clarity"],
+        weighted_score=weighted,
+        details=f"平均预期结果质量 {avg_score:.1f}/100 ({case_count}个用例)",
+    )
+
+
+def _boundary_dimension(boundary_count: int, case_count: int, total_changed_methods: int) -> DimensionScore:
+    """由边界用例数构建边界用例维度"""
+    # 评分逻辑
+    raw_score = 0.0
+
+    # 边界用例占比
+    boundary_ratio = boundary_count / case_count
+    if boundary_ratio >= 0.3:
+        raw_score += 50
+    elif boundary_ratio >= 0.15:
+        raw_score += 30
+    elif boundary_count >= 1:
+        raw_score += 15
+
+    # 用例数量与方法数比例（理想：每个方法至少2-3个测试用例）
+    if total_changed_methods > 0:
+        ratio = case_count / total_changed_methods
+        if ratio >= 3:
+            raw_score += 50
+        elif ratio >= 2:
+            raw_score += 35
+        elif ratio >= 1:
+            raw_score += 20
+        else:
+            raw_score += 10
+    else:
+        raw_score += 25  # 无改动方法，给基础分
+
+    raw_score = min(100.0, raw_score)
+    weighted = _weighted_hundredths(raw_score, "boundary") / 100
+
+    return DimensionScore(
+        dimension="边界用例",
+        score=round(raw_score, 1),
+        weight=WEIGHTS["boundary"],
+        weighted_score=weighted,
+        details=f"边界用例 {boundary_count}/{case_count}, 用例/方法比 {case_count}/{total_changed_methods}",
     )
 
 
-def score_clarity(test_cases: list[dict]) -> DimensionScore:
+def score_completeness(test_cases: Iterable[dict]) -> DimensionScore:
     """
-    评估预期结果明确性。
+    评估测试步骤完整性。
 
-    检查每个测试用例是否有：
-    - 明确的预期结果描述
-    - 包含可验证的关键词（成功/失败/显示/包含等）
+    检查每个测试用例是否包含：
+    - 测试步骤描述
+    - 多个步骤（至少2步）
+    - 步骤中包含数据/操作描述
 
     Args:
-        test_cases: 测试用例字典列表
+        test_cases: 测试用例字典的可迭代对象（只遍历一次，可为生成器）
 
     Returns:
         DimensionScore
     """
-    if not test_cases:
-        return DimensionScore(
-            dimension="预期结果明确性",
-            score=0.0,
-            weight=WEIGHTS["clarity"],
-            weighted_score=0.0,
-            details="无测试用例",
-        )
-
     total_score = 0.0
+    case_count = 0
     for tc in test_cases:
-        expected = tc.get("expected_result", tc.get("预期结果", ""))
-        case_score = 0.0
+        total_score += _completeness_case_score(tc.get("test_steps", tc.get("测试步骤", "")))
+        case_count += 1
 
-        if expected:
-            case_score += 40  # 有预期结果描述
+    if not case_count:
+        return _empty_dimension("步骤完整性", "completeness")
+    return _completeness_dimension(total_score, case_count)
 
-            # 检查是否有可验证关键词
-            verify_words = ["成功", "失败", "显示", "包含", "等于", "不为空",
-                           "返回", "跳转", "提示", "错误", "正确", "存在"]
-            matches = sum(1 for w in verify_words if w in expected)
-            if matches >= 2:
-                case_score += 40
-            elif matches >= 1:
-                case_score += 25
 
-            # 检查描述长度（过短不够明确）
-            if len(expected) >= 10:
-                case_score += 20
-            elif len(expected) >= 5:
-                case_score += 10
+def score_clarity(test_cases: Iterable[dict]) -> DimensionScore:
+    """
+    评估预期结果明确性。
+
+    检查每个测试用例是否有：
+    - 明确的预期结果描述
+    - 包含可验证的关键词（成功/失败/显示/包含等）
 
-        total_score += case_score
+    Args:
+        test_cases: 测试用例字典的可迭代对象（只遍历一次，可为生成器）
 
-    avg_score = total_score / len(test_cases)
-    weighted = avg_score * WEIGHTS["clarity"]
+    Returns:
+        DimensionScore
+    """
+    total_score = 0.0
+    case_count = 0
+    for tc in test_cases:
+        total_score += _clarity_case_score(tc.get("expected_result", tc.get("预期结果", "")))
+        case_count += 1
 
-    return DimensionScore(
-        dimension="预期结果明确性",
-        score=round(avg_score, 1),
-        weight=WEIGHTS["clarity"],
-        weighted_score=round(weighted, 2),
-        details=f"平均预期结果质量 {avg_score:.1f}/100 ({len(test_cases)}个用例)",
-    )
+    if not case_count:
+        return _empty_dimension("预期结果明确性", "clarity")
+    return _clarity_dimension(total_score, case_count)
 
 
-def score_boundary(test_cases: list[dict], total_changed_methods: int) -> DimensionScore:
+def score_boundary(test_cases: Iterable[dict], total_changed_methods: int) -> DimensionScore:
     """
     评估边界用例覆盖。
 
@@ -204,79 +336,69 @@ def score_boundary(test_cases: list[dict], total_changed_methods: int) -> Dimens
     - 用例数量与改动方法数的比例
 
     Args:
-        test_cases: 测试用例字典列表
+        test_cases: 测试用例字典的可迭代对象（只遍历一次，可为生成器）
         total_changed_methods: 改动方法总数
 
     Returns:
         DimensionScore
     """
-    if not test_cases:
-        return DimensionScore(
-            dimension="边界用例",
-            score=0.0,
-            weight=WEIGHTS["boundary"],
-            weighted_score=0.0,
-            details="无测试用例",
-        )
-
-    # 检查异常/边界相关关键词
-    boundary_words = ["异常", "边界", "空", "null", "为空", "不存在", "超长",
-                      "超时", "重复", "并发", "负数", "最大", "最小", "特殊字符",
-                      "无效", "非法", "错误", "失败"]
-
     boundary_count = 0
+    case_count = 0
     for tc in test_cases:
-        func = tc.get("test_function", tc.get("测试功能", ""))
-        steps = tc.get("test_steps", tc.get("测试步骤", ""))
-        expected = tc.get("expected_result", tc.get("预期结果", ""))
-        combined = f"{func} {steps} {expected}"
-
-        if any(w in combined for w in boundary_words):
+        if _is_boundary_case(*_case_fields(tc)):
             boundary_count += 1
+        case_count += 1
 
-    # 评分逻辑
-    raw_score = 0.0
+    if not case_count:
+        return _empty_dimension("边界用例", "boundary")
+    return _boundary_dimension(boundary_count, case_count, total_changed_methods)
 
-    # 边界用例占比
-    if test_cases:
-        boundary_ratio = boundary_count / len(test_cases)
-        if boundary_ratio >= 0.3:
-            raw_score += 50
-        elif boundary_ratio >= 0.15:
-            raw_score += 30
-        elif boundary_count >= 1:
-            raw_score += 15
 
-    # 用例数量与方法数比例（理想：每个方法至少2-3个测试用例）
-    if total_changed_methods > 0:
-        ratio = len(test_cases) / total_changed_methods
-        if ratio >= 3:
-            raw_score += 50
-        elif ratio >= 2:
-            raw_score += 35
-        elif ratio >= 1:
-            raw_score += 20
-        else:
-            raw_score += 10
-    else:
-        raw_score += 25  # 无改动方法，给基础分
+def _score_case_dimensions(
+    test_cases: Iterable[dict],
+    total_changed_methods: int,
+) -> tuple[DimensionScore, DimensionScore, DimensionScore]:
+    """
+    单次遍历测试用例，同时计算步骤完整性、预期结果明确性和边界用例三个维度。
 
-    raw_score = min(100.0, raw_score)
-    weighted = raw_score * WEIGHTS["boundary"]
+    结果与分别调用 score_completeness / score_clarity / score_boundary 相同。
 
-    return DimensionScore(
-        dimension="边界用例",
-        score=round(raw_score, 1),
-        weight=WEIGHTS["boundary"],
-        weighted_score=round(weighted, 2),
-        details=f"边界用例 {boundary_count}/{len(test_cases)}, 用例/方法比 {len(test_cases)}/{total_changed_methods}",
+    Args:
+        test_cases: 测试用例字典的可迭代对象（只遍历一次，可为生成器）
+        total_changed_methods: 改动方法总数
+
+    Returns:
+        (步骤完整性, 预期结果明确性, 边界用例)
+    """
+    completeness_total = 0.0
+    clarity_total = 0.0
+    boundary_count = 0
+    case_count = 0
+    for tc in test_cases:
+        func, steps, expected = _case_fields(tc)
+        completeness_total += _completeness_case_score(steps)
+        clarity_total += _clarity_case_score(expected)
+        if _is_boundary_case(func, steps, expected):
+            boundary_count += 1
+        case_count += 1
+
+    if not case_count:
+        return (
+            _empty_dimension("步骤完整性", "completeness"),
+            _empty_dimension("预期结果明确性", "clarity"),
+            _empty_dimension("边界用例", "boundary"),
+        )
+    return (
+        _completeness_dimension(completeness_total, case_count),
+        _clarity_dimension(clarity_total, case_count),
+        _boundary_dimension(boundary_count, case_count, total_changed_methods),
     )
 
 
 def calculate_score(
     total_changed_methods: int,
     covered_count: int,
-    test_cases: list[dict],
+    test_cases: Iterable[dict],
 ) -> ScoreResult:
     """
     计算测试用例综合评分。
@@ -284,20 +406,22 @@ def calculate_score(
     Args:
         total_changed_methods: 代码改动涉及的方法总数
         covered_count: 被测试覆盖的方法数
-        test_cases: 测试用例列表（字典格式）
+        test_cases: 测试用例的可迭代对象（字典格式，只遍历一次，可为生成器）
 
     Returns:
         ScoreResult 包含各维度评分和总分
     """
     dim_coverage = score_coverage(total_changed_methods, covered_count)
-    dim_completeness = score_completeness(test_cases)
-    dim_clarity = score_clarity(test_cases)
-    dim_boundary = score_boundary(test_cases, total_changed_methods)
+    dim_completeness, dim_clarity, dim_boundary = _score_case_dimensions(
+        test_cases, total_changed_methods
+    )
 
     dimensions = [dim_coverage, dim_completeness, dim_clarity, dim_boundary]
 
-    total = sum(d.weighted_score for d in dimensions)
-    total = round(min(100.0, max(0.0, total)), 1)
+    # weighted_score 均为百分之一分的整数倍，还原为整数求和后四舍五入到0.1分
+    total_hundredths = sum(round(d.weighted_score * 100) for d in dimensions)
+    total_hundredths = min(10000, max(0, total_hundredths))
+    total = (total_hundredths + 5) // 10 / 10
 
     grade = _get_grade(total)
     summary = _get_summary(total, grade)
@@ -313,20 +437,11 @@ def calculate_score(
 def _count_steps(steps_text: str) -> int:
     """计算步骤数量"""
     # 匹配 "1." "2." 或 "1、" "2、" 或 "步骤1" 等格式
-    import re
-    patterns = [
-        r'\d+[\.\、\)]',  # 1. 2. 或 1、 2、 或 1) 2)
-        r'步骤\d+',
-    ]
-    count = 0
-    for pattern in patterns:
-        matches = re.findall(pattern, steps_text)
-        count = max(count, len(matches))
+    count = max(len(pattern.findall(steps_text)) for pattern in _STEP_NUMBER_PATTERNS)
 
     # 如果没有编号，按换行/分号分割
     if count == 0:
-        parts = [p.strip() for p in steps_text.replace(";", "\n").replace("；", "\n").split("\n") if p.strip()]
-        count = len(parts)
+        count = sum(1 for p in steps_text.translate(_STEP_SEPARATORS).split("\n") if p.strip())
 
     return count
 
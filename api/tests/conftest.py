@@ -1,10 +1,26 @@
 """
 conftest.py - 共享 fixtures
+
+测试之间不共享状态，fixtures 目录只读，不要引入模块级的数据库状态。数据库经
+get_db_path 读取的 DB_PATH 环境变量（或对 get_db_path 打补丁）切换：
+
+- test_database.py 每个测试使用 tmp_path 下的独立数据库文件；
+- test_api_integration.py 每个测试类使用一个URI唯一的共享缓存内存库，
+  类内各测试开始前清空数据表，类结束时关闭连接、释放内存库。
+
+内存库只存在于创建它的进程内，因此可用 pytest-xdist 并行运行（需另行安装）：
+
+    python -m pytest -n auto --dist loadscope
+
+loadscope 让同一测试类的用例在同一进程内执行，每个类只建一次内存库；若按其他
+方式分发，各进程分别为该类建库，结果不变，只是重复建表。本套件较小，进程启动
+开销大于收益，因此 pytest.ini 不默认开启 -n，只在测试变多或CI核数较多时手动使用。
 """
 
 import json
 import os
 import sys
+from functools import lru_cache
 from pathlib import Path
 
 import pytest
@@ -16,39 +32,59 @@ sys.path.insert(0, str(API_DIR))
 FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
 
 
-@pytest.fixture
+@lru_cache(maxsize=None)
+def _read_fixture(name: str) -> str:
+    """读取fixtures目录下的文件，每个文件在一次测试会话中只读一次"""
+    return (FIXTURES_DIR / name).read_text(encoding="utf-8")
+
+
+@pytest.fixture(scope="session")
 def sample_code_changes_json() -> str:
     """加载示例代码改动JSON"""
-    path = FIXTURES_DIR / "sample_code_changes.json"
-    return path.read_text(encoding="utf-8")
+    return _read_fixture("sample_code_changes.json")
+
+
+@pytest.fixture(scope="session")
+def analyzed_sample(sample_code_changes_json):
+    """示例代码改动的分析结果（会话内只计算一次，使用方只读不改）"""
+    from services.diff_analyzer import analyze_code_changes
+    return analyze_code_changes(sample_code_changes_json)
 
 
 @pytest.fixture
 def sample_code_changes_dict() -> dict:
-    """加载示例代码改动字典"""
-    path = FIXTURES_DIR / "sample_code_changes.json"
-    return json.loads(path.read_text(encoding="utf-8"))
+    """加载示例代码改动字典（每个测试独立解析，避免修改影响其他测试）"""
+    return json.loads(_read_fixture("sample_code_changes.json"))
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_mapping_csv() -> str:
     """加载示例映射关系CSV"""
-    path = FIXTURES_DIR / "sample_mapping.csv"
-    return path.read_text(encoding="utf-8")
+    return _read_fixture("sample_mapping.csv")
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
+def sample_mapping_csv_utf8(sample_mapping_csv) -> bytes:
+    """示例映射关系CSV的UTF-8字节（会话内只编码一次）"""
+    return sample_mapping_csv.encode("utf-8")
+
+
+@pytest.fixture(scope="session")
+def sample_mapping_csv_utf8_bom(sample_mapping_csv_utf8) -> bytes:
+    """带UTF-8 BOM的示例映射关系CSV字节"""
+    return b"\xef\xbb\xbf" + sample_mapping_csv_utf8
+
+
+@pytest.fixture(scope="session")
 def sample_test_cases_csv() -> str:
     """加载示例测试用例CSV"""
-    path = FIXTURES_DIR / "sample_test_cases.csv"
-    return path.read_text(encoding="utf-8")
+    return _read_fixture("sample_test_cases.csv")
 
 
 @pytest.fixture
 def sample_deepseek_response() -> dict:
-    """加载示例DeepSeek返回"""
-    path = FIXTURES_DIR / "sample_deepseek_response.json"
-    return json.loads(path.read_text(encoding="utf-8"))
+    """加载示例DeepSeek返回（每个测试独立解析）"""
+    return json.loads(_read_fixture("sample_deepseek_response.json"))
 
 
 @pytest.fixture
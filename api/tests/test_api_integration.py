@@ -4,30 +4,60 @@ test_api_integration.py - API集成测试（项目管理和分析记录路由）
 
 import json
 import os
+import sqlite3
+import uuid
 from pathlib import Path
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 from fastapi.testclient import TestClient
 
-from services.database import init_db
+from services.database import close_all_connections, init_db
 
 
 FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
 
 
-@pytest.fixture(autouse=True)
-def temp_db(tmp_path, monkeypatch):
-    """为每个测试使用独立的临时数据库"""
-    db_path = str(tmp_path / "test_api.db")
-    monkeypatch.setattr("services.database.get_db_path", lambda: db_path)
-    init_db()
-    return db_path
+# 按外键依赖顺序清空
+_TABLES = ("analysis_records", "projects", "global_mapping_entries", "global_mapping")
+
+
+@pytest.fixture(scope="class")
+def class_db():
+    """每个测试类共用一个共享缓存的内存数据库，建表只执行一次，不产生文件读写"""
+    db_path = f"file:test_api_{uuid.uuid4().hex}?mode=memory&cache=shared"
+    # 内存库在最后一个连接关闭时销毁，测试类期间保持一个连接
+    keeper = sqlite3.connect(db_path, uri=True)
+    try:
+        # 类级fixture不能使用函数级的 monkeypatch，用 MonkeyPatch.context 设置
+        # get_db_path 读取的 DB_PATH 环境变量，类结束时自动恢复
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setenv("DB_PATH", db_path)
+            init_db()
+            yield db_path
+    finally:
+        # 关闭各线程（含工作线程）复用的连接，内存库随 keeper 关闭一并释放
+        close_all_connections()
+        keeper.close()
 
 
-@pytest.fixture
+@pytest.fixture(autouse=True)
+def temp_db(class_db):
+    """每个测试开始前清空数据并重置自增ID，测试间互不影响"""
+    from services.database import _get_connection
+    conn = _get_connection()
+    with conn:
+        for table in _TABLES:
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute("DELETE FROM sqlite_sequence")
+    from index import clear_mapping_cache
+    clear_mapping_cache()
+    return class_db
+
+
+@pytest.fixture(scope="class")
 def client():
-    """创建测试客户端"""
+    """创建测试客户端（同一测试类内共用）"""
     from index import app
     return TestClient(app)
 
@@ -358,3 +388,251 @@ class TestProjectAnalyze:
         assert data["data"]["ai_analysis"] is not None
         assert data["data"]["ai_cost"] is not None
         assert "record_id" in data["data"]
+
+
+# ============ 全局映射分析 ============
+
+class TestGlobalMappingAnalyze:
+    """测试使用全局映射的分析"""
+
+    def _analyze(self, client):
+        code_file = FIXTURES_DIR / "sample_code_changes.json"
+        test_file = FIXTURES_DIR / "sample_test_cases.csv"
+        with open(code_file, "rb") as cf, open(test_file, "rb") as tf:
+            return client.post(
+                "/api/analyze",
+                files={
+                    "code_changes": ("code.json", cf, "application/json"),
+                    "test_cases_file": ("tests.csv", tf, "text/csv"),
+                },
+                data={"use_ai": "false"},
+            )
+
+    def test_analyze_with_global_mapping(self, client):
+        """上传全局映射后可不带映射文件分析，删除后返回400"""
+        mapping_file = FIXTURES_DIR / "sample_mapping.csv"
+        with open(mapping_file, "rb") as mf:
+            upload_resp = client.post(
+                "/api/mapping",
+                files={"mapping_file": ("mapping.csv", mf, "text/csv")},
+            )
+        mapping_id = upload_resp.json()["data"]["id"]
+
+        resp = self._analyze(client)
+        assert resp.status_code == 200
+        assert resp.json()["data"]["coverage"]["total_changed_methods"] > 0
+
+        client.delete(f"/api/mapping/{mapping_id}")
+        assert self._analyze(client).status_code == 400
+
+
+class TestAnalyzeInvalidCodeChanges:
+    """测试代码改动JSON根元素不是对象时返回400"""
+
+    @pytest.mark.parametrize("root", [
+        b"[1, 2]",
+        # 根元素为JSON字符串时不应被当作JSON文本再次解析
+        json.dumps(json.dumps({"current": [], "history": []})).encode("utf-8"),
+    ], ids=["array_root", "string_root"])
+    def test_non_object_root_rejected(self, client, root):
+        test_file = FIXTURES_DIR / "sample_test_cases.csv"
+        mapping_file = FIXTURES_DIR / "sample_mapping.csv"
+        with open(test_file, "rb") as tf, open(mapping_file, "rb") as mf:
+            resp = client.post(
+                "/api/analyze",
+                files={
+                    "code_changes": ("code.json", root, "application/json"),
+                    "test_cases_file": ("tests.csv", tf, "text/csv"),
+                    "mapping_file": ("mapping.csv", mf, "text/csv"),
+                },
+                data={"use_ai": "false"},
+            )
+        assert resp.status_code == 400
+        assert resp.json()["detail"] == "代码改动分析失败: JSON根元素必须是对象"
+
+
+class TestAnalysisCache:
+    """测试本地分析结果缓存"""
+
+    @pytest.mark.asyncio
+    async def test_hit_skips_local_pipeline(self, sample_code_changes_dict, sample_test_case_rows):
+        import time
+        import index
+        from services.coverage_analyzer import parse_mapping_data
+
+        mapping = parse_mapping_data([
+            {"包名": "com.example.user", "类名": "UserService", "方法名": "createUser", "功能描述": "创建用户"},
+        ])
+        index._analysis_cache.clear()
+        with patch("index.analyze_code_changes", wraps=index.analyze_code_changes) as diff_spy, \
+                patch("index.extract_all_changed_methods", wraps=index.extract_all_changed_methods) as ast_spy:
+            first, _, _, _ = await index._run_analysis(
+                sample_code_changes_dict, sample_test_case_rows, mapping, False, time.time(), cache_key="k"
+            )
+            second, _, _, _ = await index._run_analysis(
+                sample_code_changes_dict, sample_test_case_rows, mapping, False, time.time(), cache_key="k"
+            )
+            await index._run_analysis(
+                sample_code_changes_dict, sample_test_case_rows, mapping, False, time.time()
+            )
+        assert diff_spy.call_count == 2
+        assert ast_spy.call_count == 2
+        for part in ("diff_analysis", "coverage", "score"):
+            assert first[part] == second[part]
+
+    @pytest.mark.asyncio
+    async def test_hit_starts_ai_with_cached_summary(self, sample_code_changes_dict, sample_test_case_rows):
+        import time
+        import index
+
+        index._analysis_cache.clear()
+        with patch("index.start_ai_analysis", return_value=None) as ai_spy:
+            for _ in range(2):
+                await index._run_analysis(
+                    sample_code_changes_dict, sample_test_case_rows, (), True, time.time(), cache_key="k"
+                )
+        first, second = (c.args[0] for c in ai_spy.call_args_list)
+        assert first == second
+        assert "代码文件变更" in first
+
+    @pytest.mark.asyncio
+    async def test_cached_result_is_copy(self, sample_code_changes_dict, sample_test_case_rows):
+        import time
+        import index
+
+        index._analysis_cache.clear()
+        first, _, _, _ = await index._run_analysis(
+            sample_code_changes_dict, sample_test_case_rows, (), False, time.time(), cache_key="k"
+        )
+        first["diff_analysis"]["files"].clear()
+        second, _, _, _ = await index._run_analysis(
+            sample_code_changes_dict, sample_test_case_rows, (), False, time.time(), cache_key="k"
+        )
+        assert second["diff_analysis"]["files"]
+        second["diff_analysis"]["files"].clear()
+        third, _, _, _ = await index._run_analysis(
+            sample_code_changes_dict, sample_test_case_rows, (), False, time.time(), cache_key="k"
+        )
+        assert third["diff_analysis"]["files"]
+
+    def test_key_hashes_raw_uploads(self):
+        import io
+        import index
+        from starlette.datastructures import UploadFile
+
+        def uploads(*contents):
+            return [UploadFile(io.BytesIO(c), filename="f") for c in contents]
+
+        key = index._analysis_cache_key(uploads(b"ab", b"c"))
+        assert key == index._analysis_cache_key(uploads(b"ab", b"c"))
+        assert key != index._analysis_cache_key(uploads(b"a", b"bc"))
+        assert key != index._analysis_cache_key(uploads(b"ab", b"c"), "global:1:2026-01-01")
+        files = uploads(b"ab")
+        files[0].file.read()
+        index._analysis_cache_key(files)
+        assert files[0].file.read() == b"ab"
+
+    def test_mapping_change_clears_cache(self):
+        import index
+
+        index._analysis_cache["k"] = ("coverage", "score")
+        index.clear_mapping_cache()
+        assert not index._analysis_cache
+
+
+class TestRunAnalysis:
+    """测试分析流程不阻塞事件循环"""
+
+    @pytest.mark.asyncio
+    async def test_diff_runs_off_event_loop(self, sample_code_changes_dict, sample_test_case_rows):
+        import asyncio
+        import time
+        import index
+
+        calls = []
+        original = index.analyze_code_changes
+
+        def record_loop(*args, **kwargs):
+            try:
+                asyncio.get_running_loop()
+                calls.append("event_loop")
+            except RuntimeError:
+                calls.append("worker_thread")
+            return original(*args, **kwargs)
+
+        with patch("index.analyze_code_changes", side_effect=record_loop):
+            await index._run_analysis(sample_code_changes_dict, sample_test_case_rows, (), False, time.time())
+        assert calls == ["worker_thread"]
+
+
+class TestExtractAllChangedMethods:
+    """测试多文件变更方法提取"""
+
+    @pytest.mark.asyncio
+    async def test_duplicate_pairs_parsed_once(self, simple_java_code, modified_java_code):
+        import index
+
+        code_json = {
+            "current": [modified_java_code, modified_java_code, simple_java_code],
+            "history": [simple_java_code, simple_java_code, simple_java_code],
+        }
+        with patch("index.extract_changed_methods", wraps=index.extract_changed_methods) as spy:
+            methods = await index.extract_all_changed_methods(code_json)
+        assert spy.call_count == 1
+        names = [m["method_name"] for m in methods]
+        assert names.count("deleteUser") == 2
+
+    @staticmethod
+    def _distinct_pairs(simple_java_code, modified_java_code, count):
+        return {
+            "current": [f"{modified_java_code}// {i}\n" for i in range(count)],
+            "history": [simple_java_code] * count,
+        }
+
+    @pytest.mark.asyncio
+    async def test_few_pairs_skip_process_pool(self, monkeypatch, simple_java_code, modified_java_code):
+        import index
+
+        pool = MagicMock()
+        monkeypatch.setattr(index, "_ast_pool", pool)
+        code_json = self._distinct_pairs(simple_java_code, modified_java_code, index.PARALLEL_AST_MIN_FILES - 1)
+        methods = await index.extract_all_changed_methods(code_json)
+        assert methods
+        assert not pool.submit.called
+
+    @pytest.mark.asyncio
+    async def test_many_pairs_use_process_pool(self, monkeypatch, simple_java_code, modified_java_code):
+        from concurrent.futures import ThreadPoolExecutor
+        import index
+
+        count = index.PARALLEL_AST_MIN_FILES
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            monkeypatch.setattr(index, "_ast_pool", pool)
+            with patch.object(pool, "submit", wraps=pool.submit) as spy:
+                methods = await index.extract_all_changed_methods(
+                    self._distinct_pairs(simple_java_code, modified_java_code, count)
+                )
+        assert spy.call_count == count
+        assert [m["method_name"] for m in methods].count("deleteUser") == count
+
+    def test_pool_does_not_fork(self):
+        import index
+        assert index._process_pool_context().get_start_method() in ("forkserver", "spawn")
+
+
+class TestBodySizeLimit:
+    """测试请求体大小限制"""
+
+    def test_oversized_request_rejected(self, client):
+        from index import MAX_REQUEST_BODY_BYTES
+        resp = client.post(
+            "/api/analyze",
+            content=b"x",
+            headers={"content-length": str(MAX_REQUEST_BODY_BYTES + 1)},
+        )
+        assert resp.status_code == 413
+        assert "过大" in resp.json()["detail"]
+
+    def test_normal_request_passes(self, client):
+        resp = client.get("/api/health")
+        assert resp.status_code == 200
@@ -2,8 +2,11 @@
 test_ast_parser.py - AST解析模块测试
 """
 
+from unittest.mock import patch
+
 import pytest
 
+from services import ast_parser
 from services.ast_parser import (
     parse_java_code,
     extract_methods_from_code,
@@ -78,10 +81,79 @@ class TestExtractMethodsFromCode:
         methods = extract_methods_from_code(simple_java_code)
         assert len(methods) == 2
 
+    def test_cached_results_not_shared(self, simple_java_code, modified_java_code):
+        """修改返回结果不影响后续调用"""
+        first = extract_methods_from_code(simple_java_code)
+        first[0].parameters.append("Injected")
+        first[0].modifiers.clear()
+        first.clear()
+        changed = extract_changed_methods(modified_java_code, simple_java_code)
+        changed[0].parameters.append("Injected")
+        assert extract_methods_from_code(simple_java_code) == parse_java_code(simple_java_code).classes[0].methods
+        assert "Injected" not in extract_changed_methods(modified_java_code, simple_java_code)[0].parameters
+
     def test_extract_from_empty(self):
         methods = extract_methods_from_code("")
         assert methods == []
 
+    def test_repeated_source_parsed_once(self, simple_java_code):
+        """相同源码重复提取只解析一次"""
+        ast_parser._parse_methods_cached.cache_clear()
+        with patch(
+            "services.ast_parser._fast_extract_methods",
+            wraps=ast_parser._fast_extract_methods,
+        ) as spy:
+            first = extract_methods_from_code(simple_java_code)
+            second = extract_methods_from_code(simple_java_code)
+        assert spy.call_count == 1
+        assert [m.method_name for m in first] == [m.method_name for m in second]
+
+
+class TestFastExtractMethods:
+    """测试基于token扫描的快速方法提取"""
+
+    @staticmethod
+    def _signatures(methods):
+        return [
+            (m.package_name, m.class_name, m.method_name, sorted(m.modifiers), m.return_type, m.parameters)
+            for m in methods
+        ]
+
+    def test_matches_full_parse(self, simple_java_code, modified_java_code):
+        for code in (simple_java_code, modified_java_code):
+            full = [m for cls in parse_java_code(code).classes for m in cls.methods]
+            fast = ast_parser._fast_extract_methods(code)
+            assert self._signatures(fast) == self._signatures(full)
+
+    def test_skips_bodies_fields_and_nested_types(self):
+        code = """package com.example;
+public class Svc {
+    private Runnable r = new Runnable() { public void run() {} };
+    static { init(); }
+    @RequestMapping(value = "/x", method = {RequestMethod.GET})
+    public <E> java.util.Map<String, List<E>> find(final Map.Entry<K, V> e, String... rest) throws Exception {
+        return null;
+    }
+    class Inner { void innerMethod() {} }
+}
+enum Color { RED; void code() {} }
+"""
+        methods = ast_parser._fast_extract_methods(code)
+        assert [m.method_name for m in methods] == ["find"]
+        assert methods[0].return_type == "java"
+        assert methods[0].parameters == ["Map", "String"]
+
+    def test_broken_method_body_still_extracted(self):
+        """方法体不做语法检查：完整解析报错，词法扫描仍提取方法"""
+        code = "class A { void f() { int x = ; } void g(){} }"
+        assert parse_java_code(code).errors
+        assert [m.method_name for m in ast_parser._fast_extract_methods(code)] == ["f", "g"]
+        assert [m.method_name for m in extract_changed_methods(code, "")] == ["f", "g"]
+
+    def test_unrecognized_code_returns_none(self):
+        assert ast_parser._fast_extract_methods("this is not java code at all!!!") is None
+        assert extract_methods_from_code("this is not java code at all!!!") == []
+
 
 class TestExtractChangedMethods:
     """测试变更方法提取"""
@@ -95,6 +167,22 @@ class TestExtractChangedMethods:
         changed = extract_changed_methods(simple_java_code, simple_java_code)
         assert len(changed) == 0
 
+    def test_signature_includes_parameters(self):
+        code = """
+        package com.example;
+        public class A {
+            public void run(String a) {}
+        }
+        """
+        overloaded = code.replace("public void run(String a) {}", "public void run(String a) {} public void run(int b) {}")
+        changed = extract_changed_methods(overloaded, code)
+        assert [m.signature for m in changed] == [("com.example", "A", "run", ("int",))]
+
+    def test_identical_code_skips_parse(self, simple_java_code):
+        with patch.object(ast_parser, "_parse_methods_cached") as spy:
+            assert extract_changed_methods(simple_java_code, simple_java_code) == []
+        spy.assert_not_called()
+
     def test_all_new(self, simple_java_code):
         changed = extract_changed_methods(simple_java_code, "")
         # 从空代码到有代码，所有方法都是新增
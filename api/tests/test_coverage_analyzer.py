@@ -10,6 +10,7 @@ from services.coverage_analyzer import (
     analyze_coverage,
     MappingEntry,
     TestCase,
+    _fuzzy_match,
 )
 
 
@@ -127,3 +128,54 @@ class TestAnalyzeCoverage:
         assert len(result.coverage_details) == 1
         assert result.coverage_details[0]["method"] == "com.example.user.UserService.createUser"
         assert result.coverage_details[0]["is_covered"] is True
+
+    def test_shared_description_matched_per_method(self):
+        mapping = [
+            MappingEntry("com.a", "Svc", "save", "保存订单"),
+            MappingEntry("com.a", "Svc", "saveAll", "保存订单"),
+        ]
+        cases = [
+            TestCase("TC1", "保存订单", "", ""),
+            TestCase("TC2", "订单查询", "", ""),
+        ]
+        changed = [
+            {"package_name": "com.a", "class_name": "Svc", "method_name": "save"},
+            {"package_name": "com.a", "class_name": "Svc", "method_name": "saveAll"},
+        ]
+        result = analyze_coverage(changed, mapping, cases)
+        first, second = result.coverage_details
+        assert first["matched_tests"] == second["matched_tests"] == ["TC1"]
+        assert first["matched_tests"] is not second["matched_tests"]
+
+    def test_keyword_match_with_separators(self):
+        mapping = [MappingEntry("com.a", "Svc", "edit", "新增，删除/导出")]
+        cases = [TestCase("TC1", "删除用户", "", ""), TestCase("TC2", "查询用户", "", "")]
+        changed = [{"package_name": "com.a", "class_name": "Svc", "method_name": "edit"}]
+        result = analyze_coverage(changed, mapping, cases)
+        assert result.coverage_details[0]["matched_tests"] == ["TC1"]
+
+    def test_duplicate_test_functions_keep_order(self):
+        mapping = [MappingEntry("com.a", "Svc", "pay", "支付订单")]
+        cases = [
+            TestCase("TC1", "支付订单", "", ""),
+            TestCase("TC2", "订单查询", "", ""),
+            TestCase("TC3", "支付订单", "", ""),
+        ]
+        changed = [{"package_name": "com.a", "class_name": "Svc", "method_name": "pay"}]
+        result = analyze_coverage(changed, mapping, cases)
+        assert result.coverage_details[0]["matched_tests"] == ["TC1", "TC3"]
+
+
+class TestFuzzyMatch:
+    """测试关键词模糊匹配"""
+
+    def test_half_keywords_hit(self):
+        assert _fuzzy_match("新增,删除/导出，导入", "删除与导出用户")
+        assert not _fuzzy_match("新增,删除/导出，导入", "删除用户")
+
+    def test_single_keyword(self):
+        assert _fuzzy_match("查询", "订单查询")
+        assert not _fuzzy_match("查询", "订单导出")
+
+    def test_no_keywords(self):
+        assert not _fuzzy_match(" , / ", "任意功能")
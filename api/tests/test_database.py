@@ -4,6 +4,7 @@ test_database.py - 数据库抽象层测试
 
 import json
 import os
+import sqlite3
 from pathlib import Path
 
 import pytest
@@ -16,10 +17,16 @@ from services.database import (
     update_project,
     delete_project,
     save_analysis_record,
+    save_analysis_records_bulk,
     get_analysis_record,
     list_analysis_records,
     get_project_stats,
     get_db_path,
+    save_global_mapping,
+    get_global_mapping,
+    get_global_mapping_entries,
+    get_latest_global_mapping,
+    delete_global_mapping,
 )
 
 
@@ -54,12 +61,65 @@ class TestInitDB:
         assert "projects" in tables
         assert "analysis_records" in tables
 
+    def test_init_enables_wal_and_index(self, temp_db):
+        """init_db应启用WAL并创建分析记录复合索引"""
+        import sqlite3
+        conn = sqlite3.connect(temp_db)
+        journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        indexes = [row[1] for row in conn.execute("PRAGMA index_list(analysis_records)")]
+        conn.close()
+
+        assert journal_mode == "wal"
+        assert "idx_ar_project_created" in indexes
+
     def test_init_idempotent(self):
         """多次调用init_db不应报错"""
         init_db()
         init_db()
 
 
+# ============ 连接复用 ============
+
+class TestConnectionReuse:
+    """测试线程内连接复用"""
+
+    def test_same_connection_reused(self):
+        import services.database as db_mod
+        assert db_mod._get_connection() is db_mod._get_connection()
+
+    def test_reopen_when_path_changes(self, tmp_path, monkeypatch):
+        import services.database as db_mod
+        first = db_mod._get_connection()
+        other_path = str(tmp_path / "other.db")
+        monkeypatch.setattr(db_mod, "get_db_path", lambda: other_path)
+        second = db_mod._get_connection()
+        assert second is not first
+        assert os.path.exists(other_path)
+
+    def test_uri_memory_database(self, tmp_path, monkeypatch):
+        import services.database as db_mod
+        db_path = "file:test_uri_mem?mode=memory&cache=shared"
+        workdir = tmp_path / "cwd"
+        workdir.mkdir()
+        monkeypatch.chdir(workdir)
+        monkeypatch.setattr(db_mod, "get_db_path", lambda: db_path)
+        init_db()
+        create_project("内存项目")
+        assert [p["name"] for p in list_projects()] == ["内存项目"]
+        # URI不被当作文件路径，不创建任何文件
+        assert list(workdir.iterdir()) == []
+
+    def test_failed_write_rolled_back(self):
+        import sqlite3
+        import services.database as db_mod
+        conn = db_mod._get_connection()
+        with pytest.raises(sqlite3.IntegrityError):
+            with conn:
+                conn.execute("INSERT INTO projects (name) VALUES (?)", ("回滚项目",))
+                conn.execute("INSERT INTO projects (name) VALUES (NULL)")
+        assert list_projects() == []
+
+
 # ============ get_db_path ============
 
 class TestGetDBPath:
@@ -125,6 +185,14 @@ class TestCreateProject:
         p2 = create_project(name="项目2")
         assert p1["id"] != p2["id"]
 
+    def test_create_without_returning_support(self, monkeypatch):
+        """SQLite不支持RETURNING时回退为插入后查询"""
+        monkeypatch.setattr("services.database._SUPPORTS_RETURNING", False)
+        mapping = [{"package": "com.example"}]
+        project = create_project(name="旧版SQLite", mapping_data=mapping)
+        assert project == get_project(project["id"])
+        assert project["mapping_data"] == mapping
+
 
 # ============ get_project ============
 
@@ -150,6 +218,21 @@ class TestGetProject:
         fetched = get_project(created["id"])
         assert fetched["mapping_data"] == mapping
 
+    @pytest.mark.parametrize("mapping, expected", [
+        (None, False),
+        ([], False),
+        ({}, False),
+        ([{"package_name": "a"}], True),
+    ])
+    def test_get_without_mapping_data(self, mapping, expected):
+        """include_mapping=False 时不返回 mapping_data，has_mapping 与其真值一致"""
+        created = create_project(name="元信息", mapping_data=mapping)
+        fetched = get_project(created["id"], include_mapping=False)
+        assert "mapping_data" not in fetched
+        assert fetched["has_mapping"] is expected
+        assert fetched["name"] == "元信息"
+        assert get_project(9999, include_mapping=False) is None
+
 
 # ============ list_projects ============
 
@@ -176,6 +259,14 @@ class TestListProjects:
         # 后创建的ID更大，按created_at DESC排序时同时间戳下按ID倒序
         assert projects[0]["id"] > projects[1]["id"]
 
+    def test_list_without_mapping(self):
+        """include_mapping=False时不返回mapping_data"""
+        create_project(name="项目A", mapping_data={"k": "映射"})
+        assert list_projects()[0]["mapping_data"] == {"k": "映射"}
+        projects = list_projects(include_mapping=False)
+        assert "mapping_data" not in projects[0]
+        assert projects[0]["name"] == "项目A"
+
 
 # ============ update_project ============
 
@@ -309,6 +400,51 @@ class TestSaveAnalysisRecord:
         assert record["ai_suggestions"] is None
 
 
+class TestSaveAnalysisRecordsBulk:
+    """测试批量保存分析记录"""
+
+    def test_bulk_save(self):
+        project = create_project(name="项目")
+        records = [
+            {
+                "project_id": project["id"],
+                "code_changes_summary": {"index": i},
+                "test_coverage_result": {"rate": 0.5},
+                "test_score": 60.0 + i,
+                "token_usage": 0,
+                "cost": 0.0,
+                "duration_ms": 100,
+            }
+            for i in range(3)
+        ]
+        records[0]["ai_suggestions"] = {"risk": "low"}
+        assert save_analysis_records_bulk(records) == 3
+
+        saved = sorted(list_analysis_records(project_id=project["id"]), key=lambda r: r["test_score"])
+        assert [r["code_changes_summary"]["index"] for r in saved] == [0, 1, 2]
+        assert saved[0]["ai_suggestions"] == {"risk": "low"}
+        assert saved[1]["ai_suggestions"] is None
+
+    def test_bulk_save_empty(self):
+        assert save_analysis_records_bulk([]) == 0
+
+    def test_bulk_save_is_atomic(self):
+        project = create_project(name="项目")
+        good = {
+            "project_id": project["id"],
+            "code_changes_summary": {},
+            "test_coverage_result": {},
+            "test_score": 1.0,
+            "token_usage": 0,
+            "cost": 0.0,
+            "duration_ms": 1,
+        }
+        bad = dict(good, project_id=9999)  # 外键约束失败
+        with pytest.raises(sqlite3.IntegrityError):
+            save_analysis_records_bulk([good, bad])
+        assert list_analysis_records() == []
+
+
 # ============ get_analysis_record ============
 
 class TestGetAnalysisRecord:
@@ -480,3 +616,56 @@ class TestGetProjectStats:
         stats = get_project_stats(p1["id"])
         assert stats["analysis_count"] == 1
         assert stats["avg_score"] == 100.0
+
+
+# ============ global_mapping_entries ============
+
+class TestGlobalMappingEntries:
+    """测试全局映射条目表"""
+
+    ENTRIES = [
+        {"package_name": "com.a", "class_name": "Svc", "method_name": "save", "description": "保存"},
+        {"package_name": "com.a", "class_name": "Svc", "method_name": "load", "description": "加载"},
+    ]
+
+    def test_entries_saved_in_order(self):
+        mapping = save_global_mapping("m.csv", self.ENTRIES, row_count=2)
+        assert get_global_mapping_entries(mapping["id"]) == self.ENTRIES
+
+    def test_duplicate_entries_kept(self, temp_db):
+        """重复条目按原顺序保留，条目数与 row_count 一致，mapping_data 列保留同样内容"""
+        import sqlite3
+        entries = [self.ENTRIES[0], self.ENTRIES[1], dict(self.ENTRIES[0], description="再次保存")]
+        mapping = save_global_mapping("m.csv", entries, row_count=len(entries))
+        assert mapping["mapping_data"] == entries
+        assert get_global_mapping_entries(mapping["id"]) == entries
+        loaded = get_global_mapping(mapping["id"])
+        assert loaded["mapping_data"] == entries
+        assert loaded["row_count"] == len(loaded["mapping_data"])
+        assert get_latest_global_mapping()["mapping_data"] == entries
+        conn = sqlite3.connect(temp_db)
+        blob = conn.execute("SELECT mapping_data FROM global_mapping WHERE id = ?", (mapping["id"],)).fetchone()[0]
+        conn.close()
+        assert json.loads(blob) == entries
+
+    def test_delete_cascades(self, temp_db):
+        import sqlite3
+        mapping = save_global_mapping("m.csv", self.ENTRIES, row_count=2)
+        assert delete_global_mapping(mapping["id"])
+        conn = sqlite3.connect(temp_db)
+        count = conn.execute("SELECT COUNT(*) FROM global_mapping_entries").fetchone()[0]
+        conn.close()
+        assert count == 0
+        assert get_global_mapping_entries(mapping["id"]) is None
+
+    def test_legacy_mapping_falls_back_to_blob(self, temp_db):
+        """条目表出现之前保存的映射从mapping_data读取"""
+        import sqlite3
+        conn = sqlite3.connect(temp_db)
+        cursor = conn.execute(
+            "INSERT INTO global_mapping (name, mapping_data, row_count) VALUES (?, ?, ?)",
+            ("old.csv", json.dumps(self.ENTRIES, ensure_ascii=False), 2),
+        )
+        conn.commit()
+        conn.close()
+        assert get_global_mapping_entries(cursor.lastrowid) == self.ENTRIES
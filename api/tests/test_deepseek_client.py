@@ -2,21 +2,46 @@
 test_deepseek_client.py - DeepSeek API客户端测试（全部mock，不实际调用API）
 """
 
+import asyncio
 import json
 import os
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
+from services import deepseek_client
 from services.deepseek_client import (
     build_analysis_messages,
     call_deepseek,
     calculate_cost,
+    clear_response_cache,
+    close_client,
+    get_client,
     MODEL_NAME,
     PRICING,
 )
 
 
+@pytest.fixture(autouse=True)
+def _clear_response_cache():
+    """各用例相互独立，不共享响应缓存"""
+    clear_response_cache()
+    yield
+    clear_response_cache()
+
+
+def _mock_response(content: dict):
+    mock_response = MagicMock()
+    mock_response.choices = [MagicMock()]
+    mock_response.choices[0].message.content = json.dumps(content)
+    mock_response.usage.prompt_tokens = 100
+    mock_response.usage.completion_tokens = 50
+    mock_response.usage.total_tokens = 150
+    mock_response.usage.prompt_cache_hit_tokens = 50
+    mock_response.usage.prompt_cache_miss_tokens = 50
+    return mock_response
+
+
 class TestBuildMessages:
     """测试消息构建"""
 
@@ -44,6 +69,11 @@ class TestBuildMessages:
         assert "MY_MAPPING" in messages[1]["content"]
         assert "MY_TESTS" in messages[1]["content"]
 
+    def test_inputs_with_braces(self):
+        messages = build_analysis_messages("void f() { return; }", "{mapping_info}", "{}")
+        assert "void f() { return; }" in messages[1]["content"]
+        assert "{mapping_info}" in messages[1]["content"]
+
 
 class TestCalculateCost:
     """测试成本计算"""
@@ -83,6 +113,38 @@ class TestCalculateCost:
         assert cost["input_cost"] == pytest.approx(expected_input, abs=1e-6)
 
 
+class TestGetClient:
+    """测试客户端复用"""
+
+    @pytest.fixture(autouse=True)
+    def _reset_client(self, monkeypatch):
+        monkeypatch.setattr(deepseek_client, "_client", None)
+        monkeypatch.setattr(deepseek_client, "_client_api_key", None)
+
+    def test_client_reused(self, monkeypatch):
+        monkeypatch.setenv("DEEPSEEK_API_KEY", "sk-test-1")
+        assert get_client() is get_client()
+
+    def test_rebuilt_when_key_changes(self, monkeypatch):
+        monkeypatch.setenv("DEEPSEEK_API_KEY", "sk-test-1")
+        first = get_client()
+        monkeypatch.setenv("DEEPSEEK_API_KEY", "sk-test-2")
+        second = get_client()
+        assert second is not first
+        assert second.api_key == "sk-test-2"
+
+    def test_missing_key(self, monkeypatch):
+        monkeypatch.delenv("DEEPSEEK_API_KEY", raising=False)
+        assert get_client() is None
+
+    @pytest.mark.asyncio
+    async def test_close_client(self, monkeypatch):
+        monkeypatch.setenv("DEEPSEEK_API_KEY", "sk-test-1")
+        first = get_client()
+        await close_client()
+        assert get_client() is not first
+
+
 @pytest.mark.asyncio
 class TestCallDeepSeek:
     """测试API调用（mock）"""
@@ -178,3 +240,68 @@ class TestCallDeepSeek:
             )
         assert "error" in result
         assert "频率" in result["error"]
+
+
+@pytest.mark.asyncio
+class TestResponseCache:
+    """测试响应缓存"""
+
+    MESSAGES = [{"role": "user", "content": "cache"}]
+
+    async def test_repeated_call_hits_cache(self):
+        mock_client = AsyncMock()
+        mock_client.chat.completions.create = AsyncMock(return_value=_mock_response({"ok": True}))
+
+        with patch("services.deepseek_client.get_client", return_value=mock_client):
+            first = await call_deepseek(self.MESSAGES)
+            second = await call_deepseek(self.MESSAGES)
+
+        assert mock_client.chat.completions.create.await_count == 1
+        assert second["result"] == first["result"]
+        assert second["cached"] is True
+        assert second["usage"]["total_tokens"] == 0
+        assert calculate_cost(second["usage"])["total_cost"] == 0
+        # 修改返回结果不影响缓存
+        second["result"]["ok"] = False
+        third = await call_deepseek(self.MESSAGES)
+        assert third["result"] == {"ok": True}
+
+    async def test_different_params_not_shared(self):
+        mock_client = AsyncMock()
+        mock_client.chat.completions.create = AsyncMock(return_value=_mock_response({"ok": True}))
+
+        with patch("services.deepseek_client.get_client", return_value=mock_client):
+            await call_deepseek(self.MESSAGES)
+            await call_deepseek(self.MESSAGES, temperature=0.9)
+
+        assert mock_client.chat.completions.create.await_count == 2
+
+    async def test_error_not_cached(self):
+        from openai import APITimeoutError
+        mock_client = AsyncMock()
+        mock_client.chat.completions.create = AsyncMock(
+            side_effect=[APITimeoutError(request=MagicMock())] * 2 + [_mock_response({"ok": True})]
+        )
+
+        with patch("services.deepseek_client.get_client", return_value=mock_client):
+            failed = await call_deepseek(self.MESSAGES)
+            retried = await call_deepseek(self.MESSAGES)
+
+        assert "error" in failed
+        assert retried["result"] == {"ok": True}
+        assert "cached" not in retried
+
+    async def test_concurrent_calls_share_request(self):
+        async def slow_create(**kwargs):
+            await asyncio.sleep(0.01)
+            return _mock_response({"ok": True})
+
+        mock_client = AsyncMock()
+        mock_client.chat.completions.create = AsyncMock(side_effect=slow_create)
+
+        with patch("services.deepseek_client.get_client", return_value=mock_client):
+            results = await asyncio.gather(*(call_deepseek(self.MESSAGES) for _ in range(3)))
+
+        assert mock_client.chat.completions.create.await_count == 1
+        assert [r["result"] for r in results] == [{"ok": True}] * 3
+        assert sum(r["usage"]["total_tokens"] for r in results) == 150
@@ -2,10 +2,13 @@
 test_diff_analyzer.py - diff分析模块测试
 """
 
+import difflib
 import json
 import pytest
 
+from services import diff_analyzer
 from services.diff_analyzer import (
+    AnalysisResult,
     parse_code_changes,
     extract_package_path,
     compute_diff,
@@ -14,6 +17,15 @@ from services.diff_analyzer import (
 )
 
 
+# (无效输入, 错误信息片段)，JSON在导入时序列化一次
+_BAD_PAYLOADS = [
+    ("not valid json {", "JSON解析失败"),
+    (json.dumps({"foo": "bar"}), "必须包含"),
+    (json.dumps({"current": "string", "history": "string"}), "必须是数组"),
+    (json.dumps([1, 2, 3]), "必须是对象"),
+]
+
+
 class TestParseCodeChanges:
     """测试JSON解析"""
 
@@ -43,21 +55,38 @@ class TestParseCodeChanges:
         result = parse_code_changes(data)
         assert result["current"] == ["code1"]
 
-    def test_parse_invalid_json(self):
-        with pytest.raises(ValueError, match="JSON解析失败"):
-            parse_code_changes("not valid json {")
+    def test_parse_bytes_with_bom(self):
+        data = json.dumps({"current": ["代码"], "history": [""]}, ensure_ascii=False)
+        result = parse_code_changes(b"\xef\xbb\xbf" + data.encode("utf-8"))
+        assert result["current"] == ["代码"]
 
-    def test_parse_missing_fields(self):
-        with pytest.raises(ValueError, match="必须包含"):
-            parse_code_changes(json.dumps({"foo": "bar"}))
+    def test_parse_bytearray(self):
+        data = bytearray(json.dumps({"current": ["a"], "history": ["b"]}).encode("utf-8"))
+        assert parse_code_changes(data) == {"current": ["a"], "history": ["b"]}
 
-    def test_parse_non_array_fields(self):
-        with pytest.raises(ValueError, match="必须是数组"):
-            parse_code_changes(json.dumps({"current": "string", "history": "string"}))
+    @pytest.mark.parametrize("parsed", [[1, 2], 3, None, 1.5])
+    def test_parse_non_object_parsed_value(self, parsed):
+        # 已解析的非对象值不能被当作JSON文本再解析，应给出明确的校验错误
+        with pytest.raises(ValueError, match="必须是对象"):
+            parse_code_changes(parsed)
 
-    def test_parse_non_object_root(self):
+    @pytest.mark.parametrize("parsed", [[1, 2], '{"current": [], "history": []}', 3])
+    def test_validate_parsed_non_object_root(self, parsed):
+        from services.diff_analyzer import validate_code_changes
+        # 根元素为字符串时也不会再次按JSON解码
         with pytest.raises(ValueError, match="必须是对象"):
-            parse_code_changes(json.dumps([1, 2, 3]))
+            validate_code_changes(parsed)
+
+    def test_analyze_non_object_parsed_value(self):
+        result = analyze_code_changes([1, 2])
+        assert result.error == "JSON根元素必须是对象"
+
+    @pytest.mark.parametrize("payload, expected", _BAD_PAYLOADS, ids=[
+        "invalid_json", "missing_fields", "non_array_fields", "non_object_root",
+    ])
+    def test_parse_invalid(self, payload, expected):
+        with pytest.raises(ValueError, match=expected):
+            parse_code_changes(payload)
 
 
 class TestExtractPackagePath:
@@ -78,9 +107,33 @@ class TestExtractPackagePath:
     def test_empty_code(self):
         assert extract_package_path("") == "unknown"
 
+    def test_package_word_mid_line_ignored(self):
+        code = "// moved from package com.old;\npackage com.example.user;\n"
+        assert extract_package_path(code) == "com.example.user"
+        assert extract_package_path("import some.package.name;") == "unknown"
+
+    def test_package_after_long_header(self):
+        header = "/*\n" + " * Copyright (c) example\n" * 200 + " */\n"
+        code = header + "package com.example.user;\r\npublic class Test {}"
+        assert extract_package_path(code) == "com.example.user"
+
+
+# 安装cdifflib时两种匹配器都跑一遍，确认C实现与标准库结果一致
+_MATCHERS = {"difflib": difflib.SequenceMatcher}
+if diff_analyzer.SequenceMatcher is not difflib.SequenceMatcher:
+    _MATCHERS["cdifflib"] = diff_analyzer.SequenceMatcher
+
 
+@pytest.fixture(params=sorted(_MATCHERS))
+def sequence_matcher(request, monkeypatch):
+    """切换 diff_analyzer 使用的 SequenceMatcher 实现"""
+    monkeypatch.setattr(diff_analyzer, "SequenceMatcher", _MATCHERS[request.param])
+    return request.param
+
+
+@pytest.mark.usefixtures("sequence_matcher")
 class TestComputeDiff:
-    """测试差异计算"""
+    """测试差异计算（对每种可用的 SequenceMatcher 实现分别运行）"""
 
     def test_identical_code(self):
         code = "package com.example;\npublic class A {}"
@@ -108,16 +161,64 @@ class TestComputeDiff:
         assert len(result.added_lines) > 0
         assert len(result.removed_lines) > 0
 
+    def test_lines_without_line_endings(self):
+        result = compute_diff("a\r\nc\r\n", "a\r\nb\r\n")
+        assert result.added_lines == ["c"]
+        assert result.removed_lines == ["b"]
+        assert "+c" in result.changed_lines
+
+    def test_line_ending_only_changes(self):
+        result = compute_diff("a\r\nb\r\n", "a\nb\n")
+        assert result.added_lines == ["a", "b"]
+        assert result.removed_lines == ["a", "b"]
+
+        result = compute_diff("a\nb", "a\nb\n")
+        assert result.added_lines == ["b"]
+        assert result.removed_lines == ["b"]
+
+    def test_changed_lines_rebuilt_in_order(self, simple_java_code, modified_java_code):
+        result = compute_diff(modified_java_code, simple_java_code)
+        expected = [
+            line for line in difflib.unified_diff(
+                simple_java_code.splitlines(),
+                modified_java_code.splitlines(),
+                fromfile="history",
+                tofile="current",
+                lineterm="",
+            )
+            if line[:1] in ("+", "-", "@")
+        ]
+        assert result.changed_lines == expected
+
+    def test_unified_diff_matches_difflib(self, simple_java_code, modified_java_code):
+        from services.diff_analyzer import _unified_diff
+
+        for old, new in [
+            (simple_java_code, modified_java_code),
+            (modified_java_code, simple_java_code),
+            ("", simple_java_code),
+            ("a\nb\nc\n", "a\nb\nc\n"),
+        ]:
+            a = old.splitlines(keepends=True)
+            b = new.splitlines(keepends=True)
+            expected = list(difflib.unified_diff(a, b, fromfile="history", tofile="current", lineterm=""))
+            assert list(_unified_diff(a, b, fromfile="history", tofile="current")) == expected
+
 
 class TestAnalyzeCodeChanges:
     """测试完整分析流程"""
 
-    def test_analyze_sample(self, sample_code_changes_json):
-        result = analyze_code_changes(sample_code_changes_json)
+    def test_analyze_sample(self, analyzed_sample):
+        result = analyzed_sample
         assert result.error is None
         assert len(result.diffs) == 2
         assert result.total_added > 0
 
+    def test_analyze_parsed_dict(self, sample_code_changes_dict):
+        result = analyze_code_changes(sample_code_changes_dict)
+        assert result.error is None
+        assert len(result.diffs) == 2
+
     def test_analyze_invalid_json(self):
         result = analyze_code_changes("invalid json")
         assert result.error is not None
@@ -137,18 +238,47 @@ class TestAnalyzeCodeChanges:
         assert result.error is None
         assert len(result.diffs) == 2
 
+    def test_analyze_with_executor(self, simple_java_code, modified_java_code):
+        from concurrent.futures import ProcessPoolExecutor
+
+        data = {
+            "current": [modified_java_code, simple_java_code] * 3,
+            "history": [simple_java_code, modified_java_code] * 3,
+        }
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            parallel = analyze_code_changes(data, executor=executor)
+        assert parallel == analyze_code_changes(data)
+
+
+# format_diff_summary 只读结果，错误结果在模块内共用
+_ERROR_RESULT = AnalysisResult(error="测试错误")
+
 
 class TestFormatDiffSummary:
     """测试摘要格式化"""
 
-    def test_format_normal(self, sample_code_changes_json):
-        result = analyze_code_changes(sample_code_changes_json)
-        summary = format_diff_summary(result)
+    def test_format_normal(self, analyzed_sample):
+        summary = format_diff_summary(analyzed_sample)
         assert "共检测到" in summary
         assert "总新增" in summary
 
     def test_format_error(self):
-        from services.diff_analyzer import AnalysisResult
-        result = AnalysisResult(error="测试错误")
-        summary = format_diff_summary(result)
+        summary = format_diff_summary(_ERROR_RESULT)
         assert "分析错误" in summary
+
+    def test_format_layout(self):
+        result = analyze_code_changes(json.dumps({
+            "current": ["package com.a;\nint x = 2;\n"],
+            "history": ["package com.a;\nint x = 1;\n"],
+        }))
+        assert format_diff_summary(result) == (
+            "共检测到 1 个代码文件变更\n"
+            "总新增 1 行，总删除 1 行\n"
+            "\n"
+            "### 文件 1: com.a\n"
+            "  新增 1 行, 删除 1 行\n"
+            "  新增内容:\n"
+            "    + int x = 2;\n"
+            "  删除内容:\n"
+            "    - int x = 1;\n"
+        )
@@ -2,16 +2,23 @@
 test_file_upload.py - 文件上传和解析测试
 """
 
+import csv
+import io
 import json
 
 import pytest
 
+from services import file_parser
 from services.file_parser import (
     parse_csv,
+    parse_csv_stream,
     parse_excel,
+    iter_csv,
+    iter_excel,
     parse_json,
     detect_file_type,
     validate_file,
+    validate_and_parse,
 )
 
 
@@ -23,15 +30,57 @@ class TestParseCSV:
         assert len(rows) > 0
         assert "包名" in rows[0]
 
-    def test_parse_bytes_utf8(self, sample_mapping_csv):
-        content = sample_mapping_csv.encode("utf-8")
-        rows = parse_csv(content)
+    def test_parse_bytes_utf8(self, sample_mapping_csv_utf8):
+        rows = parse_csv(sample_mapping_csv_utf8)
         assert len(rows) > 0
 
-    def test_parse_bytes_utf8_bom(self, sample_mapping_csv):
-        content = b"\xef\xbb\xbf" + sample_mapping_csv.encode("utf-8")
-        rows = parse_csv(content)
-        assert len(rows) > 0
+    def test_parse_bytes_utf8_bom(self, sample_mapping_csv, sample_mapping_csv_utf8_bom):
+        rows = parse_csv(sample_mapping_csv_utf8_bom)
+        assert rows == parse_csv(sample_mapping_csv)
+        assert "包名" in rows[0]  # BOM不残留在第一个表头中
+
+    @pytest.mark.parametrize("encoding", ["utf-8", "utf-16-le", "utf-16-be"])
+    def test_bom_stripped_from_header(self, sample_mapping_csv, encoding):
+        content = ("\ufeff" + sample_mapping_csv).encode(encoding)
+        assert parse_csv(content) == parse_csv(sample_mapping_csv)
+        assert list(iter_csv(content)) == parse_csv(sample_mapping_csv)
+
+    def test_parse_file_object(self, sample_mapping_csv, sample_mapping_csv_utf8):
+        stream = io.BytesIO(sample_mapping_csv_utf8)
+        rows = parse_csv(stream)
+        assert rows == parse_csv(sample_mapping_csv)
+
+    def test_parse_bytes_gbk(self, sample_mapping_csv):
+        rows = parse_csv(sample_mapping_csv.encode("gbk"))
+        assert rows == parse_csv(sample_mapping_csv)
+
+    def test_parse_undecodable_bytes(self):
+        with pytest.raises(ValueError, match="无法识别CSV文件编码"):
+            parse_csv(b"a,b\n\xff\xff\xff,1\n")
+
+    def test_matches_dict_reader(self):
+        content = "a,b,c\n1,2,3\n\n4,5\n6,7,8,9\n"
+        expected = list(csv.DictReader(io.StringIO(content)))
+        assert parse_csv(content) == expected
+
+    def test_parse_spooled_file(self, sample_mapping_csv, sample_mapping_csv_utf8):
+        import tempfile
+        with tempfile.SpooledTemporaryFile() as stream:
+            stream.write(sample_mapping_csv_utf8)
+            rows = parse_csv_stream(stream)
+            assert not stream.closed  # 不关闭调用方的文件
+        assert rows == parse_csv(sample_mapping_csv)
+
+    def test_stream_falls_back_to_gbk_mid_file(self):
+        # 非UTF-8字节出现在首个解码块之后，需回到开头改用gbk
+        content = "名称,描述\n" + "a,b\n" * 5000 + "中文,描述\n"
+        rows = parse_csv_stream(io.BytesIO(content.encode("gbk")))
+        assert len(rows) == 5001
+        assert rows[-1] == {"名称": "中文", "描述": "描述"}
+
+    def test_parse_blank_bytes(self):
+        with pytest.raises(ValueError, match="内容为空"):
+            parse_csv(b" \n\n")
 
     def test_parse_empty_csv(self):
         with pytest.raises(ValueError, match="内容为空"):
@@ -42,76 +91,327 @@ class TestParseCSV:
             parse_csv("col1,col2,col3\n")
 
 
+@pytest.mark.skipif(file_parser.pyarrow_csv is None, reason="pyarrow未安装")
+class TestIterCSV:
+    """测试CSV逐行解析"""
+
+    @pytest.mark.parametrize("content", [
+        "a,b\n1,2\n\n3\n4,5,6\n",
+        "测试功能,预期结果\n登录,成功\n".encode("gbk"),
+        "\ufeffa,b\n1,2\n".encode("utf-8"),
+    ])
+    def test_matches_parse_csv(self, content):
+        assert list(iter_csv(content)) == parse_csv(content)
+
+    def test_lazy_file_object(self):
+        fileobj = io.BytesIO(b"a,b\n1,2\n3,4\n")
+        rows = iter_csv(fileobj)
+        assert next(rows) == {"a": "1", "b": "2"}
+        rows.close()
+        # 生成器关闭后不关闭底层文件
+        assert not fileobj.closed
+
+    @pytest.mark.parametrize("content, message", [
+        (b"", "内容为空"),
+        ("a,b\n", "没有数据行"),
+    ])
+    def test_empty_raises(self, content, message):
+        with pytest.raises(ValueError, match=message):
+            list(iter_csv(content))
+
+    def test_undecodable_raises(self):
+        with pytest.raises(ValueError, match="编码"):
+            list(iter_csv(b"a,b\n\x81\xff,1\n"))
+
+
+class TestParseCSVPyarrow:
+    """测试pyarrow解析路径与csv模块结果一致"""
+
+    @pytest.fixture(autouse=True)
+    def _always_pyarrow(self, monkeypatch):
+        monkeypatch.setattr(file_parser, "PYARROW_CSV_MIN_BYTES", 0)
+
+    @pytest.mark.parametrize("content", [
+        "包名,类名,方法名\ncom.a,Svc,save\n\ncom.b,,\n",
+        'a,b\r\n"x\ny",2\r\n"q""uote",\r\n',
+        "a,b,c\n1,2,3\n4,5\n6,7,8,9\n",   # 列数不齐时回退
+        "a,a\n1,2\n",                       # 表头重名时回退
+    ])
+    def test_matches_dict_reader(self, content):
+        expected = list(csv.DictReader(io.StringIO(content)))
+        assert parse_csv(content) == expected
+
+    def test_bom_bytes(self, sample_mapping_csv, sample_mapping_csv_utf8_bom):
+        # 跳过BOM后的内容同样走pyarrow解析
+        assert parse_csv(sample_mapping_csv_utf8_bom) == parse_csv(sample_mapping_csv)
+
+    def test_fast_path_used(self):
+        assert file_parser._pyarrow_csv_rows("a,b\n1,\n") == [{"a": "1", "b": ""}]
+        assert file_parser._pyarrow_csv_rows("a,b\n1,2,3\n") is None
+
+    @pytest.mark.parametrize("content, encoding", [
+        ("包名,类名\r\ncom.a,Svc\r\n\ncom.b,\n", "utf-8"),
+        ("测试功能,预期结果\n登录,成功\n", "gbk"),
+        ("a,b,c\n1,2,3\n4,5\n", "utf-8"),   # 列数不齐时回退
+    ])
+    def test_stream_matches_dict_reader(self, content, encoding):
+        import tempfile
+        expected = list(csv.DictReader(io.StringIO(content)))
+        with tempfile.SpooledTemporaryFile() as stream:
+            stream.write(content.encode(encoding))
+            assert parse_csv_stream(stream) == expected
+            assert not stream.closed
+
+    @pytest.mark.skipif(file_parser.pyarrow_csv is None, reason="pyarrow未安装")
+    def test_stream_passed_to_pyarrow(self, monkeypatch, sample_mapping_csv, sample_mapping_csv_utf8_bom):
+        expected = parse_csv(sample_mapping_csv)
+
+        def text_path(reader):
+            raise AssertionError("不应走csv模块解析")
+
+        monkeypatch.setattr(file_parser, "_csv_rows_to_dicts", text_path)
+        assert parse_csv_stream(io.BytesIO(sample_mapping_csv_utf8_bom)) == expected
+
+
 class TestParseJSON:
     """测试JSON解析"""
 
     def test_parse_normal_json(self, sample_code_changes_json):
         result = parse_json(sample_code_changes_json)
-        assert isinstance(result, dict)
         assert "success" in result
 
     def test_parse_bytes(self, sample_code_changes_json):
         content = sample_code_changes_json.encode("utf-8")
         result = parse_json(content)
-        assert isinstance(result, dict)
+        assert "success" in result
+
+    @pytest.mark.parametrize("use_orjson", [True, False])
+    def test_result_read_only(self, monkeypatch, sample_code_changes_json, use_orjson):
+        from services.diff_analyzer import parse_code_changes
+        if not use_orjson:
+            monkeypatch.setattr(file_parser, "orjson", None)
+        result = parse_json(sample_code_changes_json.encode("utf-8"))
+        with pytest.raises(TypeError):
+            result["success"] = False
+        # 只读映射可直接交给 parse_code_changes
+        assert parse_code_changes(result) == parse_code_changes(sample_code_changes_json)
+
+    def test_non_object_root_unchanged(self):
+        assert parse_json("[1, 2]") == [1, 2]
+
+    def test_parse_file_object(self, sample_code_changes_json):
+        stream = io.BytesIO(sample_code_changes_json.encode("utf-8"))
+        result = parse_json(stream)
+        assert result == json.loads(sample_code_changes_json)
+
+    def test_parse_bytes_with_bom(self):
+        assert parse_json(b"\xef\xbb\xbf" + '{"键": 1}'.encode("utf-8")) == {"键": 1}
+
+    def test_parse_bytes_with_bom_without_orjson(self, monkeypatch):
+        monkeypatch.setattr(file_parser, "orjson", None)
+        assert parse_json(b"\xef\xbb\xbf" + '{"键": 1}'.encode("utf-8")) == {"键": 1}
+
+    def test_parse_utf16_with_bom(self):
+        assert parse_json('{"键": 1}'.encode("utf-16")) == {"键": 1}
 
     def test_parse_empty(self):
         with pytest.raises(ValueError, match="内容为空"):
             parse_json("")
 
+    def test_parse_blank_bytes(self):
+        with pytest.raises(ValueError, match="内容为空"):
+            parse_json(b"  \n")
+
+    def test_parse_invalid_bytes(self):
+        with pytest.raises(ValueError, match="JSON格式无效"):
+            parse_json(b"{invalid json")
+
     def test_parse_invalid(self):
         with pytest.raises(ValueError, match="JSON格式无效"):
             parse_json("{invalid json")
 
 
-class TestDetectFileType:
-    """测试文件类型检测"""
-
-    def test_csv(self):
-        assert detect_file_type("test.csv") == "csv"
-
-    def test_excel_xlsx(self):
-        assert detect_file_type("test.xlsx") == "excel"
-
-    def test_excel_xls(self):
-        assert detect_file_type("test.xls") == "excel"
+class TestParseExcel:
+    """测试Excel解析"""
+
+    @staticmethod
+    def _build_xlsx() -> bytes:
+        from openpyxl import Workbook
+        wb = Workbook()
+        ws = wb.active
+        ws.append(["测试用例ID", "测试功能", "测试步骤", "预期结果"])
+        ws.append(["TC001", "创建用户", "1. 输入用户名", "创建成功"])
+        ws.append([None, None, None, None])
+        ws.append([2, "删除用户", "1. 点击删除", "删除成功"])
+        buf = io.BytesIO()
+        wb.save(buf)
+        return buf.getvalue()
+
+    def test_parse_bytes(self):
+        rows = parse_excel(self._build_xlsx())
+        assert len(rows) == 2  # 全空行被跳过
+        assert rows[0]["测试功能"] == "创建用户"
+        assert rows[1]["测试用例ID"] == "2"
+
+    def test_parse_file_object(self):
+        content = self._build_xlsx()
+        assert parse_excel(io.BytesIO(content)) == parse_excel(content)
+
+    def test_unnamed_header_columns(self):
+        from openpyxl import Workbook
+        wb = Workbook()
+        ws = wb.active
+        ws.append(["测试用例ID", "测试功能"])
+        ws.append(["TC001", " 创建 ", "多余列"])
+        ws.append([None, None, "只有多余列"])
+        buf = io.BytesIO()
+        wb.save(buf)
+        # 表头行按工作表宽度补齐，无标题的列命名为 col_N
+        assert parse_excel(buf.getvalue()) == [
+            {"测试用例ID": "TC001", "测试功能": "创建", "col_2": "多余列"},
+            {"测试用例ID": "", "测试功能": "", "col_2": "只有多余列"},
+        ]
+
+    @pytest.mark.parametrize("use_calamine", [True, False])
+    def test_iter_matches_parse(self, monkeypatch, use_calamine):
+        if not use_calamine:
+            monkeypatch.setattr(file_parser, "CalamineWorkbook", None)
+        content = self._build_xlsx()
+        assert list(iter_excel(content)) == parse_excel(content)
+
+    def test_blank_rows_skipped_before_building_dict(self):
+        from services.file_parser import _iter_excel_dicts
+        rows = iter([
+            ("a", "b"),
+            (None, "  "),
+            ("", None, "超出表头"),
+            (0, None),
+        ])
+        assert list(_iter_excel_dicts(rows)) == [{"a": "0", "b": ""}]
+
+    def test_formula_reads_value_not_text(self):
+        from openpyxl import Workbook
+        wb = Workbook()
+        ws = wb.active
+        ws.append(["测试用例ID", "测试功能"])
+        ws.append(["TC001", "=A2"])
+        buf = io.BytesIO()
+        wb.save(buf)
+        # openpyxl 不计算公式，未缓存结果的公式单元格读为空
+        rows = parse_excel(buf.getvalue())
+        assert rows[0]["测试功能"] == ""
+
+
+@pytest.mark.skipif(file_parser.CalamineWorkbook is None, reason="python-calamine未安装")
+class TestParseExcelCalamine:
+    """测试calamine解析路径与openpyxl结果一致"""
+
+    @staticmethod
+    def _build_xlsx(active_index: int = 0) -> bytes:
+        import datetime
+        from openpyxl import Workbook
+        wb = Workbook()
+        notes = wb.active
+        notes.title = "说明"
+        notes.append(["说明"])
+        notes.append(["请勿修改"])
+        ws = wb.create_sheet("用例")
+        ws.append(["测试用例ID", "测试功能", None, "日期"])
+        ws.append([1, "创建用户", 1.5, datetime.datetime(2024, 1, 2)])
+        ws.append([None, None, None, None])
+        ws.append([True, " 删除 ", None, datetime.datetime(2024, 1, 2, 8, 30)])
+        wb.active = active_index
+        buf = io.BytesIO()
+        wb.save(buf)
+        return buf.getvalue()
+
+    @pytest.mark.parametrize("active_index", [0, 1])
+    def test_matches_openpyxl(self, monkeypatch, active_index):
+        content = self._build_xlsx(active_index)
+        rows = parse_excel(content)
+        monkeypatch.setattr(file_parser, "CalamineWorkbook", None)
+        assert rows == parse_excel(content)
+
+    def test_reads_active_sheet(self):
+        rows = parse_excel(self._build_xlsx(active_index=1))
+        assert rows[0] == {"测试用例ID": "1", "测试功能": "创建用户", "col_2": "1.5", "日期": "2024-01-02 00:00:00"}
+        assert rows[1]["测试用例ID"] == "True"
+
+    def test_invalid_content_raises(self):
+        with pytest.raises(ValueError, match="格式无效"):
+            parse_excel(b"not an excel file")
 
-    def test_json(self):
-        assert detect_file_type("data.json") == "json"
 
-    def test_unknown(self):
-        assert detect_file_type("file.txt") == "unknown"
+class TestDetectFileType:
+    """测试文件类型检测"""
 
-    def test_case_insensitive(self):
-        assert detect_file_type("TEST.CSV") == "csv"
-        assert detect_file_type("DATA.JSON") == "json"
+    @pytest.mark.parametrize("filename, expected", [
+        ("test.csv", "csv"),
+        ("test.xlsx", "excel"),
+        ("test.xls", "excel"),
+        ("data.json", "json"),
+        ("file.txt", "unknown"),
+        # 大小写不敏感
+        ("TEST.CSV", "csv"),
+        ("DATA.JSON", "json"),
+        # 只看最后一个扩展名
+        ("report.csv.txt", "unknown"),
+        ("archive.tar.json", "json"),
+        (".csv", "csv"),
+        ("csv", "unknown"),
+    ])
+    def test_detect(self, filename, expected):
+        assert detect_file_type(filename) == expected
+
+
+# 11MB，超过10MB上限；validate_file 只看大小，模块内共用一份零填充缓冲区
+_LARGE_CONTENT = bytes(11 * 1024 * 1024)
 
 
 class TestValidateFile:
     """测试文件校验"""
 
-    def test_valid_csv(self):
-        err = validate_file("test.csv", b"content", ["csv"])
-        assert err == ""
+    @pytest.mark.parametrize("filename, content, allowed_types, expected", [
+        ("test.csv", b"content", ["csv"], ""),
+        ("data.json", b"content", ["json"], ""),
+        ("test.csv", b"x" * 1024, ["csv"], ""),
+        ("file.txt", b"content", ["csv", "json"], "不支持"),
+        # 类型正确但该接口不接受
+        ("test.csv", b"content", ["json"], "不支持"),
+        ("test.csv", _LARGE_CONTENT, ["csv"], "过大"),
+        # 大小先于类型检查
+        ("file.txt", _LARGE_CONTENT, ["csv"], "过大"),
+    ], ids=lambda v: f"{len(v)}B" if isinstance(v, bytes) else None)
+    def test_validate(self, filename, content, allowed_types, expected):
+        err = validate_file(filename, content, allowed_types, max_size_mb=10.0)
+        if expected:
+            assert expected in err
+        else:
+            assert err == ""
+
+    def test_file_object_size(self):
+        stream = io.BytesIO(_LARGE_CONTENT)
+        stream.seek(5)
+        err = validate_file("test.csv", stream, ["csv"], max_size_mb=10.0)
+        assert "过大" in err
+        assert stream.tell() == 5  # 不移动读取位置
 
-    def test_valid_json(self):
-        err = validate_file("data.json", b"content", ["json"])
-        assert err == ""
 
-    def test_unsupported_type(self):
-        err = validate_file("file.txt", b"content", ["csv", "json"])
-        assert "不支持" in err
+class TestValidateAndParse:
+    """测试校验并解析"""
 
-    def test_wrong_type_for_endpoint(self):
-        err = validate_file("test.csv", b"content", ["json"])
-        assert "不支持" in err
+    def test_parse_csv(self, sample_mapping_csv, sample_mapping_csv_utf8):
+        file_type, rows = validate_and_parse(
+            "mapping.csv", io.BytesIO(sample_mapping_csv_utf8), ["csv"]
+        )
+        assert file_type == "csv"
+        assert rows == parse_csv(sample_mapping_csv)
 
-    def test_file_too_large(self):
-        large_content = b"x" * (11 * 1024 * 1024)  # 11MB
-        err = validate_file("test.csv", large_content, ["csv"], max_size_mb=10.0)
-        assert "过大" in err
+    def test_parse_json(self, sample_code_changes_json):
+        file_type, data = validate_and_parse("code.json", sample_code_changes_json.encode("utf-8"), ["json"])
+        assert file_type == "json"
+        assert data == json.loads(sample_code_changes_json)
 
-    def test_file_within_size(self):
-        content = b"x" * 1024  # 1KB
-        err = validate_file("test.csv", content, ["csv"], max_size_mb=10.0)
-        assert err == ""
+    def test_invalid_type_raises(self):
+        with pytest.raises(ValueError, match="不支持"):
+            validate_and_parse("test.csv", b"a,b\n1,2\n", ["json"])
@@ -11,30 +11,28 @@ from services.scoring_model import (
     score_boundary,
     calculate_score,
     WEIGHTS,
+    _count_steps,
 )
 
 
 class TestScoreCoverage:
     """测试覆盖范围评分"""
 
-    def test_full_coverage(self):
+    @pytest.mark.parametrize("total, covered, expected", [
+        (5, 5, 100.0),
+        (5, 0, 0.0),
+        (10, 7, 70.0),
+        (0, 0, 100.0),  # 无改动满分
+    ])
+    def test_score(self, total, covered, expected):
+        dim = score_coverage(total_changed_methods=total, covered_count=covered)
+        assert dim.score == pytest.approx(expected)
+
+    def test_dimension_metadata(self):
         dim = score_coverage(total_changed_methods=5, covered_count=5)
-        assert dim.score == 100.0
         assert dim.dimension == "覆盖范围"
         assert dim.weight == WEIGHTS["coverage"]
 
-    def test_zero_coverage(self):
-        dim = score_coverage(total_changed_methods=5, covered_count=0)
-        assert dim.score == 0.0
-
-    def test_partial_coverage(self):
-        dim = score_coverage(total_changed_methods=10, covered_count=7)
-        assert dim.score == 70.0
-
-    def test_no_changes(self):
-        dim = score_coverage(total_changed_methods=0, covered_count=0)
-        assert dim.score == 100.0  # 无改动满分
-
     def test_weighted_score(self):
         dim = score_coverage(total_changed_methods=10, covered_count=5)
         assert dim.weighted_score == pytest.approx(50.0 * WEIGHTS["coverage"], abs=0.1)
@@ -50,15 +48,12 @@ class TestScoreCompleteness:
         dim = score_completeness(cases)
         assert dim.score > 50  # 有步骤+有编号+有动词
 
-    def test_empty_steps(self):
-        cases = [{"测试步骤": ""}]
-        dim = score_completeness(cases)
-        assert dim.score == 0.0
+    @pytest.mark.parametrize("cases", [[{"测试步骤": ""}], []], ids=["empty_steps", "no_cases"])
+    def test_zero_score(self, cases):
+        assert score_completeness(cases).score == 0.0
 
-    def test_no_cases(self):
-        dim = score_completeness([])
-        assert dim.score == 0.0
-        assert "无测试用例" in dim.details
+    def test_no_cases_details(self):
+        assert "无测试用例" in score_completeness([]).details
 
     def test_multiple_cases_average(self):
         cases = [
@@ -78,14 +73,9 @@ class TestScoreClarity:
         dim = score_clarity(cases)
         assert dim.score > 50
 
-    def test_empty_expectation(self):
-        cases = [{"预期结果": ""}]
-        dim = score_clarity(cases)
-        assert dim.score == 0.0
-
-    def test_no_cases(self):
-        dim = score_clarity([])
-        assert dim.score == 0.0
+    @pytest.mark.parametrize("cases", [[{"预期结果": ""}], []], ids=["empty_expectation", "no_cases"])
+    def test_zero_score(self, cases):
+        assert score_clarity(cases).score == 0.0
 
     def test_vague_expectation(self):
         cases = [{"预期结果": "ok"}]
@@ -117,29 +107,88 @@ class TestScoreBoundary:
         assert dim.score == 0.0
 
     def test_high_ratio(self):
-        cases = [
-            {"测试功能": f"测试{i}", "测试步骤": "步骤", "预期结果": "结果"}
-            for i in range(10)
-        ]
+        # score_boundary 只读用例，同一个字典重复10次即可
+        cases = [{"测试功能": "测试", "测试步骤": "步骤", "预期结果": "结果"}] * 10
         dim = score_boundary(cases, total_changed_methods=2)
         assert dim.score > 0  # 用例/方法比 = 5:1
 
 
+class TestKeywordPatterns:
+    """测试关键词正则与逐词判断结果一致"""
+
+    def test_verify_distinct_count(self):
+        import itertools
+        from services.scoring_model import _VERIFY_RE, _VERIFY_WORDS
+
+        texts = ["".join(p) for p in itertools.permutations(_VERIFY_WORDS[:5], 3)]
+        texts += ["成功成功", "提示错误并显示不为空", "无关键词", "返回正确结果，跳转存在"]
+        for text in texts:
+            expected = sum(1 for w in _VERIFY_WORDS if w in text)
+            assert len(set(_VERIFY_RE.findall(text))) == expected, text
+
+    def test_boundary_search(self):
+        from services.scoring_model import _BOUNDARY_WORDS, _is_boundary_case
+
+        texts = ["输入NULL值", "输入null值", "用户名为空", "正常登录", "特殊字符校验", "请求超时", "空"]
+        texts += list(_BOUNDARY_WORDS)
+        for text in texts:
+            expected = any(w in text for w in _BOUNDARY_WORDS)
+            assert _is_boundary_case(text, "", "") == expected, text
+            assert _is_boundary_case("", "步骤", text) == expected, text
+
+    def test_boundary_none_fields(self):
+        from services.scoring_model import _is_boundary_case
+
+        assert _is_boundary_case(None, None, None) is False
+        assert _is_boundary_case(None, "输入为空", None) is True
+
+
+class TestCountSteps:
+    """测试步骤计数"""
+
+    def test_numbered_steps(self):
+        assert _count_steps("1. 输入 2、点击 3) 提交") == 3
+
+    def test_step_prefix_takes_larger_count(self):
+        assert _count_steps("步骤1 输入 步骤2 点击 3. 提交") == 2
+
+    def test_split_by_newline_and_semicolon(self):
+        assert _count_steps("打开页面\n输入数据；提交;  \n\n确认") == 4
+
+    def test_blank_text(self):
+        assert _count_steps(" \n ") == 0
+
+
+# calculate_score 只读用例字典，模块级常量可在测试间共用
+_PERFECT_CASES = [
+    {
+        "测试步骤": "1. 输入数据 2. 点击创建 3. 验证结果",
+        "预期结果": "创建成功，返回正确的ID",
+        "测试功能": "空值边界测试",
+    },
+]
+
+_SIMPLE_CASES = [
+    {"测试步骤": "1. 操作", "预期结果": "成功", "测试功能": "测试"},
+]
+
+_GRADE_A_CASES = [
+    {
+        "测试步骤": "1. 输入数据 2. 点击提交 3. 验证返回值",
+        "预期结果": "操作成功，返回正确结果，页面跳转到列表",
+        "测试功能": "异常边界-空值处理",
+    }
+] * 10
+
+
 class TestCalculateScore:
     """测试综合评分"""
 
     def test_perfect_score(self):
-        cases = [
-            {
-                "测试步骤": "1. 输入数据 2. 点击创建 3. 验证结果",
-                "预期结果": "创建成功，返回正确的ID",
-                "测试功能": "空值边界测试",
-            },
-        ]
         result = calculate_score(
             total_changed_methods=1,
             covered_count=1,
-            test_cases=cases,
+            test_cases=_PERFECT_CASES,
         )
         assert result.total_score > 0
         assert result.grade in ["A", "B", "C", "D", "F"]
@@ -158,30 +207,65 @@ class TestCalculateScore:
         total_weight = sum(WEIGHTS.values())
         assert total_weight == pytest.approx(1.0, abs=0.001)
 
-    def test_score_range(self):
+    def test_fused_matches_individual_scorers(self):
         cases = [
-            {"测试步骤": "1. 操作", "预期结果": "成功", "测试功能": "测试"},
+            {"测试步骤": "1. 输入 2. 点击", "预期结果": "显示成功提示", "测试功能": "登录"},
+            {"test_steps": "打开页面", "expected_result": "失败", "test_function": "异常-空密码"},
+            {"测试功能": "null校验"},
+        ]
+        result = calculate_score(total_changed_methods=2, covered_count=1, test_cases=cases)
+        assert result.dimensions[1:] == [
+            score_completeness(cases),
+            score_clarity(cases),
+            score_boundary(cases, 2),
+        ]
+
+    def test_accepts_generator(self):
+        rows = [
+            {"测试步骤": "1. 输入 2. 点击", "预期结果": "显示成功提示", "测试功能": "登录"},
+            {"测试步骤": "打开页面", "预期结果": "失败", "测试功能": "异常-空密码"},
         ]
+        result = calculate_score(total_changed_methods=2, covered_count=1, test_cases=iter(rows))
+        assert result == calculate_score(total_changed_methods=2, covered_count=1, test_cases=rows)
+        assert score_completeness(iter(rows)) == score_completeness(rows)
+        assert score_clarity(iter(rows)) == score_clarity(rows)
+        assert score_boundary(iter(rows), 2) == score_boundary(rows, 2)
+        assert score_completeness(iter([])).score == 0.0
+
+    def test_total_summed_in_hundredths(self, monkeypatch):
+        import services.scoring_model as scoring
+        from services.scoring_model import DimensionScore
+
+        def dim(weighted):
+            return DimensionScore(dimension="", score=0.0, weight=0.0, weighted_score=weighted, details="")
+
+        monkeypatch.setattr(scoring, "score_coverage", lambda *_: dim(8.45))
+        monkeypatch.setattr(scoring, "_score_case_dimensions", lambda *_: (dim(0.1), dim(0.1), dim(0.0)))
+        # 浮点求和为 8.649999999999999（会舍入为 8.6）；按整数求和得到精确的 8.65，四舍五入到 8.7
+        assert calculate_score(1, 1, []).total_score == 8.7
+
+    def test_repeated_cases_scored_once(self):
+        from services.scoring_model import _completeness_case_score
+        _completeness_case_score.cache_clear()
+        cases = [{"测试步骤": "1. 输入 2. 提交 3. 确认", "预期结果": "提交成功"}] * 50
+        calculate_score(total_changed_methods=1, covered_count=1, test_cases=cases)
+        info = _completeness_case_score.cache_info()
+        assert info.misses == 1
+        assert info.hits == 49
+
+    def test_score_range(self):
         result = calculate_score(
             total_changed_methods=3,
             covered_count=1,
-            test_cases=cases,
+            test_cases=_SIMPLE_CASES,
         )
         assert 0 <= result.total_score <= 100
 
     def test_grade_A(self):
         # 构造高分场景
-        cases = [
-            {
-                "测试步骤": "1. 输入数据 2. 点击提交 3. 验证返回值",
-                "预期结果": "操作成功，返回正确结果，页面跳转到列表",
-                "测试功能": "异常边界-空值处理",
-            }
-            for _ in range(10)
-        ]
         result = calculate_score(
             total_changed_methods=3,
             covered_count=3,
-            test_cases=cases,
+            test_cases=_GRADE_A_CASES,
         )
         assert result.grade in ["A", "B"]  # 应该得高分